@@ -56,8 +56,33 @@ class Config:
             
     @property
     def database_url(self) -> str:
-        """获取数据库URL"""
-        return self.get('database.url')
+        """获取数据库URL,环境变量DATABASE_URL优先"""
+        return os.environ.get('DATABASE_URL') or self.get('database.url')
+
+    @property
+    def database_kline_batch_size(self) -> int:
+        """获取K线批量upsert时每次executemany的行数"""
+        return max(1, self.get('database.kline_batch_size', 1000))
+
+    @property
+    def database_kline_store(self) -> Dict[str, Any]:
+        """获取K线存储设置(backend: sql或columnar, directory)"""
+        return self.get('database.kline_store', {})
+
+    @property
+    def database_sqlite(self) -> Dict[str, Any]:
+        """获取SQLite连接参数,enabled为false时只设置busy_timeout(等待写锁),不应用其他性能参数"""
+        return self.get('database.sqlite', {})
+
+    @property
+    def database_ingest(self) -> Dict[str, Any]:
+        """获取写入缓冲设置(max_batch、max_delay、max_buffered_mb)"""
+        return self.get('database.ingest', {})
+
+    @property
+    def database_timeout(self) -> float:
+        """获取SQLite等待写锁的超时时间(秒),多个进程同时写库时使用"""
+        return self.get('database.timeout', 30)
         
     @property
     def cors_origins(self) -> list:
@@ -89,6 +114,111 @@ class Config:
         """获取可用角色列表"""
         return self.get('available_roles', [])
 
+    @property
+    def crawler_timeout(self) -> int:
+        """获取爬虫请求超时时间(秒)"""
+        return self.get('crawler.timeout', 30)
+
+    @property
+    def crawler_user_agent(self) -> Optional[str]:
+        """获取爬虫User-Agent"""
+        return self.get('crawler.user_agent')
+
+    @property
+    def crawler_concurrency(self) -> int:
+        """获取爬虫并发工作协程数"""
+        return self.get('crawler.concurrency', 4)
+
+    @property
+    def crawler_per_host_limit(self) -> int:
+        """获取单个主机的最大并发请求数"""
+        return self.get('crawler.per_host_limit', 4)
+
+    @property
+    def crawler_per_host_rate(self) -> float:
+        """获取单个主机每秒最多发起的请求数,0表示不限制"""
+        return self.get('crawler.per_host_rate', 5)
+
+    @property
+    def crawler_incremental(self) -> bool:
+        """是否增量同步K线数据"""
+        return self.get('crawler.incremental', True)
+
+    @property
+    def crawler_endpoints(self) -> Dict[str, str]:
+        """获取爬虫数据源地址覆盖"""
+        return self.get('crawler.endpoints', {})
+
+    @property
+    def crawler_list_page_size(self) -> int:
+        """获取股票列表分页大小"""
+        return self.get('crawler.list_page_size', 500)
+
+    @property
+    def crawler_quote_batch_size(self) -> int:
+        """获取批量行情请求每次携带的股票数量"""
+        return self.get('crawler.quote_batch_size', 200)
+
+    @property
+    def crawler_mode(self) -> str:
+        """获取爬取模式: concurrent、pipeline或sharded"""
+        return self.get('crawler.mode', 'concurrent')
+
+    @property
+    def crawler_pipeline(self) -> Dict[str, Any]:
+        """获取流水线模式设置"""
+        return self.get('crawler.pipeline', {})
+
+    @property
+    def crawler_sharded(self) -> Dict[str, Any]:
+        """获取多进程分片模式设置(processes、worker_mode)"""
+        return self.get('crawler.sharded', {})
+
+    @property
+    def crawler_cache(self) -> Dict[str, Any]:
+        """获取HTTP响应缓存设置"""
+        return self.get('crawler.cache', {})
+
+    @property
+    def crawler_retry(self) -> Dict[str, Any]:
+        """获取请求重试设置"""
+        return self.get('crawler.retry', {})
+
+    @property
+    def crawler_circuit_breaker(self) -> Dict[str, Any]:
+        """获取主机熔断器设置"""
+        return self.get('crawler.circuit_breaker', {})
+
+    @property
+    def crawler_resume_fresh_hours(self) -> float:
+        """续跑任务时,完成时间在该小时数内的股票视为数据新鲜而跳过"""
+        return self.get('crawler.resume_fresh_hours', 12)
+
+    @property
+    def crawler_pool(self) -> Dict[str, Any]:
+        """获取爬虫HTTP连接池设置"""
+        return self.get('crawler.pool', {})
+
+    @property
+    def crawler_refresh_cooldown(self) -> float:
+        """单支股票刷新完成后,相同刷新请求直接复用结果的时间(秒)"""
+        return self.get('crawler.refresh_cooldown', 10)
+
+    @property
+    def crawler_backfill(self) -> Dict[str, Any]:
+        """获取历史K线回填设置(concurrency、chunk_days)"""
+        return self.get('crawler.backfill', {})
+
+    @property
+    def crawler_scheduler(self) -> Dict[str, Any]:
+        """获取陈旧度优先调度器设置"""
+        return self.get('crawler.scheduler', {})
+
+    @property
+    def crawler_intraday(self) -> Dict[str, Any]:
+        """获取盘中分钟线轮询设置(enabled、watchlist、interval、delay)"""
+        return self.get('crawler.intraday', {})
+
 
 # 创建单例实例
 config = Config()
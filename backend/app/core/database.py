@@ -1,25 +1,123 @@
 """
 数据库连接模块
 """
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import logging
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import sessionmaker
 
 from .config import config
 
+# 配置日志
+logger = logging.getLogger(__name__)
+
 # 获取数据库URL,如果配置中没有则使用默认值
 SQLALCHEMY_DATABASE_URL = config.database_url or "sqlite+aiosqlite:///./stocks.db"
 
-engine = create_async_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}
-)
+# SQLite性能参数的默认值: WAL模式下读写互不阻塞,爬虫写库时K线接口仍可读取;
+# synchronous=NORMAL在WAL模式下只在检查点时fsync,断电最多丢失最近的事务而不会损坏数据库
+DEFAULT_SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -65536,  # 负数表示KiB,即64MiB
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+_PRAGMA_VALUES = {
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+}
+
+
+def sqlite_pragmas(settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """根据配置计算每个连接要设置的PRAGMA
+
+    Args:
+        settings: database.sqlite配置,默认读取config.json
+
+    Returns:
+        PRAGMA名称到值的映射,enabled为false时只保留busy_timeout
+    """
+    settings = config.database_sqlite if settings is None else settings
+    busy_timeout = settings.get('busy_timeout', int(config.database_timeout * 1000))
+    if not settings.get('enabled', True):
+        return {"busy_timeout": busy_timeout}
+    pragmas = {name: settings.get(name, value) for name, value in DEFAULT_SQLITE_PRAGMAS.items()}
+    pragmas["busy_timeout"] = busy_timeout
+    for name, allowed in _PRAGMA_VALUES.items():
+        value = str(pragmas[name]).upper()
+        if value not in allowed:
+            raise ValueError(f"无效的SQLite参数 {name}={pragmas[name]}")
+        pragmas[name] = value
+    for name in ("cache_size", "mmap_size", "busy_timeout"):
+        pragmas[name] = int(pragmas[name])
+    return pragmas
+
+
+def build_engine(url: str, pragmas: Optional[Dict[str, Any]] = None) -> AsyncEngine:
+    """创建异步数据库引擎,SQLite在每个新连接上设置PRAGMA
+
+    Args:
+        url: 数据库URL
+        pragmas: SQLite PRAGMA,默认按配置计算
+    """
+    if not url.startswith("sqlite"):
+        return create_async_engine(url)
+
+    new_engine = create_async_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": config.database_timeout}
+    )
+    pragmas = sqlite_pragmas() if pragmas is None else pragmas
+
+    @event.listens_for(new_engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    logger.info(f"SQLite连接参数: {pragmas}")
+    return new_engine
+
+
+engine = build_engine(SQLALCHEMY_DATABASE_URL)
 
 AsyncSessionLocal = sessionmaker(
-    engine, 
-    class_=AsyncSession, 
+    engine,
+    class_=AsyncSession,
     expire_on_commit=False
 )
 
+def after_commit(session: AsyncSession, callback: Callable[[], Awaitable[Any]]):
+    """登记会话事务提交成功后才执行的操作,如写入数据库之外的文件
+
+    提交方在commit成功后调用run_after_commit执行,回滚时调用discard_after_commit丢弃。
+
+    Args:
+        session: 数据库会话
+        callback: 无参数的异步函数
+    """
+    session.info.setdefault('after_commit', []).append(callback)
+
+
+async def run_after_commit(session: AsyncSession):
+    """按登记顺序执行会话中已提交事务登记的操作"""
+    for callback in session.info.pop('after_commit', []):
+        await callback()
+
+
+def discard_after_commit(session: AsyncSession):
+    """丢弃会话中回滚事务登记的操作"""
+    session.info.pop('after_commit', None)
+
+
 async def get_db():
     """获取数据库会话"""
     async with AsyncSessionLocal() as session:
@@ -31,5 +129,7 @@ async def get_db():
 async def init_db():
     """初始化数据库"""
     from ..models import Base
+    from .migrations import run_migrations
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
@@ -0,0 +1,359 @@
+"""
+K线存储模块
+
+K线可以保存在数据库的kline_data表(sql,默认)或列式文件(columnar)中,由配置
+database.kline_store.backend选择;股票和财务数据始终保存在数据库中。
+
+列式存储为每个(股票, 时间粒度, 分区)保存一个.npy文件,日K按年分区,分钟K按月分区:
+    {directory}/{resolution}/{stock_id}/{分区}.npy
+数组形状为(7, n),第一行是秒级时间戳(与kline_parser一致),其余各行依次为
+open、close、high、low、volume、turnover,每列在文件中连续存放。读取时内存映射文件并按
+时间二分查找,不经过ORM;写入时与已有分区按时间合并,新数据覆盖同一时间的旧数据。
+在会话中写入时,文件推迟到会话的事务提交成功后才写入,事务回滚时不留下文件。
+"""
+import os
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import config
+from app.core.database import AsyncSessionLocal, after_commit
+from app.crawler.kline_parser import VALUE_FIELDS, to_timestamp
+from app.models import KLineData
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 各时间粒度的分区粒度(NumPy datetime64单位)
+PARTITION_UNITS = {"1d": "Y", "1m": "M"}
+
+# read_rows返回的每行元组中各字段的顺序
+KLINE_COLUMNS = ('date', *VALUE_FIELDS)
+
+
+class SqlKLineStore:
+    """K线保存在数据库kline_data表中"""
+
+    in_database = True
+
+    async def read_rows(self, stock_id: int, resolution: str, start: Optional[datetime] = None,
+                        end: Optional[datetime] = None, descending: bool = False, limit: Optional[int] = None,
+                        session: Optional[AsyncSession] = None) -> List[Tuple]:
+        """读取一支股票的K线,每根K线为一个按KLINE_COLUMNS排列的元组
+
+        查询kline_data表的列而不是ORM映射的属性,语句不经过ORM编译和结果处理,
+        返回的数据库行直接使用。
+
+        Args:
+            stock_id: 股票ID
+            resolution: 时间粒度
+            start: 起始时间(含)
+            end: 截止时间(含)
+            descending: 是否按时间降序返回
+            limit: 最多返回的K线数量,从排序后的开头计
+            session: 数据库会话,默认新建
+
+        Returns:
+            (date, open, close, high, low, volume, turnover)元组列表
+        """
+        table = KLineData.__table__
+        query = select(*(table.c[column] for column in KLINE_COLUMNS)).where(
+            table.c.stock_id == stock_id,
+            table.c.resolution == resolution
+        )
+        if start is not None:
+            query = query.where(table.c.date >= start)
+        if end is not None:
+            query = query.where(table.c.date <= end)
+        query = query.order_by(table.c.date.desc() if descending else table.c.date.asc())
+        if limit:
+            query = query.limit(limit)
+
+        if session is None:
+            async with AsyncSessionLocal() as session:
+                return (await session.execute(query)).all()
+        return (await session.execute(query)).all()
+
+    async def read(self, stock_id: int, resolution: str, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None, descending: bool = False, limit: Optional[int] = None,
+                   session: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+        """读取一支股票的K线,参数同read_rows
+
+        Returns:
+            K线字典列表,包含date和VALUE_FIELDS
+        """
+        rows = await self.read_rows(stock_id, resolution, start, end, descending, limit, session)
+        return [dict(zip(KLINE_COLUMNS, row)) for row in rows]
+
+    async def last_dates(self, stock_id: int) -> Dict[str, datetime]:
+        """查询股票每种时间粒度最后一根已存K线的时间"""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(KLineData.resolution, func.max(KLineData.date))
+                .where(KLineData.stock_id == stock_id)
+                .group_by(KLineData.resolution)
+            )
+            return {resolution: last_date for resolution, last_date in result.all() if last_date}
+
+    async def write(self, session: AsyncSession, stock_id: int, klines: List[Dict[str, Any]]) -> int:
+        """在给定会话中upsert K线,随会话的事务提交"""
+        from app.crawler.data_processor import DataProcessor
+        return await DataProcessor.bulk_upsert_klines(session, stock_id, klines)
+
+
+class ColumnarKLineStore:
+    """K线保存在列式.npy文件中"""
+
+    in_database = False
+
+    def __init__(self, directory: str):
+        """初始化存储
+
+        Args:
+            directory: 存储根目录
+        """
+        self.directory = directory
+        # 同一股票同一时间粒度的写入串行执行,避免并发合并同一个分区文件
+        self._locks: Dict[tuple, asyncio.Lock] = {}
+
+    def _stock_dir(self, stock_id: int, resolution: str) -> str:
+        return os.path.join(self.directory, resolution, str(stock_id))
+
+    @staticmethod
+    def _partition_keys(resolution: str, timestamps: np.ndarray) -> np.ndarray:
+        """计算每个时间戳所在的分区名,如日K的"2024"、分钟K的"2024-06" """
+        unit = PARTITION_UNITS.get(resolution, "Y")
+        return timestamps.astype('datetime64[s]').astype(f'datetime64[{unit}]').astype(str)
+
+    def _partitions(self, stock_id: int, resolution: str) -> List[str]:
+        """按时间顺序列出已有的分区文件"""
+        stock_dir = self._stock_dir(stock_id, resolution)
+        if not os.path.isdir(stock_dir):
+            return []
+        return sorted(
+            os.path.join(stock_dir, name) for name in os.listdir(stock_dir) if name.endswith(".npy")
+        )
+
+    @staticmethod
+    def _to_array(klines: List[Dict[str, Any]]) -> np.ndarray:
+        """将K线字典列表转换为按时间排序、时间唯一(后出现的覆盖先出现的)的(7, n)数组"""
+        array = np.empty((1 + len(VALUE_FIELDS), len(klines)), dtype=np.float64)
+        array[0] = [to_timestamp(kline['date']) for kline in klines]
+        for row, field in enumerate(VALUE_FIELDS, start=1):
+            array[row] = [np.nan if kline.get(field) is None else kline[field] for kline in klines]
+        # 反转后np.unique取首次出现的位置,即原列表中最后一次出现的K线
+        array = array[:, ::-1]
+        _, index = np.unique(array[0], return_index=True)
+        return array[:, index]
+
+    @staticmethod
+    def _merge(existing: np.ndarray, new: np.ndarray) -> np.ndarray:
+        """合并已有分区和新数据,新数据覆盖同一时间的旧数据"""
+        if existing.shape[1] == 0 or new[0, 0] > existing[0, -1]:
+            # 常见情况: 增量追加在末尾
+            return np.concatenate((existing, new), axis=1)
+        combined = np.concatenate((new, existing), axis=1)
+        _, index = np.unique(combined[0], return_index=True)
+        return combined[:, index]
+
+    @staticmethod
+    def _save(path: str, array: np.ndarray):
+        """先写临时文件再替换,读取方不会看到写了一半的文件"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(tmp_path, path)
+
+    def append_sync(self, stock_id: int, resolution: str, klines: List[Dict[str, Any]]) -> int:
+        """同步写入一支股票某种时间粒度的K线,返回写入的行数"""
+        if not klines:
+            return 0
+        array = self._to_array(klines)
+        stock_dir = self._stock_dir(stock_id, resolution)
+        os.makedirs(stock_dir, exist_ok=True)
+        keys = self._partition_keys(resolution, array[0])
+        for key in np.unique(keys):
+            part = array[:, keys == key]
+            path = os.path.join(stock_dir, f"{key}.npy")
+            if os.path.exists(path):
+                part = self._merge(np.load(path), part)
+            self._save(path, part)
+        return array.shape[1]
+
+    def read_rows_sync(self, stock_id: int, resolution: str, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None, descending: bool = False,
+                       limit: Optional[int] = None) -> List[Tuple]:
+        """同步读取K线元组,参数同SqlKLineStore.read_rows"""
+        paths = self._partitions(stock_id, resolution)
+        low = to_timestamp(start) if start is not None else None
+        high = to_timestamp(end) if end is not None else None
+        # 按文件名跳过范围之外的分区,分区名等长,可以直接按字符串比较
+        if low is not None:
+            first_key = self._partition_keys(resolution, np.array([low], dtype=np.int64))[0]
+            paths = [path for path in paths if os.path.basename(path)[:-4] >= first_key]
+        if high is not None:
+            last_key = self._partition_keys(resolution, np.array([high], dtype=np.int64))[0]
+            paths = [path for path in paths if os.path.basename(path)[:-4] <= last_key]
+        if descending:
+            paths.reverse()
+
+        slices, count = [], 0
+        for path in paths:
+            data = np.load(path, mmap_mode='r')
+            timestamps = data[0]
+            first = np.searchsorted(timestamps, low, side='left') if low is not None else 0
+            last = np.searchsorted(timestamps, high, side='right') if high is not None else len(timestamps)
+            if first >= last:
+                continue
+            part = data[:, first:last]
+            if limit:
+                remaining = limit - count
+                part = part[:, -remaining:] if descending else part[:, :remaining]
+            slices.append(np.array(part))
+            count += part.shape[1]
+            if limit and count >= limit:
+                break
+        if not slices:
+            return []
+
+        if descending:
+            array = np.concatenate([part[:, ::-1] for part in slices], axis=1)
+        else:
+            array = np.concatenate(slices, axis=1)
+        dates = array[0].astype('datetime64[s]').astype(object).tolist()
+        columns = [
+            [None if value != value else value for value in array[row].tolist()]
+            for row in range(1, 1 + len(VALUE_FIELDS))
+        ]
+        return list(zip(dates, *columns))
+
+    def read_sync(self, stock_id: int, resolution: str, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None, descending: bool = False,
+                  limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """同步读取K线,参数同SqlKLineStore.read"""
+        rows = self.read_rows_sync(stock_id, resolution, start, end, descending, limit)
+        return [dict(zip(KLINE_COLUMNS, row)) for row in rows]
+
+    def last_dates_sync(self, stock_id: int) -> Dict[str, datetime]:
+        """同步查询每种时间粒度最后一根已存K线的时间"""
+        result = {}
+        for resolution in PARTITION_UNITS:
+            paths = self._partitions(stock_id, resolution)
+            if paths:
+                timestamps = np.load(paths[-1], mmap_mode='r')[0]
+                if len(timestamps):
+                    result[resolution] = np.datetime64(int(timestamps[-1]), 's').astype(object)
+        return result
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def read_rows(self, stock_id: int, resolution: str, start: Optional[datetime] = None,
+                        end: Optional[datetime] = None, descending: bool = False, limit: Optional[int] = None,
+                        session: Optional[AsyncSession] = None) -> List[Tuple]:
+        """读取一支股票的K线元组,参数同SqlKLineStore.read_rows,session不使用"""
+        return await self._run(self.read_rows_sync, stock_id, resolution, start, end, descending, limit)
+
+    async def read(self, stock_id: int, resolution: str, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None, descending: bool = False, limit: Optional[int] = None,
+                   session: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+        """读取一支股票的K线,参数同SqlKLineStore.read,session不使用"""
+        return await self._run(self.read_sync, stock_id, resolution, start, end, descending, limit)
+
+    async def last_dates(self, stock_id: int) -> Dict[str, datetime]:
+        """查询股票每种时间粒度最后一根已存K线的时间"""
+        return await self._run(self.last_dates_sync, stock_id)
+
+    async def write(self, session: Optional[AsyncSession], stock_id: int, klines: List[Dict[str, Any]]) -> int:
+        """写入K线文件
+
+        给定会话时只登记写入,由提交方在事务提交成功后执行(见database.after_commit):
+        新股票的ID在事务中才分配,事务回滚后同一ID会分配给下一支新股票,
+        提前写入的文件会被误认为属于那支股票。session为None时立即写入。
+
+        Returns:
+            写入(或登记写入)的K线数量
+        """
+        if session is not None:
+            if klines:
+                after_commit(session, lambda: self.write(None, stock_id, klines))
+            return len(klines)
+        by_resolution: Dict[str, List[Dict[str, Any]]] = {}
+        for kline in klines:
+            by_resolution.setdefault(kline['resolution'], []).append(kline)
+        written = 0
+        for resolution, rows in by_resolution.items():
+            lock = self._locks.setdefault((stock_id, resolution), asyncio.Lock())
+            async with lock:
+                written += await self._run(self.append_sync, stock_id, resolution, rows)
+        return written
+
+
+_store = None
+
+
+def get_kline_store():
+    """按配置database.kline_store返回K线存储"""
+    global _store
+    if _store is None:
+        settings = config.database_kline_store
+        backend = settings.get('backend', 'sql')
+        if backend == 'columnar':
+            _store = ColumnarKLineStore(settings.get('directory', './data/klines'))
+        elif backend == 'sql':
+            _store = SqlKLineStore()
+        else:
+            raise ValueError(f"不支持的K线存储: {backend}")
+        logger.info(f"K线存储: {backend}")
+    return _store
+
+
+async def export_sql_to_columnar(store: ColumnarKLineStore, batch_size: int = 100000) -> int:
+    """将数据库中的K线导出到列式存储,返回导出的行数
+
+    按(stock_id, resolution, date)顺序分批读取,每批按股票和时间粒度写入。
+    """
+    columns = [getattr(KLineData, field) for field in VALUE_FIELDS]
+    exported = 0
+    last_key = None
+    async with AsyncSessionLocal() as session:
+        while True:
+            query = select(KLineData.stock_id, KLineData.resolution, KLineData.date, *columns)
+            if last_key:
+                # 从上一批的最后一行之后继续
+                query = query.where(
+                    (KLineData.stock_id > last_key[0]) |
+                    ((KLineData.stock_id == last_key[0]) & (KLineData.resolution > last_key[1])) |
+                    ((KLineData.stock_id == last_key[0]) & (KLineData.resolution == last_key[1]) &
+                     (KLineData.date > last_key[2]))
+                )
+            query = query.order_by(KLineData.stock_id, KLineData.resolution, KLineData.date).limit(batch_size)
+            rows = (await session.execute(query)).all()
+            if not rows:
+                break
+            groups: Dict[tuple, List[Dict[str, Any]]] = {}
+            for stock_id, resolution, date, *values in rows:
+                groups.setdefault((stock_id, resolution), []).append(
+                    {'date': date, 'resolution': resolution, **dict(zip(VALUE_FIELDS, values))}
+                )
+            for (stock_id, resolution), klines in groups.items():
+                exported += await store.write(None, stock_id, klines)
+            last_key = (rows[-1][0], rows[-1][1], rows[-1][2])
+            logger.info(f"已导出 {exported} 根K线")
+    return exported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将数据库中的K线导出到列式存储")
+    parser.add_argument("--directory", default=config.database_kline_store.get('directory', './data/klines'),
+                        help="列式存储根目录")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    total = asyncio.run(export_sql_to_columnar(ColumnarKLineStore(args.directory)))
+    print(f"导出完成: {total} 根K线 -> {args.directory}")
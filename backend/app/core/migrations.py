@@ -0,0 +1,106 @@
+"""
+数据库结构迁移模块
+
+create_all只会创建缺失的表,不会修改已有的表;已有数据库需要的结构调整在这里
+以幂等的方式执行,应用启动时在create_all之后调用。
+"""
+import logging
+
+from sqlalchemy import inspect, text, select, update, bindparam
+from sqlalchemy.engine import Connection
+
+from app.models import FinancialData, LatestFinancialData
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 早期版本为kline_data.date和kline_data.resolution创建的单列索引
+REDUNDANT_KLINE_INDEXES = ("ix_kline_data_date", "ix_kline_data_resolution")
+
+
+def _dedupe_klines(conn: Connection):
+    """删除(stock_id, resolution, date)重复的K线,保留最后写入的一条"""
+    result = conn.execute(text(
+        "DELETE FROM kline_data WHERE id NOT IN ("
+        "SELECT MAX(id) FROM kline_data GROUP BY stock_id, resolution, date)"
+    ))
+    if result.rowcount:
+        logger.info(f"已删除 {result.rowcount} 条重复K线")
+
+
+def ensure_kline_unique_index(conn: Connection):
+    """为kline_data创建(stock_id, resolution, date)唯一索引,创建前先去重"""
+    indexes = {index["name"] for index in inspect(conn).get_indexes("kline_data")}
+    if "uq_kline_stock_res_date" in indexes:
+        return
+    _dedupe_klines(conn)
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_kline_stock_res_date "
+        "ON kline_data (stock_id, resolution, date)"
+    ))
+    logger.info("已创建K线唯一索引 uq_kline_stock_res_date")
+
+
+def drop_redundant_kline_indexes(conn: Connection):
+    """删除kline_data上的单列索引
+
+    (stock_id, resolution, date)复合索引已覆盖所有K线查询,单列的date和resolution索引
+    不会被K线查询使用,只会拖慢写入。
+    """
+    indexes = {index["name"] for index in inspect(conn).get_indexes("kline_data")}
+    for name in REDUNDANT_KLINE_INDEXES:
+        if name in indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            logger.info(f"已删除冗余K线索引 {name}")
+
+
+def ensure_financial_snapshots(conn: Connection):
+    """将financial_data改为按天的快照序列
+
+    早期版本每支股票只有一条财务数据,date为爬取时间。迁移时把date截断到当天、去重后
+    创建(stock_id, date)唯一索引,删除单列的date索引,并用每支股票最新的快照初始化
+    latest_financial_data表。
+    """
+    inspector = inspect(conn)
+    indexes = {index["name"] for index in inspector.get_indexes("financial_data")}
+    if "uq_financial_stock_date" not in indexes:
+        table = FinancialData.__table__
+        rows = [
+            {"_id": row_id, "_date": date.replace(hour=0, minute=0, second=0, microsecond=0)}
+            for row_id, date in conn.execute(select(table.c.id, table.c.date)).all()
+            if date is not None
+        ]
+        if rows:
+            conn.execute(
+                update(table).where(table.c.id == bindparam("_id")).values(date=bindparam("_date")),
+                rows
+            )
+        result = conn.execute(text(
+            "DELETE FROM financial_data WHERE id NOT IN ("
+            "SELECT MAX(id) FROM financial_data GROUP BY stock_id, date)"
+        ))
+        if result.rowcount:
+            logger.info(f"已删除 {result.rowcount} 条同一天重复的财务数据")
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_financial_stock_date ON financial_data (stock_id, date)"
+        ))
+        logger.info("已创建财务快照唯一索引 uq_financial_stock_date")
+    if "ix_financial_data_date" in indexes:
+        conn.execute(text("DROP INDEX IF EXISTS ix_financial_data_date"))
+
+    if conn.execute(text("SELECT COUNT(*) FROM latest_financial_data")).scalar() == 0:
+        columns = ", ".join(column.name for column in LatestFinancialData.__table__.columns)
+        result = conn.execute(text(
+            f"INSERT INTO latest_financial_data ({columns}) "
+            f"SELECT {columns} FROM financial_data f WHERE f.date = ("
+            "SELECT MAX(date) FROM financial_data g WHERE g.stock_id = f.stock_id)"
+        ))
+        if result.rowcount:
+            logger.info(f"已初始化 {result.rowcount} 支股票的最新财务快照")
+
+
+def run_migrations(conn: Connection):
+    """依次执行所有迁移,每个迁移都可以重复执行"""
+    ensure_kline_unique_index(conn)
+    drop_redundant_kline_indexes(conn)
+    ensure_financial_snapshots(conn)
@@ -0,0 +1,171 @@
+"""
+历史K线回填模块
+
+按(股票列表, 时间粒度, 起始日期, 截止日期)回填任意时间范围的K线:
+将时间范围拆分为与上游接口单次返回量相当的分段,在主机限流范围内并行获取,
+合并去重后批量写入数据库。
+"""
+import logging
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+from app.core.config import config
+from app.crawler.base import CrawlerFetchError, guess_market
+from app.crawler.data_processor import DataProcessor
+from app.crawler.ingest import get_ingest_buffer
+from app.crawler.kline_parser import parse_kline_rows
+from app.crawler.stock_crawler import StockCrawler
+from app.utils.metrics import ROWS_PARSED
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 每个分段覆盖的自然日数,日K线接口单次可返回数年数据,分钟K线接口单次只返回数天
+DEFAULT_CHUNK_DAYS = {"1d": 365, "1m": 5}
+
+
+def split_range(start: datetime, end: datetime, days: int) -> List[Tuple[datetime, datetime]]:
+    """将[start, end]按自然日拆分为首尾相接、互不重叠的分段(均含端点)
+
+    Args:
+        start: 起始日期
+        end: 截止日期
+        days: 每段的天数
+
+    Returns:
+        (分段起始日期, 分段截止日期)列表
+    """
+    start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    end = end.replace(hour=0, minute=0, second=0, microsecond=0)
+    chunks = []
+    step = timedelta(days=max(1, days))
+    while start <= end:
+        chunk_end = min(start + step - timedelta(days=1), end)
+        chunks.append((start, chunk_end))
+        start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def merge_chunks(chunks: List[List[Dict[str, Any]]], start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """合并各分段的K线,按时间去重(后出现的覆盖先出现的)并裁剪到[start, end当天结束]"""
+    until = end.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    merged: Dict[datetime, Dict[str, Any]] = {}
+    for rows in chunks:
+        for row in rows:
+            if start <= row['date'] < until:
+                merged[row['date']] = row
+    return [merged[date] for date in sorted(merged)]
+
+
+class Backfiller:
+    """历史K线回填"""
+
+    def __init__(self, crawler: Optional[StockCrawler] = None, concurrency: Optional[int] = None,
+                 chunk_days: Optional[Dict[str, int]] = None,
+                 progress_callback: Optional[Callable] = None):
+        """初始化回填
+
+        Args:
+            crawler: 负责网络请求的爬虫实例,默认新建
+            concurrency: 同时回填的股票数,默认读取配置
+            chunk_days: 各时间粒度每个分段的天数覆盖
+            progress_callback: 进度回调函数,参数为(已处理数量, 总数量)
+        """
+        settings = config.crawler_backfill
+        self.crawler = crawler or StockCrawler(progress_callback=progress_callback)
+        self.concurrency = max(1, concurrency or settings.get('concurrency', 4))
+        self.chunk_days = {**DEFAULT_CHUNK_DAYS, **settings.get('chunk_days', {}), **(chunk_days or {})}
+        self.failed_stocks: List[str] = []
+        self.rows_written = 0
+
+    async def fetch_range(self, code: str, market: str, resolution: str,
+                          start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """并行获取一支股票在[start, end]内的K线并合并去重
+
+        Raises:
+            CrawlerFetchError: 任一分段请求失败
+        """
+        chunks = split_range(start, end, self.chunk_days[resolution])
+        results = await asyncio.gather(*(
+            self.crawler.fetch_kline_lines(code, market, resolution, since=chunk_start, until=chunk_end)
+            for chunk_start, chunk_end in chunks
+        ))
+        if any(lines is None for lines in results):
+            failed = sum(lines is None for lines in results)
+            raise CrawlerFetchError(f"K线分段获取失败: {code} {resolution} {failed}/{len(chunks)} 段")
+        chunk_rows = [parse_kline_rows(lines, resolution) for lines in results]
+        ROWS_PARSED.inc(sum(len(rows) for rows in chunk_rows), resolution=resolution)
+        return merge_chunks(chunk_rows, start, end)
+
+    async def _resolve_stocks(self, codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """查询股票ID和市场,数据库中没有的股票先登记"""
+        stock_ids = await DataProcessor.get_stock_ids(codes)
+        missing = [code for code in codes if code not in stock_ids]
+        if missing:
+            # 名称暂用代码,下次同步股票列表时更新
+            await DataProcessor.save_stock_list([
+                {'code': code, 'name': code, 'market': guess_market(code)} for code in missing
+            ])
+            stock_ids = await DataProcessor.get_stock_ids(codes)
+        return {code: {'id': stock_ids[code], 'market': guess_market(code)} for code in codes if code in stock_ids}
+
+    async def run(self, codes: List[str], resolution: str, start: datetime, end: datetime) -> Dict[str, Any]:
+        """回填股票列表在[start, end]内的K线
+
+        Args:
+            codes: 股票代码列表
+            resolution: 时间粒度,1d或1m
+            start: 起始日期
+            end: 截止日期(含)
+
+        Returns:
+            回填统计信息
+        """
+        if resolution not in self.chunk_days:
+            raise ValueError(f"不支持的时间粒度: {resolution}")
+        if start > end:
+            raise ValueError("起始日期晚于截止日期")
+        codes = list(dict.fromkeys(codes))
+        stocks = await self._resolve_stocks(codes)
+        crawler = self.crawler
+        crawler.total_stocks = len(codes)
+        crawler.processed_stocks = 0
+        self.failed_stocks = [code for code in codes if code not in stocks]
+        self.rows_written = 0
+        chunks = len(split_range(start, end, self.chunk_days[resolution]))
+        logger.info(f"开始回填: {len(codes)} 支股票, {resolution}, {start:%Y-%m-%d} ~ {end:%Y-%m-%d}, "
+                    f"每支 {chunks} 个分段")
+        await crawler.update_progress(0, crawler.total_stocks)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for code in stocks:
+            queue.put_nowait(code)
+
+        async def worker():
+            while True:
+                try:
+                    code = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    rows = await self.fetch_range(code, stocks[code]['market'], resolution, start, end)
+                    await get_ingest_buffer().upsert_klines([(stocks[code]['id'], rows)])
+                    self.rows_written += len(rows)
+                    logger.info(f"已回填 {code}: {len(rows)} 根K线")
+                except Exception as e:
+                    self.failed_stocks.append(code)
+                    logger.error(f"回填失败 {code}: {str(e)}")
+                crawler.processed_stocks += 1
+                await crawler.update_progress(crawler.processed_stocks, crawler.total_stocks)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(stocks)) or 1)))
+        await crawler.update_progress(crawler.total_stocks, crawler.total_stocks)
+        if self.failed_stocks:
+            logger.warning(f"{len(self.failed_stocks)} 支股票回填失败: {self.failed_stocks[:20]}")
+        return {
+            "stocks": len(codes),
+            "chunks_per_stock": chunks,
+            "rows": self.rows_written,
+            "failed_stocks": self.failed_stocks,
+        }
@@ -1,50 +1,295 @@
 """
 爬虫基础模块
 """
+import time
 import logging
 import aiohttp
 import asyncio
-from typing import Dict, Any, Optional, Callable
+from typing import Dict, Any, List, Optional, Callable
+from urllib.parse import urlsplit
+
+from app.core.config import config
+from app.crawler.cache import get_response_cache
+from app.crawler.resilience import RETRYABLE_STATUS, backoff_delay, get_breaker, parse_retry_after
+from app.utils.metrics import REQUEST_LATENCY, BYTES_DOWNLOADED, REQUESTS, RETRIES, FAILURES
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 默认数据源地址,可通过配置crawler.endpoints覆盖(例如指向本地测试服务器)
+DEFAULT_ENDPOINTS = {
+    "sse_stock_list": "http://query.sse.com.cn/security/stock/getStockListData.do",
+    "szse_stock_list": "http://www.szse.cn/api/report/ShowReport/data",
+    "kline": "http://push2his.eastmoney.com/api/qt/stock/kline/get",
+    "quote": "http://push2.eastmoney.com/api/qt/stock/get",
+    "quote_batch": "http://push2.eastmoney.com/api/qt/ulist.np/get",
+}
+
+# 东方财富secid中的市场前缀: 上交所为1,深交所和北交所为0
+MARKET_SECID_PREFIX = {
+    "SH": 1,
+    "SZ": 0,
+    "BJ": 0,
+}
+
+
+def guess_market(code: str) -> str:
+    """根据股票代码推断所属交易所"""
+    if code.startswith(("6", "9")):
+        return "SH"
+    if code.startswith(("4", "8")):
+        return "BJ"
+    return "SZ"
+
+
+def to_secid(code: str, market: Optional[str] = None) -> str:
+    """生成东方财富接口使用的secid,如 1.600000、0.000001"""
+    market = market or guess_market(code)
+    return f"{MARKET_SECID_PREFIX.get(market, 0)}.{code}"
+
+
+class CrawlerFetchError(Exception):
+    """数据请求在重试后仍然失败"""
+
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
+
+
+class HostLimiter:
+    """按主机限制并发数和请求速率"""
+
+    def __init__(self, max_concurrent: int = 4, rate: float = 0):
+        """初始化限流器
+
+        Args:
+            max_concurrent: 单个主机同时进行的最大请求数
+            rate: 单个主机每秒最多发起的请求数,0表示不限制
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._next_slot: Dict[str, float] = {}
+
+    async def acquire(self, host: str):
+        """占用一个主机请求名额,必要时等待到下一个可用时间片"""
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.max_concurrent))
+        await semaphore.acquire()
+        if not self.interval:
+            return
+        try:
+            lock = self._locks.setdefault(host, asyncio.Lock())
+            async with lock:
+                now = time.monotonic()
+                slot = max(now, self._next_slot.get(host, now))
+                self._next_slot[host] = slot + self.interval
+            if slot > now:
+                await asyncio.sleep(slot - now)
+        except BaseException:
+            # 等待时间片期间被取消(如iter_pages取消未完成的分页),归还名额
+            semaphore.release()
+            raise
+
+    def release(self, host: str):
+        """释放主机请求名额"""
+        self._semaphores[host].release()
+
+
 class BaseCrawler:
-    """爬虫基类"""
-    
-    def __init__(self, timeout: int = 30):
+    """爬虫基类
+
+    所有爬虫实例共享同一个带连接池的aiohttp会话,由startup/shutdown管理其生命周期
+    """
+
+    _session: Optional[aiohttp.ClientSession] = None
+    _session_loop: Optional[asyncio.AbstractEventLoop] = None
+    _trace_configs: List[aiohttp.TraceConfig] = []
+
+    def __init__(self, timeout: Optional[int] = None,
+                 per_host_limit: Optional[int] = None,
+                 per_host_rate: Optional[float] = None,
+                 endpoints: Optional[Dict[str, str]] = None,
+                 use_cache: Optional[bool] = None):
         """初始化爬虫
-        
+
         Args:
-            timeout: 请求超时时间(秒)
+            timeout: 请求超时时间(秒),默认读取配置
+            per_host_limit: 单个主机最大并发请求数,默认读取配置
+            per_host_rate: 单个主机每秒最大请求数,默认读取配置
+            endpoints: 数据源地址覆盖,默认读取配置
+            use_cache: 是否使用HTTP响应缓存,默认按配置crawler.cache.enabled
         """
         self.headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
+            "User-Agent": config.crawler_user_agent or DEFAULT_USER_AGENT
         }
-        self.timeout = aiohttp.ClientTimeout(total=timeout)
-    
-    async def make_request(self, session, url: str, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None):
-        """通用请求方法
+        self.endpoints = {**DEFAULT_ENDPOINTS, **config.crawler_endpoints, **(endpoints or {})}
+        self.cache = get_response_cache() if use_cache is not False else None
+        retry = config.crawler_retry
+        self.max_attempts = max(1, retry.get('max_attempts', 4))
+        self.backoff_base = retry.get('backoff_base', 0.5)
+        self.backoff_max = retry.get('backoff_max', 30)
+        self.timeout = aiohttp.ClientTimeout(total=timeout or config.crawler_timeout)
+        self.host_limiter = HostLimiter(
+            max_concurrent=per_host_limit or config.crawler_per_host_limit,
+            rate=config.crawler_per_host_rate if per_host_rate is None else per_host_rate
+        )
+        # 可选的请求预算(如调度器的RequestBudget),设置后每次重试也从预算中扣除一个请求
+        self.request_budget = None
+
+    @classmethod
+    def _create_session(cls) -> aiohttp.ClientSession:
+        """创建带连接池、长连接和DNS缓存的会话"""
+        pool = config.crawler_pool
+        connector = aiohttp.TCPConnector(
+            limit=pool.get('limit', 100),
+            limit_per_host=pool.get('limit_per_host', 10),
+            ttl_dns_cache=pool.get('dns_ttl', 300),
+            use_dns_cache=True,
+            keepalive_timeout=pool.get('keepalive_timeout', 30)
+        )
+        return aiohttp.ClientSession(connector=connector, trace_configs=BaseCrawler._trace_configs or None)
+
+    @classmethod
+    async def startup(cls, trace_configs: Optional[List[aiohttp.TraceConfig]] = None):
+        """创建共享会话,应用启动时调用
+        
+        Args:
+            trace_configs: 挂载到会话上的请求追踪配置,用于统计请求耗时等
+        """
+        if trace_configs is not None:
+            BaseCrawler._trace_configs = list(trace_configs)
+            await cls.shutdown()
+        await cls.get_session()
+
+    @classmethod
+    async def shutdown(cls):
+        """关闭共享会话并释放连接池,应用关闭时调用"""
+        session, BaseCrawler._session, BaseCrawler._session_loop = BaseCrawler._session, None, None
+        if session and not session.closed:
+            await session.close()
+            logger.info("爬虫HTTP会话已关闭")
+
+    @classmethod
+    async def get_session(cls) -> aiohttp.ClientSession:
+        """获取共享会话,不存在或已绑定到其他事件循环时重新创建"""
+        loop = asyncio.get_running_loop()
+        # 会话保存在BaseCrawler上以便所有子类共享;检查与创建之间没有await,无需加锁
+        if not BaseCrawler._session or BaseCrawler._session.closed or BaseCrawler._session_loop is not loop:
+            BaseCrawler._session = cls._create_session()
+            BaseCrawler._session_loop = loop
+            logger.info("爬虫HTTP会话已创建")
+        return BaseCrawler._session
+
+    async def make_request(self, url: str, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None):
+        """通用请求方法,使用共享会话发送GET请求,启用缓存时优先返回缓存结果
         
         Args:
-            session: aiohttp客户端会话
             url: 请求URL
             params: 请求参数
             headers: 请求头
-        
+
         Returns:
             请求结果,通常是JSON数据,失败则返回None
         """
-        try:
-            _headers = {**self.headers, **(headers or {})}
-            async with session.get(url, params=params, headers=_headers, timeout=self.timeout) as response:
-                if response.status != 200:
-                    logger.error(f"请求失败: {url}, 状态码: {response.status}")
-                    return None
-                return await response.json()
-        except asyncio.TimeoutError:
-            logger.error(f"请求超时: {url}")
-            return None
-        except Exception as e:
-            logger.error(f"请求异常: {url}, 错误: {str(e)}")
-            return None
+        cache_key = ttl = None
+        if self.cache:
+            endpoint = self._endpoint_name(url)
+            ttl = self.cache.ttl_for(endpoint, params)
+            if ttl > 0:
+                cache_key = self.cache.make_key(url, params)
+                cached = await self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
+        data = await self._fetch(url, params, headers)
+        if cache_key and data is not None:
+            await self.cache.set(cache_key, data, ttl)
+        return data
+
+    def _endpoint_name(self, url: str) -> Optional[str]:
+        """根据URL查找数据源名称(如kline、quote),不是已配置的数据源时返回None"""
+        return next((name for name, value in self.endpoints.items() if value == url), None)
+
+    async def _fetch(self, url: str, params: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None):
+        """发送请求并解析JSON
+
+        429/5xx响应、超时和连接错误按指数退避重试,优先遵循Retry-After;
+        每次请求前经过主机熔断器,主机持续失败时暂停对其发出请求。
+
+        Returns:
+            JSON数据,重试耗尽或遇到不可重试的错误时返回None
+        """
+        session = await self.get_session()
+        host = urlsplit(url).netloc
+        breaker = get_breaker(host)
+        _headers = {**self.headers, **(headers or {})}
+        labels = {"host": host, "endpoint": self._endpoint_name(url) or "other"}
+
+        for attempt in range(1, self.max_attempts + 1):
+            await breaker.before_request()
+            retry_after = None
+            status = "error"
+            try:
+                await self.host_limiter.acquire(host)
+            except asyncio.CancelledError:
+                breaker.abort_probe()
+                raise
+            started = time.perf_counter()
+            try:
+                async with session.get(url, params=params, headers=_headers, timeout=self.timeout) as response:
+                    status = str(response.status)
+                    if response.status == 200:
+                        data = await response.json()
+                        BYTES_DOWNLOADED.inc(len(await response.read()), **labels)
+                        breaker.record_success()
+                        return data
+                    if response.status not in RETRYABLE_STATUS:
+                        # 其他4xx说明请求本身有问题,重试无意义;它既不说明主机故障也不说明主机已恢复,
+                        # 不改变熔断器状态和连续失败次数,只释放可能持有的探测名额
+                        logger.error(f"请求失败: {url}, 状态码: {response.status}")
+                        FAILURES.inc(reason=status, **labels)
+                        breaker.abort_probe()
+                        return None
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    reason = f"状态码: {response.status}"
+            except asyncio.TimeoutError:
+                status = "timeout"
+                reason = "请求超时"
+            except aiohttp.ContentTypeError as e:
+                # 响应不是JSON(如被重定向到验证页面),重试无意义
+                logger.error(f"响应格式错误: {url}, 错误: {str(e)}")
+                FAILURES.inc(reason="content_type", **labels)
+                breaker.record_failure()
+                return None
+            except aiohttp.ClientError as e:
+                reason = f"连接错误: {str(e)}"
+            except asyncio.CancelledError:
+                # CancelledError不是Exception的子类;被取消的探测请求必须释放探测名额,
+                # 否则熔断器停留在half_open,之后对该主机的请求永久等待
+                status = "cancelled"
+                breaker.abort_probe()
+                raise
+            except Exception as e:
+                logger.error(f"请求异常: {url}, 错误: {str(e)}")
+                FAILURES.inc(reason="exception", **labels)
+                breaker.record_failure()
+                return None
+            finally:
+                self.host_limiter.release(host)
+                REQUEST_LATENCY.observe(time.perf_counter() - started, **labels)
+                REQUESTS.inc(status=status, **labels)
+
+            breaker.record_failure(retry_after)
+            if attempt >= self.max_attempts:
+                logger.error(f"请求失败: {url}, {reason}, 已重试 {attempt - 1} 次")
+                FAILURES.inc(reason=status, **labels)
+                return None
+            RETRIES.inc(**labels)
+            delay = retry_after if retry_after is not None else backoff_delay(
+                attempt, self.backoff_base, self.backoff_max)
+            delay = min(delay, self.backoff_max)
+            logger.warning(f"请求失败: {url}, {reason}, {delay:.2f} 秒后第 {attempt} 次重试")
+            await asyncio.sleep(delay)
+            if self.request_budget:
+                await self.request_budget.acquire(1)
+        return None
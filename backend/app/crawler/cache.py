@@ -0,0 +1,204 @@
+"""
+HTTP响应磁盘缓存模块
+
+按URL和规范化后的参数缓存接口返回的JSON,压缩后存放在磁盘上,
+按接口类型设置过期时间,总大小超过上限时按最近最少使用淘汰。
+"""
+import os
+import json
+import time
+import zlib
+import hashlib
+import logging
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from app.core.config import config
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 各类接口的默认缓存时间(秒)
+DEFAULT_TTL = {
+    "kline_intraday": 30,        # 分钟K线,盘中持续变化
+    "kline_daily": 300,          # 包含当天的日K线,最后一根仍在变化
+    "kline_history": 7 * 86400,  # 截止日期早于今天的不复权日K线,已收盘不再变化
+    "quote": 30,                 # 行情/估值快照
+    "stock_list": 3600,          # 股票列表
+}
+
+# 不参与缓存键计算的参数(时间戳、回调名等)
+_VOLATILE_PARAMS = {"_", "jsonCallBack", "cb", "random"}
+
+
+class ResponseCache:
+    """压缩存储、带过期时间和LRU淘汰的磁盘缓存"""
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024,
+                 ttl: Optional[Dict[str, int]] = None):
+        """初始化缓存
+
+        Args:
+            directory: 缓存目录
+            max_bytes: 缓存文件总大小上限
+            ttl: 各类接口的缓存时间覆盖
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        # 缓存键 -> 文件大小,按访问顺序排列,最久未使用的在最前
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """扫描缓存目录,按修改时间重建LRU索引"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json.z"):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            entries.append((stat.st_mtime, name[:-len(".json.z")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self.total_bytes += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json.z")
+
+    @staticmethod
+    def make_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """根据URL和规范化后的参数生成缓存键"""
+        normalized = sorted(
+            (str(k), str(v)) for k, v in (params or {}).items()
+            if k not in _VOLATILE_PARAMS and v is not None
+        )
+        raw = json.dumps([url, normalized], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, endpoint: Optional[str], params: Optional[Dict[str, Any]] = None) -> int:
+        """根据接口类型和参数决定缓存时间,0表示不缓存"""
+        params = params or {}
+        if endpoint == "kline":
+            if str(params.get("klt")) == "1":
+                return self.ttl["kline_intraday"]
+            end = str(params.get("end", ""))
+            # 复权价格在每次分红送转后整段历史都会重算,只有不复权(fqt=0)的历史K线不再变化
+            adjusted = str(params.get("fqt", "0")) != "0"
+            if end and end < datetime.now().strftime("%Y%m%d") and not adjusted:
+                return self.ttl["kline_history"]
+            return self.ttl["kline_daily"]
+        if endpoint in ("quote", "quote_batch"):
+            return self.ttl["quote"]
+        if endpoint in ("sse_stock_list", "szse_stock_list"):
+            return self.ttl["stock_list"]
+        return 0
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        with open(self._path(key), "rb") as f:
+            return json.loads(zlib.decompress(f.read()))
+
+    def _write(self, key: str, payload: bytes):
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def _remove(self, key: str):
+        size = self._index.pop(key, None)
+        if size is not None:
+            self.total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    async def get(self, key: str) -> Optional[Any]:
+        """读取缓存,未命中或已过期时返回None"""
+        if key not in self._index:
+            self.misses += 1
+            return None
+        try:
+            entry = await asyncio.to_thread(self._read, key)
+        except (OSError, ValueError, zlib.error) as e:
+            logger.warning(f"读取缓存失败 {key}: {str(e)}")
+            entry = None
+        if not entry or entry.get("expires", 0) < time.time():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if key in self._index:
+            self._index.move_to_end(key)
+            # 更新修改时间,重启后仍能恢复LRU顺序
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+        return entry["data"]
+
+    async def set(self, key: str, data: Any, ttl: int):
+        """写入缓存并在超出容量时淘汰最久未使用的条目"""
+        if ttl <= 0:
+            return
+        payload = zlib.compress(
+            json.dumps({"expires": time.time() + ttl, "data": data}, ensure_ascii=False).encode("utf-8")
+        )
+        if len(payload) > self.max_bytes:
+            return
+        try:
+            await asyncio.to_thread(self._write, key, payload)
+        except OSError as e:
+            logger.warning(f"写入缓存失败 {key}: {str(e)}")
+            return
+
+        self.total_bytes -= self._index.pop(key, 0)
+        self._index[key] = len(payload)
+        self.total_bytes += len(payload)
+        while self.total_bytes > self.max_bytes and self._index:
+            oldest = next(iter(self._index))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计和容量信息"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "evictions": self.evictions,
+            "entries": len(self._index),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """获取进程内共享的响应缓存,未启用时返回None"""
+    global _response_cache
+    settings = config.crawler_cache
+    if not settings.get("enabled", False):
+        return None
+    if _response_cache is None:
+        directory = settings.get("directory") or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "cache", "http"
+        )
+        _response_cache = ResponseCache(
+            directory=directory,
+            max_bytes=settings.get("max_bytes", 256 * 1024 * 1024),
+            ttl=settings.get("ttl")
+        )
+        logger.info(f"HTTP响应缓存已启用: {directory}")
+    return _response_cache
@@ -0,0 +1,202 @@
+"""
+爬取任务检查点模块
+
+把爬取任务和逐支股票的完成情况持久化到数据库,进程重启后可以用同一个任务ID续跑,
+跳过已经成功且数据仍新鲜的股票,只重试失败或尚未处理的股票。
+"""
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import AsyncSessionLocal
+from app.models import CrawlRun, CrawlRunItem
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class CrawlLedger:
+    """单个爬取任务的完成台账"""
+
+    def __init__(self, run_id: str):
+        """初始化台账
+
+        Args:
+            run_id: 任务ID
+        """
+        self.run_id = run_id
+
+    @staticmethod
+    async def get_run(run_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务信息,不存在时返回None"""
+        async with AsyncSessionLocal() as session:
+            run = await session.get(CrawlRun, run_id)
+            if not run:
+                return None
+            return {
+                "run_id": run.id,
+                "status": run.status,
+                "params": json.loads(run.params or "{}"),
+                "total": run.total,
+                "completed": run.completed,
+                "failed": run.failed,
+                "error": run.error,
+                "created_at": run.created_at,
+                "updated_at": run.updated_at,
+            }
+
+    @staticmethod
+    def _item_count(status: str):
+        """按任务统计某状态股票数量的关联子查询,用于UPDATE crawl_runs时汇总进度"""
+        return (
+            select(func.count())
+            .where(CrawlRunItem.run_id == CrawlRun.id, CrawlRunItem.status == status)
+            .scalar_subquery()
+        )
+
+    @staticmethod
+    async def mark_interrupted_runs() -> int:
+        """将上次进程退出时仍在运行的任务标记为interrupted并汇总完成和失败数量,应用启动时调用
+
+        Returns:
+            被标记的任务数量
+        """
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                update(CrawlRun)
+                .where(CrawlRun.status == "running")
+                .values(
+                    status="interrupted",
+                    completed=CrawlLedger._item_count("completed"),
+                    failed=CrawlLedger._item_count("failed"),
+                    updated_at=datetime.now()
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            if result.rowcount:
+                logger.info(f"{result.rowcount} 个未完成的爬取任务已标记为中断,可使用相同run_id续跑")
+            return result.rowcount
+
+    async def start(self, params: Dict[str, Any]) -> bool:
+        """创建任务或将已有任务重新置为运行状态
+
+        Args:
+            params: 启动参数
+
+        Returns:
+            任务此前是否已存在(即本次为续跑)
+        """
+        now = datetime.now()
+        async with AsyncSessionLocal() as session:
+            run = await session.get(CrawlRun, self.run_id)
+            resumed = run is not None
+            if run:
+                run.status = "running"
+                run.error = None
+                run.updated_at = now
+            else:
+                session.add(CrawlRun(
+                    id=self.run_id,
+                    status="running",
+                    params=json.dumps(params, ensure_ascii=False),
+                    created_at=now,
+                    updated_at=now
+                ))
+            await session.commit()
+            return resumed
+
+    async def register_stocks(self, stocks: List[Dict[str, str]]):
+        """登记本次任务需要处理的股票,已登记的股票保持原状态"""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(CrawlRunItem.code).where(CrawlRunItem.run_id == self.run_id)
+            )
+            existing = set(result.scalars().all())
+            session.add_all([
+                CrawlRunItem(
+                    run_id=self.run_id,
+                    code=stock['code'],
+                    name=stock.get('name'),
+                    market=stock.get('market'),
+                    status="pending"
+                )
+                for stock in stocks if stock['code'] not in existing
+            ])
+            await session.execute(
+                update(CrawlRun)
+                .where(CrawlRun.id == self.run_id)
+                .values(total=len(existing | {stock['code'] for stock in stocks}))
+            )
+            await session.commit()
+
+    async def plan(self, fresh_hours: float) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """划分续跑时需要处理和可以跳过的股票
+
+        Args:
+            fresh_hours: 完成时间在该小时数以内的股票视为数据新鲜
+
+        Returns:
+            (需要处理的股票, 跳过的股票)
+        """
+        fresh_after = datetime.now() - timedelta(hours=fresh_hours)
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(CrawlRunItem).where(CrawlRunItem.run_id == self.run_id).order_by(CrawlRunItem.id)
+            )
+            todo, skipped = [], []
+            for item in result.scalars().all():
+                stock = {'code': item.code, 'name': item.name, 'market': item.market}
+                if item.status == "completed" and item.updated_at and item.updated_at >= fresh_after:
+                    skipped.append(stock)
+                else:
+                    todo.append(stock)
+            return todo, skipped
+
+    async def mark(self, codes: List[str], status: str, error: Optional[str] = None,
+                   session: Optional[AsyncSession] = None):
+        """记录一批股票的处理结果
+
+        爬取过程中经写入缓冲调用,与股票数据在同一个事务中提交(见IngestBuffer.submit_stock)。
+
+        Args:
+            codes: 股票代码列表
+            status: completed或failed
+            error: 失败原因
+            session: 数据库会话,给定时不提交事务;默认新建会话并提交
+        """
+        if not codes:
+            return
+        stmt = (
+            update(CrawlRunItem)
+            .where(CrawlRunItem.run_id == self.run_id, CrawlRunItem.code.in_(codes))
+            .values(status=status, error=error, updated_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        if session is not None:
+            await session.execute(stmt)
+            return
+        async with AsyncSessionLocal() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def finish(self, status: str, error: Optional[str] = None):
+        """结束任务并汇总完成和失败数量"""
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(CrawlRun)
+                .where(CrawlRun.id == self.run_id)
+                .values(
+                    status=status,
+                    error=error,
+                    completed=self._item_count("completed"),
+                    failed=self._item_count("failed"),
+                    updated_at=datetime.now()
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
@@ -3,73 +3,226 @@
 """
 import logging
 from datetime import datetime
-from typing import Dict, Any, List, Optional
-from sqlalchemy import select, delete
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import AsyncSessionLocal
-from app.models import Stock, KLineData, FinancialData
+from app.core.config import config
+from app.core.database import AsyncSessionLocal, engine
+from app.core.kline_store import get_kline_store
+from app.models import Stock, KLineData, FinancialData, LatestFinancialData
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# K线自然键和upsert时更新的字段
+KLINE_NATURAL_KEY = ["stock_id", "resolution", "date"]
+KLINE_VALUE_COLUMNS = ["open", "high", "low", "close", "volume", "turnover"]
+# 财务快照中随日期变化的字段
+FINANCIAL_VALUE_COLUMNS = ["pe_ratio", "pb_ratio", "total_market_value", "circulating_market_value",
+                           "revenue", "net_profit", "roe"]
+
 class DataProcessor:
     """爬虫数据处理类"""
+
+    @staticmethod
+    async def get_last_kline_dates(code: str) -> Dict[str, datetime]:
+        """查询股票每种时间粒度最后一根已存K线的时间
+
+        Args:
+            code: 股票代码
+
+        Returns:
+            时间粒度到最后K线时间的映射,没有数据的时间粒度不包含在内
+        """
+        store = get_kline_store()
+        if not store.in_database:
+            stock_ids = await DataProcessor.get_stock_ids([code])
+            return await store.last_dates(stock_ids[code]) if code in stock_ids else {}
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(KLineData.resolution, func.max(KLineData.date))
+                .join(Stock, Stock.id == KLineData.stock_id)
+                .where(Stock.code == code)
+                .group_by(KLineData.resolution)
+            )
+            return {resolution: last_date for resolution, last_date in result.all() if last_date}
+
+    @staticmethod
+    async def get_last_kline_dates_many(codes: List[str], resolution: str) -> Dict[str, datetime]:
+        """一次查询多支股票某种时间粒度最后一根已存K线的时间
+
+        Args:
+            codes: 股票代码列表
+            resolution: 时间粒度
+
+        Returns:
+            股票代码到最后K线时间的映射,没有数据的股票不包含在内
+        """
+        if not codes:
+            return {}
+        store = get_kline_store()
+        if not store.in_database:
+            result = {}
+            for code, stock_id in (await DataProcessor.get_stock_ids(codes)).items():
+                last_date = (await store.last_dates(stock_id)).get(resolution)
+                if last_date:
+                    result[code] = last_date
+            return result
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Stock.code, func.max(KLineData.date))
+                .join(KLineData, Stock.id == KLineData.stock_id)
+                .where(Stock.code.in_(codes), KLineData.resolution == resolution)
+                .group_by(Stock.code)
+            )
+            return {code: last_date for code, last_date in result.all() if last_date}
+
+    @staticmethod
+    async def get_stock_ids(codes: List[str]) -> Dict[str, int]:
+        """查询股票代码对应的数据库ID,不存在的股票不包含在内"""
+        if not codes:
+            return {}
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Stock.code, Stock.id).where(Stock.code.in_(codes))
+            )
+            return dict(result.all())
+
+    @staticmethod
+    def _upsert_statement(model, index_elements: List[str], update_columns: List[str], newer_only: bool = False):
+        """构造INSERT ... ON CONFLICT DO UPDATE语句
+
+        Args:
+            model: ORM模型
+            index_elements: 冲突判断使用的唯一键字段
+            update_columns: 冲突时更新的字段
+            newer_only: 只在新数据的date不早于已有数据时更新
+        """
+        if engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(model)
+        return stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: stmt.excluded[column] for column in update_columns},
+            where=(model.date <= stmt.excluded.date) if newer_only else None
+        )
+
+    @staticmethod
+    def _kline_upsert_statement():
+        """构造按(stock_id, resolution, date)冲突时更新价格和成交字段的INSERT语句"""
+        return DataProcessor._upsert_statement(KLineData, KLINE_NATURAL_KEY, KLINE_VALUE_COLUMNS)
+
+    @staticmethod
+    async def save_financial_snapshot(session: AsyncSession, stock_id: int, financial: Dict[str, Any]):
+        """写入当天的财务快照并更新最新快照表,不提交事务
+
+        历史快照只追加,同一天重复写入时覆盖当天的快照;最新快照表只接受不早于已有快照的数据。
+
+        Args:
+            session: 数据库会话
+            stock_id: 股票ID
+            financial: 财务数据字典,date为空时使用当前时间
+        """
+        date = financial.get('date') or datetime.now()
+        snapshot = {column: financial.get(column) for column in FINANCIAL_VALUE_COLUMNS}
+        snapshot.update(stock_id=stock_id, date=date.replace(hour=0, minute=0, second=0, microsecond=0))
+        await session.execute(
+            DataProcessor._upsert_statement(FinancialData, ["stock_id", "date"], FINANCIAL_VALUE_COLUMNS),
+            snapshot
+        )
+        await session.execute(
+            DataProcessor._upsert_statement(LatestFinancialData, ["stock_id"], ["date", *FINANCIAL_VALUE_COLUMNS],
+                                            newer_only=True),
+            snapshot
+        )
+
+    @staticmethod
+    async def bulk_upsert_klines(session: AsyncSession, stock_id: int, klines: List[Dict[str, Any]]) -> int:
+        """在给定会话中批量upsert一支股票的K线,不提交事务
+
+        使用Core层INSERT ... ON CONFLICT DO UPDATE按批executemany,只涉及本次获取到的
+        时间粒度和时间点,不构建ORM对象。
+
+        Args:
+            session: 数据库会话
+            stock_id: 股票ID
+            klines: K线字典列表
+
+        Returns:
+            写入的行数
+        """
+        if not klines:
+            return 0
+        stmt = DataProcessor._kline_upsert_statement()
+        rows = [{'stock_id': stock_id, **kline} for kline in klines]
+        batch_size = config.database_kline_batch_size
+        for i in range(0, len(rows), batch_size):
+            await session.execute(stmt, rows[i:i + batch_size])
+        return len(rows)
     
     @staticmethod
-    async def save_to_db(data: Dict[str, Any]):
-        """保存数据到数据库
-        
+    async def save_stock_list(stocks: List[Dict[str, str]]):
+        """批量写入股票基本信息,已存在的股票只更新名称和市场
+
         Args:
-            data: 股票数据,包含基本信息、K线和财务数据
+            stocks: 股票列表,每个元素包含code、name、market字段
         """
+        if not stocks:
+            return
         async with AsyncSessionLocal() as session:
             try:
+                by_code = {stock['code']: stock for stock in stocks}
                 result = await session.execute(
-                    select(Stock).where(Stock.code == data['code'])
+                    select(Stock).where(Stock.code.in_(list(by_code)))
                 )
-                existing_stock = result.scalar_one_or_none()
-
-                if existing_stock:
-                    existing_stock.name = data['name']
-                    existing_stock.market = data['market']
-                    existing_stock.updated_at = datetime.now()
-                    stock = existing_stock
-                else:
-                    stock = Stock(
-                        code=data['code'],
-                        name=data['name'],
-                        market=data['market'],
-                        updated_at=datetime.now()
-                    )
-                    session.add(stock)
-
+                for existing in result.scalars().all():
+                    info = by_code.pop(existing.code)
+                    existing.name = info['name']
+                    existing.market = info['market']
+                session.add_all([
+                    Stock(code=info['code'], name=info['name'], market=info['market'])
+                    for info in by_code.values()
+                ])
                 await session.commit()
-                await session.refresh(stock)
-
-                if data.get('klines'):
-                    delete_stmt = delete(KLineData).where(KLineData.stock_id == stock.id)
-                    await session.execute(delete_stmt)
-                    klines = [KLineData(stock_id=stock.id, **kline) for kline in data['klines']]
-                    session.add_all(klines)
-
-                if data.get('financial'):
-                    result = await session.execute(
-                        select(FinancialData).where(FinancialData.stock_id == stock.id)
-                    )
-                    existing_financial = result.scalar_one_or_none()
-
-                    if existing_financial:
-                        for key, value in data['financial'].items():
-                            setattr(existing_financial, key, value)
-                    else:
-                        financial = FinancialData(stock_id=stock.id, **data['financial'])
-                        session.add(financial)
-
-                await session.commit()
-                logger.info(f"已保存股票数据: {data['code']}")
-                return True
-                
             except Exception as e:
                 await session.rollback()
-                logger.error(f"保存数据失败 {data['code']}: {str(e)}", exc_info=True)
+                logger.error(f"保存股票列表失败: {str(e)}", exc_info=True)
                 raise
+
+    @staticmethod
+    async def write_stock(session: AsyncSession, data: Dict[str, Any]) -> int:
+        """在给定会话中写入一支股票的基本信息、K线和财务数据,不提交事务
+
+        Returns:
+            写入的K线行数
+        """
+        result = await session.execute(
+            select(Stock).where(Stock.code == data['code'])
+        )
+        existing_stock = result.scalar_one_or_none()
+
+        if existing_stock:
+            existing_stock.name = data['name']
+            existing_stock.market = data['market']
+            existing_stock.updated_at = datetime.now()
+            stock = existing_stock
+        else:
+            stock = Stock(
+                code=data['code'],
+                name=data['name'],
+                market=data['market'],
+                updated_at=datetime.now()
+            )
+            session.add(stock)
+            # 只flush以分配ID,与K线在同一事务中提交
+            await session.flush()
+
+        # 按时间upsert,只涉及本次获取到的时间粒度和时间点
+        rows_written = await get_kline_store().write(session, stock.id, data.get('klines') or [])
+
+        if data.get('financial'):
+            await DataProcessor.save_financial_snapshot(session, stock.id, data['financial'])
+        return rows_written
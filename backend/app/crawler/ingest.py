@@ -0,0 +1,305 @@
+"""
+写入缓冲模块
+
+进程内所有爬取任务(批量爬取、流水线、调度器、盘中轮询、回填、单支刷新)不直接写库,
+而是把解析好的股票数据和K线放入同一个写入缓冲,由唯一的写库协程按批取出,在一个事务中
+提交。生产者只在缓冲超过内存上限时等待,SQLite的单写者也不再被多个任务争用。
+"""
+import time
+import logging
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import config
+from app.core.database import AsyncSessionLocal, run_after_commit, discard_after_commit
+from app.core.kline_store import get_kline_store
+from app.crawler.checkpoint import CrawlLedger
+from app.crawler.data_processor import DataProcessor
+from app.utils.metrics import (
+    ROWS_WRITTEN, INGEST_QUEUE_DEPTH, INGEST_BUFFERED_BYTES, INGEST_WRITE_LAG,
+    INGEST_COMMIT_SECONDS, INGEST_BATCH_SIZE
+)
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 估算内存占用时每根K线字典和每个条目的字节数
+KLINE_ROW_BYTES = 600
+ENTRY_BYTES = 2048
+
+
+@dataclass
+class _Entry:
+    """缓冲中的一个待写入条目"""
+    key: str  # 日志中使用的标识,如股票代码
+    write: Callable[[AsyncSession], Awaitable[int]]  # 在会话中写入,返回K线行数
+    size: int  # 估算字节数
+    future: asyncio.Future
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class IngestBuffer:
+    """写后缓冲: 多个生产者入队,一个写库协程按批提交"""
+
+    def __init__(self, max_batch: Optional[int] = None, max_delay: Optional[float] = None,
+                 max_buffered_mb: Optional[float] = None):
+        """初始化缓冲
+
+        Args:
+            max_batch: 每批最多提交的条目数,默认读取配置database.ingest
+            max_delay: 取到第一个条目后最多再等待多少秒凑批
+            max_buffered_mb: 缓冲的内存上限(估算),超过时生产者等待
+        """
+        settings = config.database_ingest
+        self.max_batch = max(1, max_batch or settings.get('max_batch', 50))
+        self.max_delay = settings.get('max_delay', 0.05) if max_delay is None else max_delay
+        self.max_bytes = int((max_buffered_mb or settings.get('max_buffered_mb', 64)) * 2 ** 20)
+        self.buffered_bytes = 0
+        self.commits = 0
+        self.failed = 0
+        self._queue: deque = deque()
+        self._inflight = 0
+        self._changed = asyncio.Condition()
+        self._writer: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._writer is not None and not self._writer.done()
+
+    def _update_gauges(self):
+        INGEST_QUEUE_DEPTH.set(len(self._queue) + self._inflight)
+        INGEST_BUFFERED_BYTES.set(self.buffered_bytes)
+
+    async def _submit(self, key: str, write: Callable[[AsyncSession], Awaitable[int]], rows: int) -> asyncio.Future:
+        """入队一个条目,缓冲超过内存上限时等待写库协程腾出空间
+
+        Returns:
+            条目提交完成时完成的Future,写入失败时带有异常
+        """
+        if self._stopping:
+            raise RuntimeError("写入缓冲已停止")
+        if not self.running:
+            self._writer = asyncio.ensure_future(self._run())
+        size = ENTRY_BYTES + rows * KLINE_ROW_BYTES
+        async with self._changed:
+            # 缓冲为空时总是放行,单个条目超过上限也能写入
+            await self._changed.wait_for(
+                lambda: self.buffered_bytes == 0 or self.buffered_bytes + size <= self.max_bytes
+            )
+            entry = _Entry(key, write, size, asyncio.get_running_loop().create_future())
+            self._queue.append(entry)
+            self.buffered_bytes += size
+            self._update_gauges()
+            self._changed.notify_all()
+        return entry.future
+
+    async def submit_stock(self, data: Dict[str, Any], ledger: Optional[CrawlLedger] = None) -> asyncio.Future:
+        """入队一支股票的基本信息、K线和财务数据,不等待提交
+
+        Args:
+            data: 股票数据(基本信息、klines、financial),格式同DataProcessor.write_stock
+            ledger: 任务台账,给定时在同一事务中将该股票记为completed,
+                    数据和台账记录一起提交或回滚
+        """
+        async def write(session: AsyncSession) -> int:
+            rows = await DataProcessor.write_stock(session, data)
+            if ledger:
+                await ledger.mark([data['code']], "completed", session=session)
+            return rows
+
+        return await self._submit(data['code'], write, len(data.get('klines') or []))
+
+    async def save(self, data: Dict[str, Any], ledger: Optional[CrawlLedger] = None):
+        """入队一支股票的数据并等待提交,参数同submit_stock
+
+        Raises:
+            Exception: 写入失败的原始异常
+        """
+        await (await self.submit_stock(data, ledger))
+
+    async def save_many(self, items: List[Dict[str, Any]], ledger: Optional[CrawlLedger] = None) -> List[str]:
+        """入队多支股票的数据并等待全部提交,ledger同submit_stock
+
+        Returns:
+            写入失败的股票代码列表
+        """
+        futures = [await self.submit_stock(data, ledger) for data in items]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return [data['code'] for data, result in zip(items, results) if isinstance(result, Exception)]
+
+    async def upsert_klines(self, items: List[Tuple[int, List[Dict[str, Any]]]]):
+        """入队多支股票的K线并等待全部提交
+
+        Args:
+            items: (股票ID, K线列表)的列表
+
+        Raises:
+            Exception: 任一股票写入失败时抛出第一个异常
+        """
+        store = get_kline_store()
+        futures = []
+        for stock_id, klines in items:
+            if klines:
+                futures.append(await self._submit(
+                    f"stock_id={stock_id}",
+                    lambda session, stock_id=stock_id, klines=klines: store.write(session, stock_id, klines),
+                    len(klines)
+                ))
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def mark(self, ledger: CrawlLedger, codes: List[str], status: str, error: Optional[str] = None):
+        """入队一批股票的台账记录并等待提交,参数同CrawlLedger.mark
+
+        Raises:
+            Exception: 写入失败的原始异常
+        """
+        if not codes:
+            return
+
+        async def write(session: AsyncSession) -> int:
+            await ledger.mark(codes, status, error, session=session)
+            return 0
+
+        await (await self._submit(f"ledger={ledger.run_id}", write, 0))
+
+    async def _next_batch(self) -> List[_Entry]:
+        """等待第一个条目,再在max_delay内凑满一批"""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._queue or self._stopping)
+            if self.max_delay and len(self._queue) < self.max_batch and not self._stopping:
+                try:
+                    await asyncio.wait_for(
+                        self._changed.wait_for(lambda: len(self._queue) >= self.max_batch or self._stopping),
+                        self.max_delay
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            self._inflight = len(batch)
+            return batch
+
+    async def _write(self, entries: List[_Entry]) -> int:
+        """在一个事务中写入条目,提交后执行登记的提交后操作(如列式K线文件),返回K线行数"""
+        async with AsyncSessionLocal() as session:
+            try:
+                rows = 0
+                for entry in entries:
+                    rows += await entry.write(session)
+                await session.commit()
+            except Exception:
+                discard_after_commit(session)
+                await session.rollback()
+                raise
+            await run_after_commit(session)
+            return rows
+
+    async def _commit(self, batch: List[_Entry]):
+        """提交一批条目;整批失败时逐条重试,保证每个条目要么全部写入、要么全部不写入"""
+        start = time.perf_counter()
+        results: Dict[int, Optional[Exception]] = {}
+        try:
+            ROWS_WRITTEN.inc(await self._write(batch))
+            results = {id(entry): None for entry in batch}
+        except Exception as e:
+            if len(batch) == 1:
+                results[id(batch[0])] = e
+            else:
+                logger.warning(f"批量写入 {len(batch)} 个条目失败,改为逐条写入: {str(e)}")
+                for entry in batch:
+                    try:
+                        ROWS_WRITTEN.inc(await self._write([entry]))
+                        results[id(entry)] = None
+                    except Exception as entry_error:
+                        results[id(entry)] = entry_error
+        self.commits += 1
+        INGEST_COMMIT_SECONDS.observe(time.perf_counter() - start)
+        INGEST_BATCH_SIZE.observe(len(batch))
+
+        now = time.monotonic()
+        for entry in batch:
+            error = results[id(entry)]
+            INGEST_WRITE_LAG.observe(now - entry.enqueued)
+            if error is not None:
+                self.failed += 1
+                logger.error(f"保存数据失败 {entry.key}: {str(error)}")
+            if entry.future.done():
+                continue
+            if error is None:
+                entry.future.set_result(True)
+            else:
+                entry.future.set_exception(error)
+        logger.info(f"写入缓冲已提交 {len(batch)} 个条目, 剩余 {len(self._queue)}")
+
+    async def _run(self):
+        """写库协程: 不断取出一批条目提交,停止时写完剩余条目后退出"""
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                if self._stopping:
+                    return
+                continue
+            try:
+                await self._commit(batch)
+            except Exception as e:
+                # _commit不应抛出异常,这里兜底避免写库协程退出导致生产者永久等待
+                logger.error(f"写入缓冲提交失败: {str(e)}", exc_info=True)
+                for entry in batch:
+                    if not entry.future.done():
+                        entry.future.set_exception(e)
+            async with self._changed:
+                self.buffered_bytes -= sum(entry.size for entry in batch)
+                self._inflight = 0
+                self._update_gauges()
+                self._changed.notify_all()
+
+    async def flush(self):
+        """等待当前已入队的条目全部提交"""
+        async with self._changed:
+            await self._changed.wait_for(lambda: not self._queue and not self._inflight or not self.running)
+
+    async def stop(self):
+        """写完剩余条目后停止写库协程"""
+        if not self.running:
+            return
+        async with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        await self._writer
+        logger.info(f"写入缓冲已停止: 共提交 {self.commits} 批, 失败 {self.failed} 个条目")
+
+    def status(self) -> Dict[str, Any]:
+        """返回缓冲状态"""
+        return {
+            "running": self.running,
+            "queued": len(self._queue),
+            "inflight": self._inflight,
+            "buffered_bytes": self.buffered_bytes,
+            "max_bytes": self.max_bytes,
+            "commits": self.commits,
+            "failed": self.failed,
+        }
+
+
+_buffer: Optional[IngestBuffer] = None
+
+
+def get_ingest_buffer() -> IngestBuffer:
+    """获取进程内的写入缓冲,停止后再次获取时新建"""
+    global _buffer
+    if _buffer is None or _buffer._stopping:
+        _buffer = IngestBuffer()
+    return _buffer
+
+
+async def stop_ingest_buffer():
+    """写完缓冲中剩余的数据并停止写库协程,应用关闭时调用"""
+    if _buffer:
+        await _buffer.stop()
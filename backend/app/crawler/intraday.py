@@ -0,0 +1,254 @@
+"""
+盘中分钟线轮询模块
+
+交易时段内每分钟唤醒一次,只为关注列表中的股票请求最后一根已存分钟K线之后的K线,
+并原地更新仍在形成中的最后一根K线,单次轮询的开销只与新K线数量有关。
+"""
+import time
+import logging
+import asyncio
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+from app.core.config import config
+from app.crawler.base import guess_market
+from app.crawler.data_processor import DataProcessor
+from app.crawler.ingest import get_ingest_buffer
+from app.crawler.kline_parser import parse_kline_rows
+from app.crawler.stock_crawler import StockCrawler
+from app.utils.metrics import ROWS_PARSED
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 每个交易日的分钟K线数量: 上午9:31-11:30和下午13:01-15:00各120根
+MINUTES_PER_DAY = 240
+
+_MORNING_OPEN = 9 * 60 + 30
+_MORNING_CLOSE = 11 * 60 + 30
+_AFTERNOON_OPEN = 13 * 60
+_AFTERNOON_CLOSE = 15 * 60
+
+
+def minute_index(dt: datetime) -> int:
+    """返回dt在当天交易时段中的分钟序号,9:31为1,11:30为120,13:01为121,15:00为240"""
+    minutes = dt.hour * 60 + dt.minute
+    if minutes <= _MORNING_OPEN:
+        return 0
+    if minutes <= _MORNING_CLOSE:
+        return minutes - _MORNING_OPEN
+    if minutes <= _AFTERNOON_OPEN:
+        return 120
+    return 120 + min(minutes - _AFTERNOON_OPEN, 120)
+
+
+def is_trading_time(dt: datetime, grace_minutes: int = 1) -> bool:
+    """判断是否处于交易时段(不含节假日),收盘后grace_minutes分钟内仍视为交易时段以获取最后一根K线"""
+    if dt.weekday() >= 5:
+        return False
+    minutes = dt.hour * 60 + dt.minute
+    return (_MORNING_OPEN <= minutes <= _MORNING_CLOSE + grace_minutes or
+            _AFTERNOON_OPEN <= minutes <= _AFTERNOON_CLOSE + grace_minutes)
+
+
+def previous_trading_day(day: date) -> date:
+    """返回day之前最近的工作日(不含节假日)"""
+    day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def has_gap(last_bar: Optional[datetime], now: datetime) -> bool:
+    """最后一根已存K线是否早于上一交易日
+
+    服务停止、重启或跨节假日后出现这种情况,此时按数量(lmt)从最新一根往前取只能覆盖
+    今天和上一交易日的尾部,中间的交易日会被跳过,需要改为按日期范围获取。
+    """
+    return last_bar is not None and last_bar.date() < previous_trading_day(now.date())
+
+
+def bars_needed(last_bar: Optional[datetime], now: datetime) -> int:
+    """计算需要请求的最近K线数量,包含最后一根已存K线以便原地更新
+
+    只适用于最后一根K线在今天或上一交易日的情况,更早时见has_gap
+
+    Args:
+        last_bar: 最后一根已存分钟K线的时间,没有数据时为None
+        now: 当前时间
+
+    Returns:
+        请求的K线数量(lmt参数)
+    """
+    now_index = minute_index(now)
+    if last_bar is None:
+        return max(now_index, 1)
+    if last_bar.date() == now.date():
+        return max(now_index - minute_index(last_bar), 0) + 1
+    # 最后一根K线在之前的交易日: 补齐该日剩余部分和今天已走完的分钟
+    return now_index + max(MINUTES_PER_DAY - minute_index(last_bar), 0) + 1
+
+
+class IntradayPoller:
+    """盘中分钟线轮询器"""
+
+    def __init__(self, codes: Optional[List[str]] = None, interval: Optional[float] = None,
+                 delay: Optional[float] = None):
+        """初始化轮询器
+
+        Args:
+            codes: 关注的股票代码,默认读取配置crawler.intraday.watchlist
+            interval: 轮询间隔(秒)
+            delay: 每个整分钟之后延迟多少秒再轮询,等待上一分钟K线收盘
+        """
+        settings = config.crawler_intraday
+        self.codes = list(dict.fromkeys(codes or settings.get('watchlist', [])))
+        self.interval = interval or settings.get('interval', 60)
+        self.delay = settings.get('delay', 3) if delay is None else delay
+        self.crawler = StockCrawler(use_cache=False)
+        self.stock_ids: Dict[str, int] = {}
+        self.last_bars: Dict[str, datetime] = {}
+        self.cycles = 0
+        self.last_cycle: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _prepare(self):
+        """查询股票ID和最后一根已存分钟K线,数据库中没有的股票先登记"""
+        self.stock_ids = await DataProcessor.get_stock_ids(self.codes)
+        missing = [code for code in self.codes if code not in self.stock_ids]
+        if missing:
+            # 名称暂用代码,下次同步股票列表时更新
+            await DataProcessor.save_stock_list([
+                {'code': code, 'name': code, 'market': guess_market(code)} for code in missing
+            ])
+            self.stock_ids = await DataProcessor.get_stock_ids(self.codes)
+        self.last_bars = await DataProcessor.get_last_kline_dates_many(self.codes, "1m")
+
+    async def _poll_stock(self, code: str, now: datetime) -> Optional[List[Dict[str, Any]]]:
+        """获取单支股票最后一根已存K线及之后的分钟K线,请求失败时返回None"""
+        last_bar = self.last_bars.get(code)
+        if has_gap(last_bar, now):
+            logger.info(f"最后一根分钟K线 {last_bar} 早于上一交易日,按日期范围补齐: {code}")
+            lines = await self.crawler.fetch_kline_lines(code, guess_market(code), "1m", since=last_bar)
+        else:
+            lines = await self.crawler.fetch_kline_lines(
+                code, guess_market(code), "1m", limit=bars_needed(last_bar, now)
+            )
+        if lines is None:
+            return None
+        rows = parse_kline_rows(lines, "1m", last_bar)
+        ROWS_PARSED.inc(len(rows), resolution="1m")
+        return rows
+
+    async def poll_once(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """执行一次轮询并写入数据库
+
+        Args:
+            now: 当前时间,默认datetime.now()
+
+        Returns:
+            本次轮询的统计信息
+        """
+        now = now or datetime.now()
+        start = time.perf_counter()
+        if not self.stock_ids:
+            await self._prepare()
+
+        codes = [code for code in self.codes if code in self.stock_ids]
+        results = await asyncio.gather(*(self._poll_stock(code, now) for code in codes))
+        items, failed, bars = [], [], 0
+        for code, rows in zip(codes, results):
+            if rows is None:
+                failed.append(code)
+            elif rows:
+                items.append((self.stock_ids[code], rows))
+                bars += len(rows)
+        await get_ingest_buffer().upsert_klines(items)
+        for code, rows in zip(codes, results):
+            if rows:
+                self.last_bars[code] = max(row['date'] for row in rows)
+
+        self.cycles += 1
+        self.last_cycle = {
+            "time": now,
+            "stocks": len(codes),
+            "bars": bars,
+            "failed": failed,
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        logger.info(f"盘中轮询完成: {len(codes)} 支股票, {bars} 根K线, 失败 {len(failed)}, "
+                    f"耗时 {self.last_cycle['seconds']}s")
+        return self.last_cycle
+
+    def _seconds_until_next_tick(self) -> float:
+        """距离下一个轮询时刻(整interval之后delay秒)的秒数"""
+        now = time.time()
+        next_tick = ((now - self.delay) // self.interval + 1) * self.interval + self.delay
+        return max(next_tick - now, 0.1)
+
+    async def _run(self):
+        logger.info(f"盘中轮询已启动: {len(self.codes)} 支股票, 间隔 {self.interval}s")
+        while True:
+            now = datetime.now()
+            if is_trading_time(now):
+                try:
+                    await self.poll_once(now)
+                except Exception as e:
+                    logger.error(f"盘中轮询失败: {str(e)}", exc_info=True)
+            await asyncio.sleep(self._seconds_until_next_tick())
+
+    def start(self):
+        """在后台启动轮询"""
+        if not self.running:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """停止轮询"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("盘中轮询已停止")
+
+    def status(self) -> Dict[str, Any]:
+        """返回轮询器状态"""
+        return {
+            "running": self.running,
+            "codes": self.codes,
+            "interval": self.interval,
+            "trading": is_trading_time(datetime.now()),
+            "cycles": self.cycles,
+            "last_cycle": self.last_cycle,
+            "last_bars": self.last_bars,
+        }
+
+
+_poller: Optional[IntradayPoller] = None
+
+
+def get_intraday_poller() -> Optional[IntradayPoller]:
+    """获取当前的盘中轮询器,未启动过时返回None"""
+    return _poller
+
+
+async def start_intraday_poller(codes: Optional[List[str]] = None,
+                                interval: Optional[float] = None) -> IntradayPoller:
+    """启动盘中轮询,已在运行时先停止再按新的关注列表启动"""
+    global _poller
+    await stop_intraday_poller()
+    _poller = IntradayPoller(codes=codes, interval=interval)
+    _poller.start()
+    return _poller
+
+
+async def stop_intraday_poller():
+    """停止盘中轮询"""
+    if _poller:
+        await _poller.stop()
@@ -0,0 +1,233 @@
+"""
+K线数据批量解析模块
+
+将东方财富接口返回的 "日期,开盘,收盘,最高,最低,成交量,成交额,..." 字符串数组
+一次性解析为NumPy列数组,避免逐行调用strptime和float。
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 日期之后依次为这些数值字段,其余字段(振幅等)忽略
+VALUE_FIELDS = ('open', 'close', 'high', 'low', 'volume', 'turnover')
+MIN_FIELDS = 1 + len(VALUE_FIELDS)
+
+# 日期字符串格式: 日线 "YYYY-MM-DD",分钟线 "YYYY-MM-DD HH:MM"
+_DATE_LEN = {"1d": 10, "1m": 16}
+_DIGIT_POS = {
+    10: (0, 1, 2, 3, 5, 6, 8, 9),
+    16: (0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15),
+}
+_SEPARATORS = {
+    10: ((4, '-'), (7, '-')),
+    16: ((4, '-'), (7, '-'), (10, ' '), (13, ':')),
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_timestamp(value: datetime) -> int:
+    """将naive datetime转换为秒级时间戳(按UTC换算,与parse_klines一致)"""
+    return int((value - _EPOCH).total_seconds())
+
+
+@dataclass
+class KLineColumns:
+    """列式K线数据
+
+    timestamps为秒级int64时间戳,按UTC换算naive的本地时间,
+    转回datetime后与数据库中存储的时间一致。
+    """
+    timestamps: np.ndarray
+    open: np.ndarray
+    close: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    volume: np.ndarray
+    turnover: np.ndarray
+    invalid_rows: np.ndarray  # 解析失败的原始行号
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def select(self, mask: np.ndarray) -> "KLineColumns":
+        """按布尔掩码筛选行"""
+        return KLineColumns(
+            timestamps=self.timestamps[mask],
+            **{field: getattr(self, field)[mask] for field in VALUE_FIELDS},
+            invalid_rows=self.invalid_rows
+        )
+
+    def since(self, start: datetime) -> "KLineColumns":
+        """只保留不早于start的K线"""
+        return self.select(self.timestamps >= to_timestamp(start))
+
+    def to_datetimes(self) -> List[datetime]:
+        """将时间戳转换为datetime列表"""
+        return self.timestamps.astype('datetime64[s]').astype(object).tolist()
+
+    def to_rows(self, resolution: str) -> List[Dict[str, Any]]:
+        """转换为K线字典列表,可直接用于构造KLineData"""
+        columns = [getattr(self, field).tolist() for field in VALUE_FIELDS]
+        return [
+            {'date': date, 'resolution': resolution, **dict(zip(VALUE_FIELDS, values))}
+            for date, *values in zip(self.to_datetimes(), *columns)
+        ]
+
+
+def _split_fields(lines: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """将字符串数组切分为 (行数, MIN_FIELDS) 的字段矩阵
+
+    字段数相同的行拼接后统一split,每种字段数只需一次切分。
+
+    Returns:
+        (字段矩阵, 字段数是否足够的掩码)
+    """
+    counts = np.char.count(lines, ',') + 1
+    fields = np.full((len(lines), MIN_FIELDS), '0', dtype=object)
+    enough = counts >= MIN_FIELDS
+    for count in np.unique(counts[enough]):
+        rows = np.flatnonzero(counts == count)
+        tokens = ','.join(lines[rows].tolist()).split(',')
+        fields[rows] = np.array(tokens, dtype=object).reshape(len(rows), count)[:, :MIN_FIELDS]
+    return fields, enough
+
+
+def _parse_dates(dates: np.ndarray, resolution: str) -> Tuple[np.ndarray, np.ndarray]:
+    """将日期字符串数组解析为秒级时间戳
+
+    把定长字符串视图转换为码点矩阵,按位置提取数字并校验分隔符和取值范围。
+
+    Returns:
+        (时间戳数组, 有效掩码)
+    """
+    length = _DATE_LEN.get(resolution, 10)
+    text = dates.astype(f'U{length + 1}')
+    chars = text.view(np.uint32).reshape(len(text), length + 1).astype(np.int64)
+
+    valid = (chars[:, length] == 0) & (chars[:, length - 1] != 0)  # 长度恰好为length
+    digits = chars[:, list(_DIGIT_POS[length])] - ord('0')
+    valid &= np.all((digits >= 0) & (digits <= 9), axis=1)
+    for pos, sep in _SEPARATORS[length]:
+        valid &= chars[:, pos] == ord(sep)
+
+    # 无效行填入1970-01-01 00:00,避免越界
+    digits = np.where(valid[:, None], digits, 0)
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    if length == 16:
+        hour = digits[:, 8] * 10 + digits[:, 9]
+        minute = digits[:, 10] * 10 + digits[:, 11]
+    else:
+        hour = minute = np.zeros_like(year)
+    year = np.where(valid, year, 1970)
+    month = np.where(valid, month, 1)
+    day = np.where(valid, day, 1)
+
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31) & (hour <= 23) & (minute <= 59)
+    month = np.where(valid, month, 1)
+    day = np.where(valid, day, 1)
+
+    months = (year - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (month - 1)
+    days = months.astype('datetime64[D]') + (day - 1)
+    valid &= days.astype('datetime64[M]') == months  # 排除2月30日等不存在的日期
+
+    timestamps = days.astype('datetime64[s]').astype(np.int64) + hour * 3600 + minute * 60
+    return timestamps, valid
+
+
+def _parse_values(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """将数值字段矩阵解析为float64
+
+    正常数据直接整体转换;含停牌占位符'-'等非法值时,先按码点校验出合法单元格,
+    码点校验不通过的少数单元格(如科学计数法1e3)再逐个用float()确认,
+    与逐行float()的解析结果一致;非法单元格置0后再转换,不会逐行抛出异常。
+
+    Returns:
+        (数值矩阵, 每行是否全部合法的掩码)
+    """
+    try:
+        return values.astype(np.float64), np.ones(len(values), dtype=bool)
+    except ValueError:
+        pass
+
+    text = values.astype(str)
+    width = text.dtype.itemsize // 4
+    chars = text.view(np.uint32).reshape(*text.shape, width)
+    is_digit = (chars >= ord('0')) & (chars <= ord('9'))
+    is_dot = chars == ord('.')
+    is_minus = chars == ord('-')
+    cell_ok = (
+        np.all(is_digit | is_dot | is_minus | (chars == 0), axis=-1)
+        & (is_dot.sum(axis=-1) <= 1)
+        & ~is_minus[..., 1:].any(axis=-1)
+        & is_digit.any(axis=-1)
+    )
+    parsed = np.where(cell_ok, text, '0').astype(np.float64)
+    for row, column in np.argwhere(~cell_ok):
+        try:
+            parsed[row, column] = float(text[row, column])
+        except ValueError:
+            continue
+        cell_ok[row, column] = True
+    return parsed, cell_ok.all(axis=1)
+
+
+def parse_klines(lines: Sequence[str], resolution: str = "1d") -> KLineColumns:
+    """批量解析K线字符串
+
+    Args:
+        lines: 接口返回的klines数组
+        resolution: 时间粒度, 1m:1分钟, 1d:日线
+
+    Returns:
+        列式K线数据,格式错误的行被剔除,其原始行号记录在invalid_rows中
+    """
+    if not len(lines):
+        empty = np.empty(0, dtype=np.float64)
+        return KLineColumns(
+            timestamps=np.empty(0, dtype=np.int64),
+            **{field: empty for field in VALUE_FIELDS},
+            invalid_rows=np.empty(0, dtype=np.int64)
+        )
+
+    fields, valid = _split_fields(np.asarray(lines, dtype=str))
+    timestamps, dates_ok = _parse_dates(fields[:, 0].astype(str), resolution)
+    values, values_ok = _parse_values(fields[:, 1:])
+    valid &= dates_ok & values_ok
+
+    invalid_rows = np.flatnonzero(~valid)
+    if len(invalid_rows):
+        samples = [lines[i] for i in invalid_rows[:3]]
+        logger.warning(f"解析K线数据失败 {len(invalid_rows)} 条, 示例: {samples}")
+
+    return KLineColumns(
+        timestamps=timestamps[valid],
+        **{field: values[valid, i] for i, field in enumerate(VALUE_FIELDS)},
+        invalid_rows=invalid_rows
+    )
+
+
+def parse_kline_rows(lines: Sequence[str], resolution: str = "1d",
+                     since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """解析K线字符串并转换为字典列表,可在进程池中执行
+
+    Args:
+        lines: 接口返回的klines数组
+        resolution: 时间粒度, 1m:1分钟, 1d:日线
+        since: 只保留不早于该时间的K线,None表示全部保留
+
+    Returns:
+        K线字典列表
+    """
+    columns = parse_klines(lines, resolution)
+    if since is not None:
+        columns = columns.since(since)
+    return columns.to_rows(resolution)
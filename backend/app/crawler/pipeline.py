@@ -0,0 +1,220 @@
+"""
+分阶段爬取流水线模块
+
+获取 -> 解析 -> 写库 三个阶段通过有界队列连接,网络请求、解析和数据库写入互不阻塞:
+- 获取阶段: 多个协程并发请求K线原始数据
+- 解析阶段: 解析K线字符串,可交给进程池执行
+- 写库阶段: 单个协程跨股票批量写入数据库
+"""
+import time
+import logging
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
+
+from app.core.config import config
+from app.crawler.base import CrawlerFetchError
+from app.crawler.data_processor import DataProcessor
+from app.crawler.ingest import get_ingest_buffer
+from app.crawler.kline_parser import parse_kline_rows
+from app.utils.metrics import ROWS_PARSED
+
+if TYPE_CHECKING:
+    from app.crawler.stock_crawler import StockCrawler
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 队列结束标记
+_DONE = object()
+
+
+class StageStats:
+    """单个阶段的吞吐量和队列深度统计"""
+
+    def __init__(self, name: str, queue: Optional[asyncio.Queue] = None):
+        self.name = name
+        self.queue = queue
+        self.processed = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回当前统计信息"""
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "throughput": round(self.processed / elapsed, 2),  # 股票/秒
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "queue_size": self.queue.maxsize if self.queue else 0,
+        }
+
+
+class CrawlPipeline:
+    """分阶段爬取流水线"""
+
+    def __init__(self, crawler: "StockCrawler", resolution: Optional[str] = None,
+                 fetch_workers: Optional[int] = None, parse_workers: Optional[int] = None,
+                 queue_size: Optional[int] = None, write_batch_size: Optional[int] = None,
+                 process_pool: Optional[bool] = None):
+        """初始化流水线
+
+        Args:
+            crawler: 负责网络请求和进度回调的爬虫实例
+            resolution: 时间粒度,None表示同时获取日线和分钟线
+            fetch_workers: 获取阶段协程数,默认使用爬虫并发数
+            parse_workers: 解析阶段协程数(使用进程池时即进程数)
+            queue_size: 阶段之间队列的最大长度
+            write_batch_size: 写库阶段每批最多包含的股票数
+            process_pool: 是否在进程池中解析
+        """
+        settings = config.crawler_pipeline
+        self.crawler = crawler
+        self.resolutions = ["1d", "1m"] if resolution is None else [resolution]
+        self.fetch_workers = max(1, fetch_workers or crawler.concurrency)
+        self.parse_workers = max(1, parse_workers or settings.get('parse_workers', 2))
+        self.queue_size = max(1, queue_size or settings.get('queue_size', 64))
+        self.write_batch_size = max(1, write_batch_size or settings.get('write_batch_size', 20))
+        self.process_pool = settings.get('process_pool', False) if process_pool is None else process_pool
+        self.stages: Dict[str, StageStats] = {}
+
+    def stage_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """返回各阶段统计信息"""
+        return {name: stats.snapshot() for name, stats in self.stages.items()}
+
+    async def _fetch_stage(self, input_queue: asyncio.Queue, parse_queue: asyncio.Queue):
+        """获取阶段: 请求原始K线字符串和财务数据"""
+        stats = self.stages["fetch"]
+        crawler = self.crawler
+        while True:
+            try:
+                stock = input_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                last_dates = {}
+                if crawler.incremental:
+                    last_dates = await DataProcessor.get_last_kline_dates(stock['code'])
+                raw = {}
+                for resolution in self.resolutions:
+                    since = last_dates.get(resolution)
+                    lines = await crawler.fetch_kline_lines(stock['code'], stock['market'], resolution, since)
+                    if lines is None:
+                        raise CrawlerFetchError(f"K线获取失败: {stock['code']} {resolution}")
+                    raw[resolution] = (lines, since)
+                financial = await crawler.fetch_financial(stock)
+                await parse_queue.put({'stock': stock, 'raw': raw, 'financial': financial})
+                stats.processed += 1
+            except CrawlerFetchError as e:
+                stats.failed += 1
+                crawler.failed_stocks.append(stock['code'])
+                logger.error(f"获取股票数据失败 {stock['code']}: {str(e)}")
+                await crawler.record_results([], [stock['code']], str(e))
+            except Exception as e:
+                stats.failed += 1
+                crawler.failed_stocks.append(stock['code'])
+                logger.error(f"获取股票数据失败 {stock['code']}: {str(e)}", exc_info=True)
+                await crawler.record_results([], [stock['code']], str(e))
+
+    async def _parse_stage(self, parse_queue: asyncio.Queue, write_queue: asyncio.Queue,
+                           executor: Optional[ProcessPoolExecutor]):
+        """解析阶段: 将原始K线字符串解析为K线字典"""
+        stats = self.stages["parse"]
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await parse_queue.get()
+            if item is _DONE:
+                return
+            stock = item['stock']
+            try:
+                klines = []
+                for resolution, (lines, since) in item['raw'].items():
+                    if executor:
+                        rows = await loop.run_in_executor(executor, parse_kline_rows, lines, resolution, since)
+                    else:
+                        rows = parse_kline_rows(lines, resolution, since)
+                    ROWS_PARSED.inc(len(rows), resolution=resolution)
+                    klines.extend(rows)
+                await write_queue.put({**stock, 'klines': klines, 'financial': item['financial']})
+                stats.processed += 1
+            except Exception as e:
+                stats.failed += 1
+                self.crawler.failed_stocks.append(stock['code'])
+                logger.error(f"解析股票数据失败 {stock['code']}: {str(e)}", exc_info=True)
+                await self.crawler.record_results([], [stock['code']], str(e))
+
+    async def _write_stage(self, write_queue: asyncio.Queue):
+        """写库阶段: 单个协程跨股票批量写入"""
+        stats = self.stages["write"]
+        crawler = self.crawler
+        finished = False
+        while not finished:
+            item = await write_queue.get()
+            if item is _DONE:
+                return
+            batch = [item]
+            # 取出队列中已就绪的数据,凑成一批写入
+            while len(batch) < self.write_batch_size:
+                try:
+                    item = write_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is _DONE:
+                    finished = True
+                    break
+                batch.append(item)
+
+            failed = await get_ingest_buffer().save_many(batch, crawler.ledger)
+            saved = len(batch) - len(failed)
+            stats.processed += saved
+            stats.failed += len(failed)
+            crawler.failed_stocks.extend(failed)
+            await crawler.record_results(
+                [item['code'] for item in batch if item['code'] not in failed], failed, "保存数据失败")
+            crawler.processed_stocks += saved
+            await crawler.update_progress(crawler.processed_stocks, crawler.total_stocks,
+                                          stages=self.stage_snapshot())
+
+    async def run(self, stocks: List[Dict[str, str]]):
+        """运行流水线直到所有股票处理完成
+
+        Args:
+            stocks: 股票信息列表
+        """
+        input_queue: asyncio.Queue = asyncio.Queue()
+        for stock in stocks:
+            input_queue.put_nowait(stock)
+        parse_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.stages = {
+            "fetch": StageStats("fetch", input_queue),
+            "parse": StageStats("parse", parse_queue),
+            "write": StageStats("write", write_queue),
+        }
+
+        executor = ProcessPoolExecutor(max_workers=self.parse_workers) if self.process_pool else None
+        logger.info(f"启动流水线: 获取协程 {self.fetch_workers}, 解析协程 {self.parse_workers}"
+                    f"{'(进程池)' if executor else ''}, 队列长度 {self.queue_size}, 写库批量 {self.write_batch_size}")
+        writer = asyncio.ensure_future(self._write_stage(write_queue))
+        parsers = [
+            asyncio.ensure_future(self._parse_stage(parse_queue, write_queue, executor))
+            for _ in range(self.parse_workers)
+        ]
+        try:
+            await asyncio.gather(*(
+                self._fetch_stage(input_queue, parse_queue)
+                for _ in range(min(self.fetch_workers, len(stocks)) or 1)
+            ))
+            for _ in parsers:
+                await parse_queue.put(_DONE)
+            await asyncio.gather(*parsers)
+            await write_queue.put(_DONE)
+            await writer
+        finally:
+            for task in (*parsers, writer):
+                if not task.done():
+                    task.cancel()
+            if executor:
+                executor.shutdown(wait=False)
+        logger.info(f"流水线运行完成: {self.stage_snapshot()}")
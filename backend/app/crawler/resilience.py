@@ -0,0 +1,151 @@
+"""
+请求容错模块: 指数退避和按主机的熔断器
+"""
+import time
+import random
+import logging
+import asyncio
+from typing import Dict, Optional
+
+from app.core.config import config
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """计算第attempt次重试前的等待时间(full jitter指数退避)
+
+    Args:
+        attempt: 已失败的次数,从1开始
+        base: 基础等待时间(秒)
+        cap: 最大等待时间(秒)
+    """
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头(秒数形式),无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """单个主机的熔断器
+
+    连续失败达到阈值后进入open状态,在冷却时间内所有请求都会等待而不是发出,
+    从而暂停整个爬取流程;冷却结束后进入half_open状态,只放行一个探测请求,
+    探测成功则恢复,失败则重新open。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, host: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        """初始化熔断器
+
+        Args:
+            host: 主机名
+            failure_threshold: 触发熔断的连续失败次数
+            reset_timeout: 熔断后的冷却时间(秒)
+        """
+        self.host = host
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self.trips = 0
+        self._probing = False
+        self._probe_task: Optional[asyncio.Task] = None
+
+    async def before_request(self):
+        """请求前调用,熔断期间等待直到允许发出请求"""
+        while True:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now < self.open_until:
+                    await asyncio.sleep(self.open_until - now)
+                    continue
+                self.state = self.HALF_OPEN
+                self._probing = False
+                logger.info(f"熔断器半开,发送探测请求: {self.host}")
+            if not self._probing:
+                self._probing = True
+                self._probe_task = asyncio.current_task()
+                return
+            # 等待探测请求的结果
+            await asyncio.sleep(min(1.0, self.reset_timeout))
+
+    def abort_probe(self):
+        """请求没有得到能说明主机状态的结果(被取消、不可重试的4xx)时调用
+
+        当前任务持有探测名额时将其释放,由下一个请求重新探测,熔断器状态和连续失败次数不变。
+        """
+        if self._probing and self._probe_task is asyncio.current_task():
+            self._probing = False
+            self._probe_task = None
+
+    def record_success(self):
+        """记录一次成功请求"""
+        if self.state != self.CLOSED:
+            logger.info(f"熔断器恢复: {self.host}")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        """记录一次失败请求,必要时打开熔断器
+
+        Args:
+            retry_after: 服务端要求的等待时间,熔断时冷却时间不短于该值
+        """
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.open_until = time.monotonic() + max(self.reset_timeout, retry_after or 0)
+            self._probing = False
+            self.trips += 1
+            logger.warning(f"熔断器打开: {self.host}, 连续失败 {self.failures} 次, "
+                           f"暂停 {self.open_until - time.monotonic():.1f} 秒")
+
+    def snapshot(self) -> Dict[str, object]:
+        """返回熔断器状态"""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "trips": self.trips,
+            "open_for": max(0.0, round(self.open_until - time.monotonic(), 1)) if self.state == self.OPEN else 0,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    """获取进程内共享的主机熔断器"""
+    breaker = _breakers.get(host)
+    if breaker is None:
+        settings = config.crawler_circuit_breaker
+        breaker = CircuitBreaker(
+            host,
+            failure_threshold=settings.get("failure_threshold", 5),
+            reset_timeout=settings.get("reset_timeout", 30)
+        )
+        _breakers[host] = breaker
+    return breaker
+
+
+def breaker_states() -> Dict[str, Dict[str, object]]:
+    """返回所有主机熔断器的状态"""
+    return {host: breaker.snapshot() for host, breaker in _breakers.items()}
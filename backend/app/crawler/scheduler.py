@@ -0,0 +1,281 @@
+"""
+按数据陈旧度调度的后台爬取模块
+
+维护一个股票优先级队列,优先级由数据陈旧度(Stock.updated_at)、近期访问热度
+(/kline和/analysis请求)和是否处于交易时段共同决定;后台工作协程在每分钟固定的
+请求预算内,始终先刷新价值最高的陈旧股票。
+"""
+import math
+import time
+import heapq
+import logging
+import asyncio
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.core.config import config
+from app.core.database import AsyncSessionLocal
+from app.models import Stock
+from app.crawler.intraday import is_trading_time
+from app.crawler.stock_crawler import StockCrawler
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 从未爬取过的股票按该陈旧小时数计算
+NEVER_UPDATED_HOURS = 24 * 30
+
+# 股票代码 -> (热度, 上次衰减时间)
+_demand: Dict[str, Tuple[float, float]] = {}
+
+
+def _decayed(score: float, since: float, now: float, half_life: float) -> float:
+    return score * math.pow(0.5, (now - since) / half_life) if half_life > 0 else score
+
+
+def record_demand(code: str, weight: float = 1.0):
+    """记录一次对股票数据的访问,热度按半衰期随时间衰减
+
+    Args:
+        code: 股票代码
+        weight: 本次访问的权重
+    """
+    now = time.monotonic()
+    half_life = config.crawler_scheduler.get('demand_half_life', 1800)
+    score, since = _demand.get(code, (0.0, now))
+    _demand[code] = (_decayed(score, since, now, half_life) + weight, now)
+
+
+def demand_scores() -> Dict[str, float]:
+    """返回所有股票当前的访问热度"""
+    now = time.monotonic()
+    half_life = config.crawler_scheduler.get('demand_half_life', 1800)
+    return {code: _decayed(score, since, now, half_life) for code, (score, since) in _demand.items()}
+
+
+class RequestBudget:
+    """每分钟请求预算(令牌桶)"""
+
+    def __init__(self, per_minute: float):
+        """初始化预算
+
+        Args:
+            per_minute: 每分钟允许发出的请求数,同时也是桶容量
+        """
+        self.capacity = max(1.0, per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.spent = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, cost: float):
+        """占用cost个请求名额,预算不足时等待补足
+
+        名额先扣除(可以为负)再等待,后来的请求按欠额排在其后,各自等待而不互相阻塞;
+        扣除与计算等待时间之间没有await,无需加锁。等待期间被取消时归还名额。
+        """
+        cost = min(cost, self.capacity)
+        self._refill()
+        self.tokens -= cost
+        self.spent += cost
+        if self.tokens >= 0:
+            return
+        try:
+            await asyncio.sleep(-self.tokens / self.rate)
+        except asyncio.CancelledError:
+            self.tokens += cost
+            self.spent -= cost
+            raise
+
+    def available(self) -> float:
+        self._refill()
+        return round(max(0.0, self.tokens), 1)
+
+
+class CrawlScheduler:
+    """陈旧度优先的后台爬取调度器"""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, workers: Optional[int] = None,
+                 resolution: Optional[str] = None):
+        """初始化调度器
+
+        Args:
+            requests_per_minute: 每分钟请求预算,默认读取配置
+            workers: 后台工作协程数,默认读取配置
+            resolution: 刷新的时间粒度,None表示日线和分钟线
+        """
+        settings = config.crawler_scheduler
+        self.requests_per_minute = requests_per_minute or settings.get('requests_per_minute', 120)
+        self.workers = max(1, workers or settings.get('workers', 2))
+        self.resolution = resolution
+        self.rebuild_interval = settings.get('rebuild_interval', 60)
+        # 距上次更新不足该时间的股票不进入队列;有访问热度的股票在交易时段使用更短的间隔
+        self.min_age = settings.get('min_age_minutes', 240) * 60
+        self.hot_min_age = settings.get('hot_min_age_minutes', 5) * 60
+        self.demand_weight = settings.get('demand_weight', 1.0)
+        self.trading_boost = settings.get('trading_boost', 4.0)
+        self.budget = RequestBudget(self.requests_per_minute)
+        self.crawler = StockCrawler()
+        # 每支股票按cost_per_stock预先扣除,重试的请求由爬虫另行扣除
+        self.crawler.request_budget = self.budget
+        self.processed = 0
+        self.failed = 0
+        self._heap: List[Tuple[float, str, Dict[str, str]]] = []
+        self._queued: set = set()
+        # 正在刷新的股票,重建队列时跳过,避免同一支股票被两个工作协程同时刷新
+        self._in_flight: set = set()
+        self._rebuilt_at = 0.0
+        self._tasks: List[asyncio.Task] = []
+        self._rebuild_lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    @property
+    def cost_per_stock(self) -> int:
+        """刷新一支股票的请求数: 每种时间粒度一次K线请求加一次行情请求"""
+        return (1 if self.resolution else 2) + 1
+
+    def priority(self, updated_at: Optional[datetime], demand: float, now: datetime,
+                 trading: bool) -> Optional[float]:
+        """计算股票的刷新价值,不需要刷新时返回None
+
+        Args:
+            updated_at: 股票数据最后更新时间
+            demand: 访问热度
+            now: 当前时间
+            trading: 是否处于交易时段
+        """
+        age = (now - updated_at).total_seconds() if updated_at else NEVER_UPDATED_HOURS * 3600
+        hot = demand >= 0.5
+        if age < (self.hot_min_age if hot and trading else self.min_age):
+            return None
+        score = (age / 3600) * (1 + self.demand_weight * demand)
+        if trading and hot:
+            score *= self.trading_boost
+        return score
+
+    async def rebuild(self):
+        """从数据库重建优先级队列"""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Stock.code, Stock.name, Stock.market, Stock.updated_at)
+            )
+            rows = result.all()
+        now = datetime.now()
+        trading = is_trading_time(now)
+        demand = demand_scores()
+        heap = []
+        for code, name, market, updated_at in rows:
+            if code in self._in_flight:
+                continue
+            score = self.priority(updated_at, demand.get(code, 0.0), now, trading)
+            if score is not None:
+                heap.append((-score, code, {'code': code, 'name': name, 'market': market}))
+        heapq.heapify(heap)
+        self._heap = heap
+        self._queued = {code for _, code, _ in heap}
+        self._rebuilt_at = time.monotonic()
+        logger.info(f"调度队列已重建: {len(heap)}/{len(rows)} 支股票待刷新")
+
+    async def _next_stock(self) -> Optional[Dict[str, str]]:
+        """取出价值最高的股票,队列过期时先重建"""
+        async with self._rebuild_lock:
+            if not self._heap or time.monotonic() - self._rebuilt_at >= self.rebuild_interval:
+                await self.rebuild()
+        while self._heap:
+            _, code, stock = heapq.heappop(self._heap)
+            if code in self._queued:
+                self._queued.discard(code)
+                return stock
+        return None
+
+    async def _worker(self):
+        while True:
+            try:
+                stock = await self._next_stock()
+                if stock is None:
+                    # 没有陈旧股票,等到下次重建
+                    await asyncio.sleep(self.rebuild_interval)
+                    continue
+                self._in_flight.add(stock['code'])
+                try:
+                    await self.budget.acquire(self.cost_per_stock)
+                    await self.crawler.process_stock(stock, self.resolution)
+                finally:
+                    self._in_flight.discard(stock['code'])
+                if stock['code'] in self.crawler.failed_stocks:
+                    # 失败的股票保持陈旧,下次重建队列时重新排队
+                    self.crawler.failed_stocks.remove(stock['code'])
+                    self.failed += 1
+                else:
+                    self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"调度刷新失败: {str(e)}", exc_info=True)
+                await asyncio.sleep(1)
+
+    def start(self):
+        """启动后台工作协程"""
+        if self.running:
+            return
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        logger.info(f"爬取调度器已启动: {self.workers} 个工作协程, 每分钟 {self.requests_per_minute} 个请求")
+
+    async def stop(self):
+        """停止后台工作协程"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("爬取调度器已停止")
+
+    def status(self, top: int = 10) -> Dict[str, Any]:
+        """返回调度器状态和队首的股票"""
+        return {
+            "running": self.running,
+            "queued": len(self._queued),
+            "in_flight": len(self._in_flight),
+            "processed": self.processed,
+            "failed": self.failed,
+            "requests_per_minute": self.requests_per_minute,
+            "budget_available": self.budget.available(),
+            "requests_spent": self.budget.spent,
+            "next": [
+                {"code": code, "score": round(-score, 2)}
+                for score, code, _ in heapq.nsmallest(top, self._heap)
+                if code in self._queued
+            ],
+        }
+
+
+_scheduler: Optional[CrawlScheduler] = None
+
+
+def get_scheduler() -> Optional[CrawlScheduler]:
+    """获取当前的调度器,未启动过时返回None"""
+    return _scheduler
+
+
+async def start_scheduler(**kwargs) -> CrawlScheduler:
+    """启动调度器,已在运行时先停止再按新参数启动"""
+    global _scheduler
+    await stop_scheduler()
+    _scheduler = CrawlScheduler(**kwargs)
+    _scheduler.start()
+    return _scheduler
+
+
+async def stop_scheduler():
+    """停止调度器"""
+    if _scheduler:
+        await _scheduler.stop()
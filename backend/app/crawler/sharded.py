@@ -0,0 +1,220 @@
+"""
+多进程分片爬取模块
+
+将股票列表分片到多个工作进程,每个进程运行独立事件循环的StockCrawler,
+K线解析和ORM对象构建分散到多个CPU核心;协调者汇总各进程进度,
+继续通过原有的progress_callback上报。
+"""
+import os
+import queue
+import logging
+import asyncio
+import multiprocessing
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
+
+from app.core.config import config
+
+if TYPE_CHECKING:
+    from app.crawler.stock_crawler import StockCrawler
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 工作进程上报进度的间隔(秒)
+REPORT_INTERVAL = 0.5
+
+# 工作进程内部支持的爬取模式
+WORKER_MODES = ("concurrent", "pipeline")
+
+
+async def _crawl_shard(shard: int, stocks: List[Dict[str, str]], resolution: Optional[str],
+                       options: Dict[str, Any], messages: multiprocessing.Queue):
+    """在工作进程中爬取一个分片
+
+    定期将新完成和新失败的股票代码写入消息队列,结束时先上报剩余的结果再发送结束消息,
+    进程异常退出时协调者只把未上报过的股票记为失败。
+    """
+    from app.crawler.base import BaseCrawler
+    from app.crawler.checkpoint import CrawlLedger
+    from app.crawler.ingest import stop_ingest_buffer
+    from app.crawler.stock_crawler import StockCrawler
+
+    crawler = StockCrawler(
+        concurrency=options['concurrency'],
+        per_host_limit=options['per_host_limit'],
+        per_host_rate=options['per_host_rate'],
+        incremental=options['incremental'],
+        endpoints=options['endpoints'],
+        use_cache=options['use_cache']
+    )
+    crawler.total_stocks = len(stocks)
+    if options['run_id']:
+        crawler.ledger = CrawlLedger(options['run_id'])
+
+    reported = {"completed": 0, "failed": 0}
+
+    def send_progress():
+        completed = crawler.completed_stocks[reported["completed"]:]
+        failed = crawler.failed_stocks[reported["failed"]:]
+        reported["completed"] += len(completed)
+        reported["failed"] += len(failed)
+        messages.put(("progress", shard, completed, failed))
+
+    async def report():
+        while True:
+            send_progress()
+            await asyncio.sleep(REPORT_INTERVAL)
+
+    reporter = asyncio.ensure_future(report())
+    try:
+        await crawler.crawl_stocks(stocks, resolution, options['mode'])
+    finally:
+        reporter.cancel()
+        await stop_ingest_buffer()
+        await BaseCrawler.shutdown()
+        send_progress()
+    messages.put(("done", shard, None, None))
+
+
+def _run_shard(shard: int, stocks: List[Dict[str, str]], resolution: Optional[str],
+               options: Dict[str, Any], messages: multiprocessing.Queue):
+    """工作进程入口"""
+    try:
+        asyncio.run(_crawl_shard(shard, stocks, resolution, options, messages))
+    except Exception as e:
+        logger.error(f"分片 {shard} 爬取失败: {str(e)}", exc_info=True)
+        messages.put(("error", shard, None, str(e)))
+
+
+class ShardedCrawl:
+    """多进程分片爬取协调者"""
+
+    def __init__(self, crawler: "StockCrawler", resolution: Optional[str] = None,
+                 processes: Optional[int] = None, worker_mode: Optional[str] = None):
+        """初始化协调者
+
+        Args:
+            crawler: 负责进度上报的爬虫实例,其并发和限流设置会按进程数拆分给各工作进程
+            resolution: 时间粒度,None表示同时获取日线和分钟线
+            processes: 工作进程数,默认读取配置,未配置时使用CPU核心数
+            worker_mode: 工作进程内部的爬取模式,concurrent或pipeline
+
+        Raises:
+            ValueError: worker_mode不是concurrent或pipeline
+        """
+        settings = config.crawler_sharded
+        self.crawler = crawler
+        self.resolution = resolution
+        self.processes = max(1, processes or settings.get('processes') or os.cpu_count() or 1)
+        self.worker_mode = worker_mode or settings.get('worker_mode', 'concurrent')
+        if self.worker_mode not in WORKER_MODES:
+            raise ValueError(f"不支持的分片内部模式: {self.worker_mode},可选 {', '.join(WORKER_MODES)}")
+
+    def _worker_options(self, processes: int) -> Dict[str, Any]:
+        """按进程数拆分单主机并发和速率预算,使总请求压力与单进程时一致"""
+        crawler = self.crawler
+        limiter = crawler.host_limiter
+        rate = 1.0 / limiter.interval if limiter.interval else 0
+        return {
+            'concurrency': max(1, crawler.concurrency // processes),
+            'per_host_limit': max(1, limiter.max_concurrent // processes),
+            'per_host_rate': rate / processes,
+            'incremental': crawler.incremental,
+            'endpoints': crawler.endpoints,
+            'use_cache': crawler.cache is not None,
+            'run_id': crawler.ledger.run_id if crawler.ledger else None,
+            'mode': self.worker_mode,
+        }
+
+    async def run(self, stocks: List[Dict[str, str]]):
+        """运行所有分片直到完成
+
+        Args:
+            stocks: 股票信息列表
+        """
+        crawler = self.crawler
+        processes = min(self.processes, len(stocks)) or 1
+        shards = [stocks[i::processes] for i in range(processes)]
+        options = self._worker_options(processes)
+        # spawn启动的进程不继承父进程的事件循环和HTTP会话
+        context = multiprocessing.get_context("spawn")
+        messages = context.Queue()
+        workers = [
+            context.Process(target=_run_shard, args=(shard, shard_stocks, self.resolution, options, messages),
+                            name=f"crawler-shard-{shard}", daemon=True)
+            for shard, shard_stocks in enumerate(shards)
+        ]
+        logger.info(f"启动 {processes} 个分片进程, 每个进程并发 {options['concurrency']}, "
+                    f"内部模式 {self.worker_mode}")
+
+        base = crawler.processed_stocks
+        completed: List[List[str]] = [[] for _ in range(processes)]
+        failed: List[List[str]] = [[] for _ in range(processes)]
+        pending = set(range(processes))
+        for worker in workers:
+            worker.start()
+        try:
+            while pending:
+                try:
+                    kind, shard, shard_completed, detail = await asyncio.to_thread(
+                        messages.get, True, REPORT_INTERVAL)
+                except queue.Empty:
+                    # 进程异常退出且未发送结束消息时,将其未上报结果的股票计为失败
+                    for shard in list(pending):
+                        if not workers[shard].is_alive():
+                            logger.error(f"分片 {shard} 进程异常退出: exitcode={workers[shard].exitcode}")
+                            await self._finish_shard(
+                                shards[shard], completed[shard], failed[shard], crashed=True)
+                            pending.discard(shard)
+                    continue
+
+                if kind == "progress":
+                    completed[shard].extend(shard_completed)
+                    failed[shard].extend(detail)
+                elif kind == "done":
+                    await self._finish_shard(shards[shard], completed[shard], failed[shard])
+                    pending.discard(shard)
+                elif kind == "error":
+                    logger.error(f"分片 {shard} 爬取失败: {detail}")
+                    await self._finish_shard(shards[shard], completed[shard], failed[shard], crashed=True)
+                    pending.discard(shard)
+                processed = [len(codes) for codes in completed]
+                crawler.processed_stocks = base + sum(processed)
+                await crawler.update_progress(crawler.processed_stocks, crawler.total_stocks,
+                                              stages=self.shard_snapshot(shards, processed, pending))
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            # join可能阻塞数秒,放到线程中执行以免阻塞事件循环
+            await asyncio.gather(*(asyncio.to_thread(worker.join, 5) for worker in workers))
+            messages.close()
+        logger.info(f"分片爬取完成: 成功 {sum(len(codes) for codes in completed)}, "
+                    f"失败 {len(crawler.failed_stocks)}")
+
+    async def _finish_shard(self, shard_stocks: List[Dict[str, str]], completed: List[str], failed: List[str],
+                            crashed: bool = False):
+        """汇总一个分片的失败股票
+
+        工作进程并发处理股票,完成顺序与分片顺序无关;异常结束时只有未上报过结果的股票
+        记为失败并写入任务台账,已上报的结果工作进程已自行写入台账。
+        """
+        self.crawler.failed_stocks.extend(failed)
+        if crashed:
+            reported = set(completed) | set(failed)
+            unreported = [stock['code'] for stock in shard_stocks if stock['code'] not in reported]
+            self.crawler.failed_stocks.extend(unreported)
+            await self.crawler.record_results([], unreported, "分片进程异常退出")
+
+    @staticmethod
+    def shard_snapshot(shards: List[List[Dict[str, str]]], processed: List[int],
+                       pending: set) -> Dict[str, Dict[str, Any]]:
+        """返回各分片的进度,与流水线模式的各阶段统计一样通过stages上报"""
+        return {
+            f"shard-{index}": {
+                "processed": processed[index],
+                "total": len(shard),
+                "running": index in pending,
+            }
+            for index, shard in enumerate(shards)
+        }
@@ -3,14 +3,21 @@
 """
 import os
 import logging
-import aiohttp
 import asyncio
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional, Callable
 from functools import partial
 
-from app.crawler.base import BaseCrawler
+from app.core.config import config
+from app.crawler.base import BaseCrawler, CrawlerFetchError, guess_market, to_secid
+from app.crawler.stock_list import StockListCrawler
 from app.crawler.data_processor import DataProcessor
+from app.crawler.ingest import get_ingest_buffer
+from app.crawler.kline_parser import parse_kline_rows
+from app.crawler.pipeline import CrawlPipeline
+from app.crawler.sharded import ShardedCrawl
+from app.crawler.checkpoint import CrawlLedger
+from app.utils.metrics import ROWS_PARSED
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -18,144 +25,162 @@ logger = logging.getLogger(__name__)
 class StockCrawler(BaseCrawler):
     """股票数据爬虫类"""
     
-    def __init__(self, progress_callback: Optional[Callable] = None):
+    def __init__(self, progress_callback: Optional[Callable] = None,
+                 concurrency: Optional[int] = None,
+                 per_host_limit: Optional[int] = None,
+                 per_host_rate: Optional[float] = None,
+                 incremental: Optional[bool] = None,
+                 endpoints: Optional[Dict[str, str]] = None,
+                 use_cache: Optional[bool] = None):
         """初始化爬虫
         
         Args:
             progress_callback: 进度回调函数
+            concurrency: 并发处理股票的工作协程数,默认读取配置
+            per_host_limit: 单个主机最大并发请求数,默认读取配置
+            per_host_rate: 单个主机每秒最大请求数,默认读取配置
+            incremental: 是否增量同步K线(只获取最后一根已存K线之后的数据),默认读取配置
+            endpoints: 数据源地址覆盖,默认读取配置
+            use_cache: 是否使用HTTP响应缓存,默认按配置
         """
-        super().__init__()
+        super().__init__(per_host_limit=per_host_limit, per_host_rate=per_host_rate,
+                         endpoints=endpoints, use_cache=use_cache)
         self.progress_callback = progress_callback
+        self.stock_list = StockListCrawler(endpoints=self.endpoints, use_cache=use_cache)
+        self.stock_list.host_limiter = self.host_limiter  # 共享请求预算
+        self.concurrency = max(1, concurrency or config.crawler_concurrency)
+        self.mode = config.crawler_mode
+        self.incremental = config.crawler_incremental if incremental is None else incremental
         self.total_stocks = 0
         self.processed_stocks = 0
+        self._reported_progress = -1
+        self.quote_batch_size = max(1, config.crawler_quote_batch_size)
+        self._prefetched_financials: Dict[str, Dict[str, Any]] = {}
+        self.failed_stocks: List[str] = []
+        # 已写入数据库的股票代码,分片模式下工作进程据此上报进度
+        self.completed_stocks: List[str] = []
+        self.ledger: Optional[CrawlLedger] = None
+        # 批量爬取时不等待写入缓冲提交,继续处理下一支股票;单支股票刷新时等待提交完成
+        self.background_saves = False
+        self._saves: set = set()
         
-    async def update_progress(self, current: int, total: int):
+    async def update_progress(self, current: int, total: int, **extra):
         """更新进度并调用回调函数
         
         Args:
             current: 当前处理数量
             total: 总数量
+            **extra: 附加的进度信息,如流水线各阶段统计(stages)
         """
         if self.progress_callback:
+            # 并发处理时丢弃落后的进度,保证上报的进度单调递增
+            if current < self._reported_progress:
+                return
+            self._reported_progress = current
             try:
                 logger.info(f"发送进度更新: {current}/{total}")
-                await self.progress_callback(current, total)
-                await asyncio.sleep(0.1)  # 确保进度更新被接收
+                await self.progress_callback(current, total, **extra)
             except Exception as e:
                 logger.error(f"发送进度失败: {e}")
     
-    async def get_stock_list(self, limit: int = 10) -> List[Dict[str, str]]:
-        """获取股票列表
+    async def get_stock_list(self, limit: Optional[int] = 10) -> List[Dict[str, str]]:
+        """获取股票列表(上交所和深交所)
         
         Args:
-            limit: 要获取的股票数量
+            limit: 要获取的股票数量,None表示全部
         
         Returns:
             股票列表,每个元素包含code、name、market字段
         """
-        logger.info(f"开始获取股票列表,数量: {limit}...")
+        logger.info(f"开始获取股票列表,数量: {limit or '全部'}...")
         try:
-            async with aiohttp.ClientSession() as session:
-                url = "http://query.sse.com.cn/security/stock/getStockListData.do"
-                params = {
-                    'stockType': 1,
-                    'pageHelp.beginPage': 1,
-                    'pageHelp.pageSize': max(50, limit)  # 确保获取足够数量的股票
-                }
-                headers = {
-                    **self.headers,
-                    'Referer': 'http://www.sse.com.cn/'
-                }
-                
-                logger.info(f"请求URL: {url}")
-                data = await self.make_request(session, url, params, headers)
-                
-                if not data:
-                    return []
-                    
-                sh_stocks = [
-                    {
-                        'code': item['SECURITY_CODE_A'],
-                        'name': item['SECURITY_ABBR_A'],
-                        'market': 'SH'
-                    }
-                    for item in data.get('pageHelp', {}).get('data', [])
-                ]
-                
-                logger.info(f"成功获取到 {len(sh_stocks)} 支股票")
-                return sh_stocks[:limit]  # 返回指定数量的股票
+            stocks = await self.stock_list.fetch_all(limit=limit)
+            logger.info(f"成功获取到 {len(stocks)} 支股票")
+            return stocks
         except Exception as e:
             logger.error(f"获取股票列表失败: {str(e)}", exc_info=True)
             return []
     
-    async def get_kline_data(self, stock_code: str, market: str, resolution: str = "1d") -> List[Dict[str, Any]]:
-        """获取K线数据
+    async def fetch_kline_lines(self, stock_code: str, market: str, resolution: str = "1d",
+                                since: Optional[datetime] = None,
+                                limit: Optional[int] = None,
+                                until: Optional[datetime] = None) -> Optional[List[str]]:
+        """获取未解析的K线字符串
         
         Args:
             stock_code: 股票代码
             market: 市场标识(SH/SZ)
             resolution: 时间粒度, 1m:1分钟, 1d:日线
+            since: 增量同步的起点(含),为None时按默认窗口获取
+            limit: 只获取最近的limit根K线,指定时忽略since和until
+            until: 截止日期(含),为None时截止到今天
             
         Returns:
-            K线数据列表
+            接口返回的klines数组,没有数据时返回空列表,请求失败时返回None
         """
-        logger.info(f"获取K线数据: {stock_code}, 时间粒度: {resolution}")
+        logger.info(f"获取K线数据: {stock_code}, 时间粒度: {resolution}, 起点: {since or '默认'}")
         try:
-            async with aiohttp.ClientSession() as session:
-                current_date = datetime.now()
-                end_date = current_date.strftime("%Y%m%d")
-                
-                # 根据分辨率决定起始日期
-                if resolution == "1m":
-                    # 1分钟数据只获取最近3天
-                    start_date = (current_date - timedelta(days=3)).strftime("%Y%m%d")
-                else:
-                    # 日线数据获取年初至今
-                    start_date = f"{current_date.year}0101"
-                
-                url = "http://push2his.eastmoney.com/api/qt/stock/kline/get"
-                params = {
-                    'secid': f"{1 if market == 'SH' else 0}.{stock_code}",
-                    'fields1': 'f1,f2,f3,f4,f5,f6,f7,f8',
-                    'fields2': 'f51,f52,f53,f54,f55,f56,f57,f58',
-                    'klt': '1' if resolution == "1m" else '101',  # 1:1分钟, 101:日线
-                    'fqt': '1',
-                    'beg': start_date,
-                    'end': end_date,
-                }
-                
-                data = await self.make_request(session, url, params)
-                if not data or 'data' not in data:
-                    return []
-
-                klines = []
-                for kline in data['data'].get('klines', []):
-                    try:
-                        date_str, open_price, close, high, low, volume, turnover, *_ = kline.split(',')
-                        
-                        # 根据分辨率解析不同格式的日期
-                        if resolution == "1m":
-                            date_obj = datetime.strptime(date_str, '%Y-%m-%d %H:%M')
-                        else:
-                            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                            
-                        klines.append({
-                            'date': date_obj,
-                            'resolution': resolution,
-                            'open': float(open_price),
-                            'close': float(close),
-                            'high': float(high),
-                            'low': float(low),
-                            'volume': float(volume),
-                            'turnover': float(turnover)
-                        })
-                    except (ValueError, IndexError) as e:
-                        logger.warning(f"解析K线数据失败: {kline}, 错误: {str(e)}")
-                        continue
-
-                return klines
+            current_date = datetime.now()
+            end_date = (until or current_date).strftime("%Y%m%d")
+            
+            # 根据分辨率决定起始日期
+            if since is not None:
+                # 增量同步: 从最后一根已存K线所在日期开始获取
+                start_date = since.strftime("%Y%m%d")
+            elif resolution == "1m":
+                # 1分钟数据只获取最近3天
+                start_date = (current_date - timedelta(days=3)).strftime("%Y%m%d")
+            else:
+                # 日线数据获取年初至今
+                start_date = f"{current_date.year}0101"
+            
+            url = self.endpoints['kline']
+            params = {
+                'secid': to_secid(stock_code, market),
+                'fields1': 'f1,f2,f3,f4,f5,f6,f7,f8',
+                'fields2': 'f51,f52,f53,f54,f55,f56,f57,f58',
+                'klt': '1' if resolution == "1m" else '101',  # 1:1分钟, 101:日线
+                'fqt': '1',
+                'beg': start_date,
+                'end': end_date,
+            }
+            if limit:
+                # lmt按数量从最新一根往前取,与历史长度无关
+                params.update({'beg': '0', 'end': '20500101', 'lmt': str(limit)})
+            
+            data = await self.make_request(url, params)
+            if data is None:
+                return None
+            if not data.get('data'):
+                return []
+            return data['data'].get('klines') or []
         except Exception as e:
             logger.error(f"获取K线数据失败 {stock_code}: {str(e)}", exc_info=True)
+            return None
+
+    async def get_kline_data(self, stock_code: str, market: str, resolution: str = "1d",
+                             since: Optional[datetime] = None) -> Optional[List[Dict[str, Any]]]:
+        """获取K线数据
+        
+        Args:
+            stock_code: 股票代码
+            market: 市场标识(SH/SZ)
+            resolution: 时间粒度, 1m:1分钟, 1d:日线
+            since: 增量同步的起点(含),为None时按默认窗口获取
+            
+        Returns:
+            K线数据列表,请求失败时返回None
+        """
+        lines = await self.fetch_kline_lines(stock_code, market, resolution, since)
+        if lines is None:
+            return None
+        try:
+            # 丢弃早于起点的K线,起点这根K线本身会被覆盖更新
+            rows = parse_kline_rows(lines, resolution, since)
+            ROWS_PARSED.inc(len(rows), resolution=resolution)
+            return rows
+        except Exception as e:
+            logger.error(f"解析K线数据失败 {stock_code}: {str(e)}", exc_info=True)
             return []
     
     async def get_financial_data(self, stock_code: str, market: str = 'SH') -> Optional[Dict[str, Any]]:
@@ -169,31 +194,116 @@ class StockCrawler(BaseCrawler):
             财务数据字典
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                url = "http://push2.eastmoney.com/api/qt/stock/get"
-                params = {
-                    'secid': f"{1 if market == 'SH' else 0}.{stock_code}",
-                    'fields': 'f57,f58,f162,f167,f183,f184,f185'
-                }
-                
-                data = await self.make_request(session, url, params)
-                if not data or 'data' not in data:
-                    return None
+            url = self.endpoints['quote']
+            params = {
+                'secid': to_secid(stock_code, market),
+                'fields': 'f57,f58,f162,f167,f183,f184,f185'
+            }
+            
+            data = await self.make_request(url, params)
+            if not data or not data.get('data'):
+                return None
 
-                return {
-                    'pe_ratio': float(data['data'].get('f162', 0)),
-                    'pb_ratio': float(data['data'].get('f167', 0)),
-                    'total_market_value': float(data['data'].get('f183', 0)),
-                    'circulating_market_value': float(data['data'].get('f184', 0)),
-                    'revenue': 0,
-                    'net_profit': 0,
-                    'roe': 0,
-                    'date': datetime.now()
-                }
+            return self._parse_financial(data['data'])
         except Exception as e:
             logger.error(f"获取财务数据失败 {stock_code}: {str(e)}", exc_info=True)
             return None
+
+    async def lookup_stock(self, stock_code: str) -> Optional[Dict[str, str]]:
+        """按代码推断交易所,用一次行情请求确认股票存在并获取名称
+
+        Args:
+            stock_code: 股票代码
+
+        Returns:
+            股票信息字典(code、name、market),行情接口没有该股票时返回None
+
+        Raises:
+            CrawlerFetchError: 行情接口请求失败
+        """
+        market = guess_market(stock_code)
+        data = await self.make_request(self.endpoints['quote'], {
+            'secid': to_secid(stock_code, market),
+            'fields': 'f57,f58'
+        })
+        if data is None:
+            raise CrawlerFetchError(f"行情获取失败: {stock_code}")
+        item = data.get('data') or {}
+        if not item.get('f58'):
+            return None
+        return {'code': stock_code, 'name': item['f58'], 'market': market}
+
+    @staticmethod
+    def _parse_financial(item: Dict[str, Any]) -> Dict[str, Any]:
+        """将行情接口字段转换为财务数据字典,停牌等情况返回的'-'按0处理"""
+        def to_float(key: str) -> float:
+            try:
+                return float(item.get(key) or 0)
+            except (TypeError, ValueError):
+                return 0.0
+
+        return {
+            'pe_ratio': to_float('f162'),
+            'pb_ratio': to_float('f167'),
+            'total_market_value': to_float('f183'),
+            'circulating_market_value': to_float('f184'),
+            'revenue': 0,
+            'net_profit': 0,
+            'roe': 0,
+            'date': datetime.now()
+        }
+
+    async def get_financial_data_batch(self, stocks: List[Dict[str, str]]) -> Dict[str, Dict[str, Any]]:
+        """通过多股行情接口批量获取财务数据
+        
+        每个请求携带最多quote_batch_size个secid,各批次并发请求。
+        
+        Args:
+            stocks: 股票信息列表
+            
+        Returns:
+            股票代码到财务数据字典的映射,获取失败的股票不包含在内
+        """
+        secids = {to_secid(stock['code'], stock['market']): stock['code'] for stock in stocks}
+        items = list(secids.items())
+        batches = [items[i:i + self.quote_batch_size] for i in range(0, len(items), self.quote_batch_size)]
+
+        async def fetch_batch(batch) -> Dict[str, Dict[str, Any]]:
+            params = {
+                'secids': ','.join(secid for secid, _ in batch),
+                'fields': 'f12,f13,f14,f162,f167,f183,f184',
+                'pn': 1,
+                'pz': len(batch),
+            }
+            try:
+                data = await self.make_request(self.endpoints['quote_batch'], params)
+                diff = ((data or {}).get('data') or {}).get('diff') or []
+                # 部分版本的接口以 {"0": {...}, "1": {...}} 形式返回
+                if isinstance(diff, dict):
+                    diff = list(diff.values())
+                results = {}
+                for item in diff:
+                    code = secids.get(f"{item.get('f13')}.{item.get('f12')}")
+                    if code:
+                        results[code] = self._parse_financial(item)
+                return results
+            except Exception as e:
+                logger.error(f"批量获取财务数据失败: {str(e)}", exc_info=True)
+                return {}
+
+        financials: Dict[str, Dict[str, Any]] = {}
+        for result in await asyncio.gather(*(fetch_batch(batch) for batch in batches)):
+            financials.update(result)
+        logger.info(f"批量获取财务数据: {len(financials)}/{len(stocks)} 支股票, {len(batches)} 个请求")
+        return financials
     
+    async def fetch_financial(self, stock: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """获取单支股票的财务数据,优先使用批量预取的结果"""
+        financial = self._prefetched_financials.pop(stock['code'], None)
+        if financial is None:
+            financial = await self.get_financial_data(stock['code'], stock['market'])
+        return financial
+
     async def process_stock(self, stock: Dict[str, str], resolution: Optional[str] = None):
         """处理单个股票数据
         
@@ -206,19 +316,30 @@ class StockCrawler(BaseCrawler):
             
             klines = []
             
+            # 增量模式下查询每种时间粒度最后一根已存K线
+            last_dates = {}
+            if self.incremental:
+                last_dates = await DataProcessor.get_last_kline_dates(stock['code'])
+            
             # 根据resolution决定获取哪种数据
             if resolution is None or resolution == "1d":
-                daily_klines = await self.get_kline_data(stock['code'], stock['market'], resolution="1d")
+                daily_klines = await self.get_kline_data(stock['code'], stock['market'], resolution="1d",
+                                                         since=last_dates.get("1d"))
+                if daily_klines is None:
+                    raise CrawlerFetchError(f"日K线获取失败: {stock['code']}")
                 logger.info(f"获取到 {len(daily_klines)} 条日K线数据: {stock['code']}")
                 klines.extend(daily_klines)
                 
             if resolution is None or resolution == "1m":
-                minute_klines = await self.get_kline_data(stock['code'], stock['market'], resolution="1m")
+                minute_klines = await self.get_kline_data(stock['code'], stock['market'], resolution="1m",
+                                                          since=last_dates.get("1m"))
+                if minute_klines is None:
+                    raise CrawlerFetchError(f"分钟K线获取失败: {stock['code']}")
                 logger.info(f"获取到 {len(minute_klines)} 条分钟K线数据: {stock['code']}")
                 klines.extend(minute_klines)
             
             # 获取财务数据
-            financial = await self.get_financial_data(stock['code'], stock['market'])
+            financial = await self.fetch_financial(stock)
             if not financial:
                 logger.warning(f"未获取到财务数据: {stock['code']}")
             
@@ -230,42 +351,163 @@ class StockCrawler(BaseCrawler):
             }
             
             # 保存数据
-            await DataProcessor.save_to_db(stock_data)
-            
-            # 更新进度
-            self.processed_stocks += 1
-            await self.update_progress(self.processed_stocks, self.total_stocks)
+            await self._save(stock_data)
             
+        except CrawlerFetchError as e:
+            # 请求重试耗尽时不保存空数据,留待下次重新爬取
+            self.failed_stocks.append(stock['code'])
+            logger.error(f"处理股票失败 {stock['code']}: {str(e)}")
+            await self.record_results([], [stock['code']], str(e))
         except Exception as e:
+            self.failed_stocks.append(stock['code'])
             logger.error(f"处理股票失败 {stock['code']}: {str(e)}", exc_info=True)
+            await self.record_results([], [stock['code']], str(e))
+
+    async def _save(self, stock_data: Dict[str, Any]):
+        """将一支股票的数据和台账记录放入写入缓冲,缓冲已满时等待写库协程腾出空间"""
+        future = await get_ingest_buffer().submit_stock(stock_data, self.ledger)
+        if self.background_saves:
+            task = asyncio.ensure_future(self._finish_save(stock_data['code'], future))
+            self._saves.add(task)
+            task.add_done_callback(self._saves.discard)
+        else:
+            await self._finish_save(stock_data['code'], future)
+
+    async def _finish_save(self, code: str, future: asyncio.Future):
+        """等待写入缓冲提交一支股票的数据,然后记录结果、更新进度"""
+        try:
+            await future
+        except Exception as e:
+            self.failed_stocks.append(code)
+            await self.record_results([], [code], str(e))
+            return
+        await self.record_results([code])
+        self.processed_stocks += 1
+        await self.update_progress(self.processed_stocks, self.total_stocks)
+
+    async def record_results(self, completed: List[str], failed: List[str] = (), error: Optional[str] = None):
+        """记录处理结果,并经写入缓冲将失败的股票写入任务台账,未启用检查点时不写台账
+
+        成功的股票已随数据在同一事务中记入台账(见IngestBuffer.submit_stock)。
+        
+        Args:
+            completed: 处理成功的股票代码
+            failed: 处理失败的股票代码
+            error: 失败原因
+        """
+        self.completed_stocks.extend(completed)
+        if not self.ledger:
+            return
+        try:
+            await get_ingest_buffer().mark(self.ledger, list(failed), "failed", error)
+        except Exception as e:
+            logger.error(f"写入任务台账失败 {self.ledger.run_id}: {str(e)}", exc_info=True)
     
-    async def run(self, stock_count: int = 10, resolution: Optional[str] = None):
+    async def crawl_stocks(self, stocks: List[Dict[str, str]], resolution: Optional[str] = None,
+                           mode: Optional[str] = None):
+        """并发处理股票列表
+        
+        Args:
+            stocks: 股票信息列表
+            resolution: 时间粒度,None表示同时获取日线和分钟线
+            mode: concurrent(每个工作协程依次获取、解析、写库)、
+                  pipeline(获取、解析、写库分阶段并行)或
+                  sharded(分片到多个工作进程),默认读取配置
+        """
+        mode = mode or self.mode
+        if mode == "sharded":
+            # 各工作进程自行预取财务数据
+            await ShardedCrawl(self, resolution).run(stocks)
+            return
+
+        # 批量预取财务数据,每支股票省去一次单独的行情请求
+        self._prefetched_financials = await self.get_financial_data_batch(stocks)
+
+        if mode == "pipeline":
+            await CrawlPipeline(self, resolution).run(stocks)
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for stock in stocks:
+            queue.put_nowait(stock)
+
+        async def worker():
+            while True:
+                try:
+                    stock = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await self.process_stock(stock, resolution)
+
+        worker_count = min(self.concurrency, len(stocks)) or 1
+        logger.info(f"启动 {worker_count} 个工作协程处理 {len(stocks)} 支股票")
+        # 写入由写入缓冲合并提交,工作协程只在缓冲已满时等待
+        self.background_saves = True
+        try:
+            await asyncio.gather(*(worker() for _ in range(worker_count)))
+            while self._saves:
+                await asyncio.gather(*self._saves)
+        finally:
+            self.background_saves = False
+    
+    async def run(self, stock_count: Optional[int] = 10, resolution: Optional[str] = None,
+                  mode: Optional[str] = None, run_id: Optional[str] = None):
         """运行爬虫
         
         Args:
-            stock_count: 要爬取的股票数量
+            stock_count: 要爬取的股票数量,0或None表示全市场
             resolution: 时间粒度,1m(分钟线)或1d(日线),None表示两种都爬取
+            mode: 爬取模式,concurrent、pipeline或sharded,默认读取配置
+            run_id: 任务ID,指定时记录检查点;该任务已存在时续跑,
+                    跳过已完成且数据新鲜的股票
         """
-        logger.info(f"爬虫开始运行... 股票数量:{stock_count}, 时间粒度:{resolution or '全部'}")
+        mode = mode or self.mode
+        logger.info(f"爬虫开始运行... 股票数量:{stock_count}, 时间粒度:{resolution or '全部'}, "
+                    f"并发数:{self.concurrency}, 模式:{mode}, 任务:{run_id or '-'}")
+        self.ledger = CrawlLedger(run_id) if run_id else None
         try:
-            # 获取指定数量的股票
-            stocks = await self.get_stock_list(limit=stock_count)
-            self.total_stocks = len(stocks)
-            self.processed_stocks = 0
+            stocks, skipped = [], []
+            if self.ledger:
+                resumed = await self.ledger.start({
+                    'stock_count': stock_count,
+                    'resolution': resolution,
+                    'mode': mode
+                })
+                if resumed:
+                    stocks, skipped = await self.ledger.plan(config.crawler_resume_fresh_hours)
+                    logger.info(f"续跑任务 {run_id}: 跳过 {len(skipped)} 支已完成股票, 待处理 {len(stocks)} 支")
+
+            if not stocks and not skipped:
+                # 获取指定数量的股票,每页到达时同步写入stocks表
+                stocks = await self.stock_list.sync(limit=stock_count or None)
+                if self.ledger:
+                    await self.ledger.register_stocks(stocks)
+
+            self.total_stocks = len(stocks) + len(skipped)
+            self.processed_stocks = len(skipped)
+            self.failed_stocks = []
+            self.completed_stocks = []
+            self._reported_progress = -1
             
             # 发送初始进度
-            await self.update_progress(0, self.total_stocks)
-            await asyncio.sleep(1)  # 等待初始进度发送完成
+            await self.update_progress(self.processed_stocks, self.total_stocks)
+            if self.progress_callback:
+                await asyncio.sleep(1)  # 等待初始进度发送完成
             
-            # 处理每个股票
-            for stock in stocks:
-                await self.process_stock(stock, resolution)
-                await asyncio.sleep(1)  # 控制请求频率
+            # 并发处理股票,请求频率由主机限流器控制
+            if stocks:
+                await self.crawl_stocks(stocks, resolution, mode)
             
             # 发送最终进度
             await self.update_progress(self.total_stocks, self.total_stocks)
+            if self.failed_stocks:
+                logger.warning(f"{len(self.failed_stocks)} 支股票获取失败: {self.failed_stocks[:20]}")
+            if self.ledger:
+                await self.ledger.finish("completed")
             logger.info("爬虫运行完成")
             
         except Exception as e:
             logger.error(f"爬虫运行失败: {str(e)}", exc_info=True)
+            if self.ledger:
+                await self.ledger.finish("failed", str(e))
             raise
@@ -0,0 +1,188 @@
+"""
+股票列表爬虫模块,分页获取上交所和深交所全部A股
+"""
+import re
+import logging
+import asyncio
+from typing import Dict, List, Optional, Tuple, AsyncIterator, Iterable
+
+from app.core.config import config
+from app.crawler.base import BaseCrawler
+from app.crawler.data_processor import DataProcessor
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+class StockListCrawler(BaseCrawler):
+    """股票列表爬虫,并发获取各交易所的所有分页"""
+
+    MARKETS = ("SH", "SZ")
+
+    def __init__(self, page_size: Optional[int] = None, **kwargs):
+        """初始化爬虫
+
+        Args:
+            page_size: 每页股票数量,默认读取配置(深交所分页大小固定,不受此参数影响)
+            **kwargs: 传递给BaseCrawler的参数
+        """
+        super().__init__(**kwargs)
+        self.page_size = page_size or config.crawler_list_page_size
+
+    async def _fetch_sse_page(self, page: int) -> Tuple[List[Dict[str, str]], int]:
+        """获取上交所一页股票
+
+        Returns:
+            (股票列表, 总页数)
+        """
+        params = {
+            'stockType': 1,
+            'isPagination': 'true',
+            'pageHelp.cacheSize': 1,
+            'pageHelp.beginPage': page,
+            'pageHelp.pageSize': self.page_size,
+            'pageHelp.pageNo': page,
+        }
+        headers = {'Referer': 'http://www.sse.com.cn/'}
+        data = await self.make_request(self.endpoints['sse_stock_list'], params, headers)
+        if not data:
+            return [], 0
+
+        page_help = data.get('pageHelp', {})
+        stocks = [
+            {
+                'code': item['SECURITY_CODE_A'],
+                'name': item['SECURITY_ABBR_A'],
+                'market': 'SH'
+            }
+            for item in page_help.get('data', [])
+            if item.get('SECURITY_CODE_A')
+        ]
+        return stocks, int(page_help.get('pageCount') or 0)
+
+    async def _fetch_szse_page(self, page: int) -> Tuple[List[Dict[str, str]], int]:
+        """获取深交所一页股票
+
+        Returns:
+            (股票列表, 总页数)
+        """
+        params = {
+            'SHOWTYPE': 'JSON',
+            'CATALOGID': '1110',
+            'TABKEY': 'tab1',
+            'PAGENO': page,
+        }
+        headers = {'Referer': 'http://www.szse.cn/'}
+        data = await self.make_request(self.endpoints['szse_stock_list'], params, headers)
+        if not data:
+            return [], 0
+
+        # 深交所返回多个数据表,A股列表是第一个
+        table = data[0] if isinstance(data, list) and data else {}
+        stocks = [
+            {
+                'code': item['agdm'],
+                'name': _TAG_RE.sub('', item.get('agjc', '')).strip(),
+                'market': 'SZ'
+            }
+            for item in table.get('data', [])
+            if item.get('agdm')
+        ]
+        return stocks, int(table.get('metadata', {}).get('pagecount') or 0)
+
+    async def _fetch_page(self, market: str, page: int) -> Tuple[List[Dict[str, str]], int]:
+        """获取指定交易所的一页股票,失败时返回空列表"""
+        fetch = self._fetch_sse_page if market == 'SH' else self._fetch_szse_page
+        try:
+            return await fetch(page)
+        except Exception as e:
+            logger.error(f"获取股票列表分页失败: {market} 第{page}页, 错误: {str(e)}", exc_info=True)
+            return [], 0
+
+    async def iter_pages(self, markets: Iterable[str] = MARKETS,
+                         max_items: Optional[int] = None) -> AsyncIterator[List[Dict[str, str]]]:
+        """按到达顺序逐页产出股票列表
+
+        先并发请求各交易所第一页以获得总页数,再并发请求其余所有分页,
+        每页一到达就产出,调用方可以边接收边处理。并发度由主机限流器控制。
+
+        Args:
+            markets: 要获取的交易所
+            max_items: 需要的股票数量,首页已足够时不再请求其余分页
+
+        Yields:
+            一页股票列表
+        """
+        markets = list(markets)
+        pending = []
+        try:
+            first_pages = await asyncio.gather(*(self._fetch_page(market, 1) for market in markets))
+            enough = max_items is not None and sum(len(stocks) for stocks, _ in first_pages) >= max_items
+            for market, (stocks, page_count) in zip(markets, first_pages):
+                logger.info(f"{market} 股票列表共 {page_count} 页")
+                if enough:
+                    continue
+                pending.extend(
+                    asyncio.ensure_future(self._fetch_page(market, page))
+                    for page in range(2, page_count + 1)
+                )
+            for stocks, _ in first_pages:
+                if stocks:
+                    yield stocks
+
+            for future in asyncio.as_completed(pending):
+                stocks, _ = await future
+                if stocks:
+                    yield stocks
+        finally:
+            # 调用方提前停止迭代时取消剩余请求
+            for task in pending:
+                task.cancel()
+
+    async def fetch_all(self, limit: Optional[int] = None, markets: Iterable[str] = MARKETS) -> List[Dict[str, str]]:
+        """获取股票列表
+
+        Args:
+            limit: 最多返回的股票数量,None表示全部
+            markets: 要获取的交易所
+
+        Returns:
+            股票列表,每个元素包含code、name、market字段
+        """
+        stocks: List[Dict[str, str]] = []
+        pages = self.iter_pages(markets, max_items=limit)
+        try:
+            async for page in pages:
+                stocks.extend(page)
+                if limit is not None and len(stocks) >= limit:
+                    break
+        finally:
+            await pages.aclose()
+        return stocks[:limit] if limit is not None else stocks
+
+    async def sync(self, limit: Optional[int] = None, markets: Iterable[str] = MARKETS) -> List[Dict[str, str]]:
+        """获取股票列表并在每页到达时写入stocks表
+
+        Args:
+            limit: 最多同步的股票数量,None表示全部
+            markets: 要获取的交易所
+
+        Returns:
+            已同步的股票列表
+        """
+        stocks: List[Dict[str, str]] = []
+        pages = self.iter_pages(markets, max_items=limit)
+        try:
+            async for page in pages:
+                if limit is not None:
+                    page = page[:limit - len(stocks)]
+                await DataProcessor.save_stock_list(page)
+                stocks.extend(page)
+                if limit is not None and len(stocks) >= limit:
+                    break
+        finally:
+            await pages.aclose()
+        logger.info(f"已同步 {len(stocks)} 支股票到数据库")
+        return stocks
@@ -12,6 +12,11 @@ import logging
 from .core.database import init_db
 from .core.config import config
 from .routers import stocks_router, crawler_router, analysis_router
+from .crawler.base import BaseCrawler
+from .crawler.checkpoint import CrawlLedger
+from .crawler.ingest import stop_ingest_buffer
+from .crawler.intraday import start_intraday_poller, stop_intraday_poller
+from .crawler.scheduler import start_scheduler, stop_scheduler
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -39,6 +44,21 @@ async def startup_event():
     logger.info("正在初始化数据库...")
     await init_db()
     logger.info("数据库初始化完成")
+    await CrawlLedger.mark_interrupted_runs()
+    await BaseCrawler.startup()
+    if config.crawler_intraday.get("enabled", False):
+        await start_intraday_poller()
+    if config.crawler_scheduler.get("enabled", False):
+        await start_scheduler()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时执行"""
+    await stop_intraday_poller()
+    await stop_scheduler()
+    # 写完缓冲中尚未提交的数据
+    await stop_ingest_buffer()
+    await BaseCrawler.shutdown()
 
 if __name__ == "__main__":
     import uvicorn
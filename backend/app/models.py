@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -14,11 +14,14 @@ class Stock(Base):
 
 class KLineData(Base):
     __tablename__ = "kline_data"
+    # 自然键: 同一股票、时间粒度和时间只保留一根K线,批量写入按此键upsert;
+    # 读取都按stock_id+resolution过滤、按date范围查询和排序,该索引同时覆盖这些查询
+    __table_args__ = (Index("uq_kline_stock_res_date", "stock_id", "resolution", "date", unique=True),)
     
     id = Column(Integer, primary_key=True, index=True)
     stock_id = Column(Integer, ForeignKey("stocks.id"))
-    date = Column(DateTime, index=True)  # 日期时间,精确到分钟
-    resolution = Column(String, default="1d", index=True)  # 时间粒度: 1m(1分钟), 1d(日线)
+    date = Column(DateTime)  # 日期时间,精确到分钟
+    resolution = Column(String, default="1d")  # 时间粒度: 1m(1分钟), 1d(日线)
     open = Column(Float)
     high = Column(Float)
     low = Column(Float)
@@ -28,10 +31,12 @@ class KLineData(Base):
 
 class FinancialData(Base):
     __tablename__ = "financial_data"
+    # 每支股票每天一条快照,只追加不覆盖历史;同一天重复爬取时更新当天的快照
+    __table_args__ = (Index("uq_financial_stock_date", "stock_id", "date", unique=True),)
     
     id = Column(Integer, primary_key=True, index=True)
     stock_id = Column(Integer, ForeignKey("stocks.id"))
-    date = Column(DateTime, index=True)
+    date = Column(DateTime)  # 快照日期(当天0点)
     pe_ratio = Column(Float)  # 市盈率
     pb_ratio = Column(Float)  # 市净率
     total_market_value = Column(Float)  # 总市值
@@ -39,3 +44,43 @@ class FinancialData(Base):
     revenue = Column(Float)  # 营收
     net_profit = Column(Float)  # 净利润
     roe = Column(Float)  # 净资产收益率
+
+class LatestFinancialData(Base):
+    __tablename__ = "latest_financial_data"
+    # 每支股票最新的一条财务快照,写入快照时同步维护,按主键直接查找
+
+    stock_id = Column(Integer, ForeignKey("stocks.id"), primary_key=True)
+    date = Column(DateTime)  # 快照日期
+    pe_ratio = Column(Float)  # 市盈率
+    pb_ratio = Column(Float)  # 市净率
+    total_market_value = Column(Float)  # 总市值
+    circulating_market_value = Column(Float)  # 流通市值
+    revenue = Column(Float)  # 营收
+    net_profit = Column(Float)  # 净利润
+    roe = Column(Float)  # 净资产收益率
+
+class CrawlRun(Base):
+    __tablename__ = "crawl_runs"
+
+    id = Column(String, primary_key=True)  # 任务ID
+    status = Column(String, default="running")  # running/completed/failed/interrupted
+    params = Column(Text)  # 启动参数(JSON)
+    total = Column(Integer, default=0)  # 股票总数
+    completed = Column(Integer, default=0)  # 已完成数量
+    failed = Column(Integer, default=0)  # 失败数量
+    error = Column(Text)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+class CrawlRunItem(Base):
+    __tablename__ = "crawl_run_items"
+    __table_args__ = (UniqueConstraint("run_id", "code", name="uq_crawl_run_item"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(String, ForeignKey("crawl_runs.id"), index=True)
+    code = Column(String)  # 股票代码
+    name = Column(String)
+    market = Column(String)
+    status = Column(String, default="pending")  # pending/completed/failed
+    error = Column(Text)
+    updated_at = Column(DateTime)  # 最后一次处理时间
@@ -6,9 +6,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from ..core.database import get_db
-from ..models import Stock, KLineData
+from ..models import Stock
+from ..core.kline_store import get_kline_store
 from ..services.ai import StockAnalyzer
 from app.core.config import config
+from app.crawler.scheduler import record_demand
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -65,32 +67,14 @@ async def analyze_stock(
 
         if not stock:
             raise HTTPException(status_code=404, detail="股票不存在")
+        # AI分析依赖最新数据,访问权重高于查看K线
+        record_demand(code, weight=2.0)
 
         logger.info(f"已查询到股票信息,即将开始分析股票: {code}")
 
         # 2. 获取K线数据(用于技术分析)
-        kline_query = (
-            select(KLineData)
-            .where(KLineData.stock_id == stock.id)
-            .where(KLineData.resolution == "1d")  # 使用日线数据
-            .order_by(KLineData.date.desc())
-            .limit(30)  # 最近30天数据
-        )
-        result = await db.execute(kline_query)
-        klines = result.scalars().all()
-
-        # 转换为字典列表
-        kline_data = [
-            {
-                "date": kline.date,
-                "open": kline.open,
-                "high": kline.high,
-                "low": kline.low,
-                "close": kline.close,
-                "volume": kline.volume,
-                "turnover": kline.turnover
-            } for kline in klines
-        ]
+        # 使用最近30天日线数据
+        kline_data = await get_kline_store().read(stock.id, "1d", descending=True, limit=30, session=db)
 
         # 3. 流式返回AI分析结果
         analyzer = StockAnalyzer()
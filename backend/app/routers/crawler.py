@@ -1,6 +1,7 @@
 """
 爬虫相关API路由
 """
+import uuid
 import asyncio
 import logging
 import json
@@ -12,7 +13,14 @@ from typing import Dict, List, Optional, AsyncIterator
 from functools import partial
 
 from ..utils.progress import progress_manager
+from ..utils.metrics import registry, crawl_totals, summarize_since
 from app.crawler.stock_crawler import StockCrawler
+from app.crawler.cache import get_response_cache
+from app.crawler.resilience import breaker_states
+from app.crawler.checkpoint import CrawlLedger
+from app.crawler.backfill import Backfiller
+from app.crawler.intraday import get_intraday_poller, start_intraday_poller, stop_intraday_poller
+from app.crawler.scheduler import get_scheduler, start_scheduler, stop_scheduler
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -22,8 +30,15 @@ crawler_tasks: Dict[str, dict] = {}
 
 router = APIRouter()
 
-async def progress_callback(task_id: str, current: int, total: int):
-    """爬虫进度回调"""
+async def progress_callback(task_id: str, current: int, total: int, stages: Optional[dict] = None):
+    """爬虫进度回调
+
+    Args:
+        task_id: 任务ID
+        current: 已处理数量
+        total: 总数量
+        stages: 流水线模式下各阶段的吞吐量和队列深度
+    """
     logger.info(f"进度回调: {task_id} - {current}/{total}")
     try:
         # 更新任务状态
@@ -38,16 +53,18 @@ async def progress_callback(task_id: str, current: int, total: int):
                 "current": current,
                 "progress": int(current * 100 / total) if total > 0 else 0
             })
+            if stages is not None:
+                crawler_tasks[task_id]["stages"] = stages
         
         # 发送WebSocket进度
         try:
-            await progress_manager.send_ws_progress(task_id, current, total, status_str)
+            await progress_manager.send_ws_progress(task_id, current, total, status_str, stages=stages)
         except Exception as e:
             logger.error(f"发送WebSocket进度失败: {e}", exc_info=True)
             
         # 发送SSE进度
         try:
-            await progress_manager.send_sse_progress(task_id, current, total, status_str)
+            await progress_manager.send_sse_progress(task_id, current, total, status_str, stages=stages)
         except Exception as e:
             logger.error(f"发送SSE进度失败: {e}", exc_info=True)
             
@@ -56,30 +73,81 @@ async def progress_callback(task_id: str, current: int, total: int):
         crawler_tasks[task_id]["status"] = "failed"
         crawler_tasks[task_id]["error"] = str(e)
 
+async def _read_start_params(request: Request) -> dict:
+    """合并请求体和查询参数中的爬虫启动参数,查询参数优先"""
+    params = {}
+    try:
+        data = await request.json()
+        if isinstance(data, dict):
+            params.update(data)
+    except (json.JSONDecodeError, TypeError, ValueError):
+        pass
+    params.update(request.query_params)
+    return params
+
+def _new_task_id(prefix: str = "") -> str:
+    """生成新任务ID: 启动时间加随机后缀,同一秒内启动的任务也不会重复"""
+    return f"{prefix}{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+def _parse_number(params: dict, name: str, cast, default):
+    """解析数值参数,无法解析时使用默认值"""
+    value = params.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        logger.warning(f"无法解析参数 {name}={value!r},使用默认值: {default}")
+        return default
+
+def _parse_bool(params: dict, name: str, default: Optional[bool] = None) -> Optional[bool]:
+    """解析布尔参数,支持true/false/1/0"""
+    value = params.get(name)
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes", "on")
+
 @router.post("/start")
 async def start_crawler(request: Request):
-    """启动爬虫任务"""
-    task_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    """启动爬虫任务
+    
+    传入已存在的run_id时续跑该任务,未指定的参数沿用上次启动时的参数;
+    未传入run_id时总是新建任务
+    """
+    params = await _read_start_params(request)
+    run_id = params.get("run_id") or None
+    task_id = run_id or _new_task_id()
+    if crawler_tasks.get(task_id, {}).get("status") == "running":
+        return JSONResponse(status_code=409, content={"detail": f"任务正在运行: {task_id}"})
     logger.info(f"创建爬虫任务: {task_id}")
     
-    # 从请求中获取stock_count参数
-    stock_count = 10  # 默认值
-    try:
-        # 尝试从查询参数获取
-        stock_count = int(request.query_params.get("stock_count", 10))
-        logger.info(f"从查询参数获取股票数量: {stock_count}")
-    except ValueError:
-        try:
-            # 尝试从请求体获取
-            data = await request.json()
-            stock_count = int(data.get("stock_count", 10))
-            logger.info(f"从请求体获取股票数量: {stock_count}")
-        except (json.JSONDecodeError, TypeError, ValueError):
-            logger.warning(f"无法解析股票数量参数,使用默认值: {stock_count}")
+    previous = await CrawlLedger.get_run(run_id) if run_id else None
+    if previous:
+        logger.info(f"续跑爬虫任务: {task_id}, 上次状态: {previous['status']}")
+        params = {**previous["params"], **params}
+    stock_count = _parse_number(params, "stock_count", int, 10)
+    concurrency = _parse_number(params, "concurrency", int, None)
+    per_host_limit = _parse_number(params, "per_host_limit", int, None)
+    per_host_rate = _parse_number(params, "per_host_rate", float, None)
+    incremental = _parse_bool(params, "incremental")
+    resolution = params.get("resolution") or None
+    mode = params.get("mode") or None
+    if resolution not in (None, "1d", "1m"):
+        return JSONResponse(status_code=400, content={"detail": f"不支持的时间粒度: {resolution}"})
+    if mode not in (None, "concurrent", "pipeline", "sharded"):
+        return JSONResponse(status_code=400, content={"detail": f"不支持的爬取模式: {mode}"})
+    logger.info(f"爬虫参数: 股票数量={stock_count}, 并发数={concurrency}, "
+                f"单主机并发={per_host_limit}, 单主机速率={per_host_rate}, 增量同步={incremental}, 模式={mode}")
     
     # 创建带有进度回调的爬虫实例
     spider = StockCrawler(
-        progress_callback=partial(progress_callback, task_id)
+        progress_callback=partial(progress_callback, task_id),
+        concurrency=concurrency,
+        per_host_limit=per_host_limit,
+        per_host_rate=per_host_rate,
+        incremental=incremental
     )
     
     # 初始化任务状态
@@ -88,27 +156,32 @@ async def start_crawler(request: Request):
         "start_time": datetime.now(),
         "current": 0,
         "total": 0,
-        "progress": 0
+        "progress": 0,
+        "metrics_start": crawl_totals()
     }
     
     # 启动爬虫任务,传递股票数量参数
     try:
-        task = asyncio.create_task(spider.run(stock_count=stock_count))
+        task = asyncio.create_task(spider.run(
+            stock_count=stock_count, resolution=resolution, mode=mode, run_id=task_id))
         
         def on_task_done(t):
             try:
                 t.result()  # 这会抛出任何任务中的异常
                 crawler_tasks[task_id]["status"] = "completed"
+                crawler_tasks[task_id]["metrics"] = summarize_since(crawler_tasks[task_id]["metrics_start"])
+                crawler_tasks[task_id]["failed_stocks"] = spider.failed_stocks
                 logger.info(f"爬虫任务完成: {task_id}")
             except Exception as e:
                 crawler_tasks[task_id].update({
                     "status": "failed",
-                    "error": str(e)
+                    "error": str(e),
+                    "metrics": summarize_since(crawler_tasks[task_id]["metrics_start"])
                 })
                 logger.error(f"爬虫任务失败: {task_id}, 错误: {e}")
 
         task.add_done_callback(on_task_done)
-        return {"task_id": task_id, "status": "started"}
+        return {"task_id": task_id, "status": "started", "resumed": previous is not None}
     except Exception as e:
         crawler_tasks[task_id]["status"] = "failed"
         crawler_tasks[task_id]["error"] = str(e)
@@ -118,16 +191,166 @@ async def start_crawler(request: Request):
             content={"detail": str(e)}
         )
 
+@router.get("/cache")
+async def get_cache_stats():
+    """获取HTTP响应缓存的命中统计"""
+    cache = get_response_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@router.get("/metrics")
+async def get_metrics():
+    """获取爬虫指标: 按主机/接口的请求耗时直方图、下载字节数、解析和写入行数、重试和失败次数、写入缓冲状态"""
+    return registry.snapshot()
+
+@router.get("/hosts")
+async def get_host_states():
+    """获取各数据源主机的熔断器状态"""
+    return breaker_states()
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    """解析YYYY-MM-DD或YYYYMMDD格式的日期"""
+    if not value:
+        return None
+    for fmt in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.strptime(str(value), fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析日期: {value}")
+
+@router.post("/backfill")
+async def start_backfill(request: Request):
+    """启动历史K线回填任务
+    
+    参数: codes(列表或逗号分隔)、resolution(1d/1m,默认1d)、start、end(默认今天)
+    """
+    params = await _read_start_params(request)
+    codes = params.get("codes") or []
+    if isinstance(codes, str):
+        codes = [code.strip() for code in codes.split(",") if code.strip()]
+    resolution = params.get("resolution") or "1d"
+    try:
+        start = _parse_date(params.get("start"))
+        end = _parse_date(params.get("end")) or datetime.now()
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    if not codes:
+        return JSONResponse(status_code=400, content={"detail": "缺少codes参数"})
+    if resolution not in ("1d", "1m"):
+        return JSONResponse(status_code=400, content={"detail": f"不支持的时间粒度: {resolution}"})
+    if start is None or start > end:
+        return JSONResponse(status_code=400, content={"detail": "start缺失或晚于end"})
+
+    task_id = _new_task_id("backfill-")
+    logger.info(f"创建回填任务: {task_id}, {len(codes)} 支股票, {resolution}, {start:%Y-%m-%d} ~ {end:%Y-%m-%d}")
+    backfiller = Backfiller(
+        concurrency=_parse_number(params, "concurrency", int, None),
+        progress_callback=partial(progress_callback, task_id)
+    )
+    crawler_tasks[task_id] = {
+        "status": "running",
+        "start_time": datetime.now(),
+        "current": 0,
+        "total": len(codes),
+        "progress": 0,
+        "metrics_start": crawl_totals()
+    }
+    task = asyncio.create_task(backfiller.run(codes, resolution, start, end))
+
+    def on_task_done(t):
+        metrics = summarize_since(crawler_tasks[task_id]["metrics_start"])
+        try:
+            crawler_tasks[task_id].update({"status": "completed", "metrics": metrics, **t.result()})
+            logger.info(f"回填任务完成: {task_id}")
+        except Exception as e:
+            crawler_tasks[task_id].update({"status": "failed", "error": str(e), "metrics": metrics})
+            logger.error(f"回填任务失败: {task_id}, 错误: {e}")
+
+    task.add_done_callback(on_task_done)
+    return {"task_id": task_id, "status": "started"}
+
+@router.post("/intraday/start")
+async def start_intraday(request: Request):
+    """启动盘中分钟线轮询,可通过codes参数(列表或逗号分隔)指定关注的股票"""
+    params = await _read_start_params(request)
+    codes = params.get("codes") or None
+    if isinstance(codes, str):
+        codes = [code.strip() for code in codes.split(",") if code.strip()]
+    interval = _parse_number(params, "interval", float, None)
+    poller = await start_intraday_poller(codes=codes, interval=interval)
+    if not poller.codes:
+        await stop_intraday_poller()
+        return JSONResponse(status_code=400, content={"detail": "关注列表为空"})
+    return poller.status()
+
+@router.post("/intraday/stop")
+async def stop_intraday():
+    """停止盘中分钟线轮询"""
+    await stop_intraday_poller()
+    return {"running": False}
+
+@router.get("/intraday/status")
+async def get_intraday_status():
+    """获取盘中分钟线轮询状态"""
+    poller = get_intraday_poller()
+    if poller is None:
+        return {"running": False}
+    return poller.status()
+
+@router.post("/scheduler/start")
+async def start_crawl_scheduler(request: Request):
+    """启动陈旧度优先的后台爬取调度器"""
+    params = await _read_start_params(request)
+    resolution = params.get("resolution") or None
+    if resolution not in (None, "1d", "1m"):
+        return JSONResponse(status_code=400, content={"detail": f"不支持的时间粒度: {resolution}"})
+    scheduler = await start_scheduler(
+        requests_per_minute=_parse_number(params, "requests_per_minute", float, None),
+        workers=_parse_number(params, "workers", int, None),
+        resolution=resolution
+    )
+    return scheduler.status()
+
+@router.post("/scheduler/stop")
+async def stop_crawl_scheduler():
+    """停止后台爬取调度器"""
+    await stop_scheduler()
+    return {"running": False}
+
+@router.get("/scheduler/status")
+async def get_scheduler_status():
+    """获取调度器状态和待刷新队列队首的股票"""
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return {"running": False}
+    return scheduler.status()
+
 @router.get("/status/{task_id}")
 async def get_crawler_status(task_id: str):
     """获取爬虫任务状态"""
     if task_id not in crawler_tasks:
+        # 内存中没有时查询持久化的任务台账,例如进程重启前的任务
+        run = await CrawlLedger.get_run(task_id)
+        if run:
+            return {
+                **run,
+                "current": run["completed"],
+                "progress": int(run["completed"] * 100 / run["total"]) if run["total"] else 0,
+                "message": "爬虫任务已中断,可使用相同run_id续跑" if run["status"] == "interrupted"
+                           else f"爬虫任务状态: {run['status']}"
+            }
         return JSONResponse(
             status_code=404,
             content={"detail": "Task not found"}
         )
         
     task_info = crawler_tasks[task_id].copy()
+    metrics_start = task_info.pop("metrics_start", None)
+    if "metrics" not in task_info and metrics_start is not None:
+        # 运行中的任务实时汇总指标增量
+        task_info["metrics"] = summarize_since(metrics_start)
     if task_info.get("status") == "running":
         task_info["message"] = "爬虫任务进行中"
     elif task_info.get("status") == "completed":
@@ -185,6 +408,8 @@ async def websocket_endpoint(websocket: WebSocket, task_id: str):
                     "percentage": int(current * 100 / total) if total > 0 else 0,
                     "status": status
                 }
+                if "stages" in task_info:
+                    message["stages"] = task_info["stages"]
                 
                 await websocket.send_json(message)
                 logger.info(f"发送WebSocket进度消息: {message}")
@@ -1,34 +1,83 @@
 """
 股票相关API路由
 """
+import time
+import logging
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict
 
-from ..models import Stock, KLineData, FinancialData
-from ..core.database import get_db
+from ..models import Stock, FinancialData, LatestFinancialData
+from ..core.config import config
+from ..core.database import get_db, AsyncSessionLocal
+from ..core.kline_store import get_kline_store
+from ..utils.singleflight import SingleFlight, FRESH
 from ..services.ai import StockAnalyzer
+from ..crawler.base import CrawlerFetchError
 from ..crawler.stock_crawler import StockCrawler
+from ..crawler.data_processor import FINANCIAL_VALUE_COLUMNS
+from ..crawler.scheduler import record_demand
+
+# 配置日志
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 相同股票和时间粒度的并发刷新只执行一次
+refresh_flights = SingleFlight(cooldown=config.crawler_refresh_cooldown)
+# 行情接口查无此股票的代码及查询时间,冷却时间内直接返回404
+unknown_codes: Dict[str, float] = {}
+
 
 @router.get("/", response_model=List[dict])
 async def get_stocks(db: AsyncSession = Depends(get_db)):
-    """获取所有股票基本信息"""
-    query = select(Stock)
-    result = await db.execute(query)
-    stocks = result.scalars().all()
-    return [
+    """获取所有股票基本信息
+
+    只查询需要的列,数据库行直接序列化为响应,不创建ORM对象,
+    也不经过response_model校验和jsonable_encoder
+    """
+    table = Stock.__table__
+    result = await db.execute(select(table.c.code, table.c.name, table.c.market, table.c.updated_at))
+    return JSONResponse(content=[
         {
-            "code": stock.code,
-            "name": stock.name,
-            "market": stock.market,
-            "updated_at": stock.updated_at
-        } for stock in stocks
-    ]
+            "code": code,
+            "name": name,
+            "market": market,
+            "updated_at": updated_at.isoformat() if updated_at else None
+        } for code, name, market, updated_at in result
+    ])
+
+
+@router.get("/valuation")
+async def get_valuation(
+    sort_by: str = "total_market_value",
+    ascending: bool = False,
+    limit: Optional[int] = 100,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取全市场股票的最新估值(每支股票一条最新财务快照)
+
+    Args:
+        sort_by: 排序字段,如pe_ratio、pb_ratio、total_market_value
+        ascending: 是否升序
+        limit: 返回数量,0表示全部
+    """
+    if sort_by not in FINANCIAL_VALUE_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"不支持的排序字段: {sort_by}")
+    sort_column = getattr(LatestFinancialData, sort_by)
+    columns = [getattr(LatestFinancialData, column) for column in FINANCIAL_VALUE_COLUMNS]
+    query = (
+        select(Stock.code, Stock.name, LatestFinancialData.date, *columns)
+        .join(Stock, Stock.id == LatestFinancialData.stock_id)
+        .order_by(sort_column.asc() if ascending else sort_column.desc())
+    )
+    if limit:
+        query = query.limit(limit)
+    result = await db.execute(query)
+    return [dict(zip(("code", "name", "date", *FINANCIAL_VALUE_COLUMNS), row)) for row in result.all()]
 
 
 @router.get("/{code}")
@@ -60,24 +109,22 @@ async def get_stock_kline(
 ):
     """获取股票K线数据
 
+    K线以元组读取后直接序列化为响应,分钟K数万根时不再为每根K线创建ORM对象和中间字典
+
     Args:
         code: 股票代码
         start_date: 起始日期
         end_date: 结束日期
         resolution: 时间粒度(1m: 分钟线, 1d: 日线)
     """
-    query = select(Stock).where(Stock.code == code)
-    result = await db.execute(query)
-    stock = result.scalar_one_or_none()
+    result = await db.execute(select(Stock.__table__.c.id).where(Stock.__table__.c.code == code))
+    stock_id = result.scalar_one_or_none()
 
-    if not stock:
+    if stock_id is None:
         raise HTTPException(status_code=404, detail="股票不存在")
+    record_demand(code)
 
-    kline_query = select(KLineData).where(
-        KLineData.stock_id == stock.id,
-        KLineData.resolution == resolution
-    )
-
+    start_datetime = end_datetime = None
     current_time = datetime.now()
 
     # 处理盘前数据请求
@@ -92,11 +139,6 @@ async def get_stock_kline(
             end_datetime = current_time - timedelta(days=1)
             end_datetime = end_datetime.replace(
                 hour=15, minute=0, second=0)  # 设置为前一天收盘时间
-
-            kline_query = kline_query.where(
-                KLineData.date >= start_datetime,
-                KLineData.date <= end_datetime
-            )
     else:
         # 常规处理日期过滤
         date_format = "%Y-%m-%d" if resolution == "1d" else "%Y-%m-%d %H:%M"
@@ -107,7 +149,6 @@ async def get_stock_kline(
             except ValueError:
                 # 尝试用日期格式解析
                 start_datetime = datetime.strptime(start_date, "%Y-%m-%d")
-            kline_query = kline_query.where(KLineData.date >= start_datetime)
 
         if end_date:
             try:
@@ -119,52 +160,51 @@ async def get_stock_kline(
                 if resolution == "1m":
                     end_datetime = end_datetime.replace(
                         hour=23, minute=59, second=59)
-            kline_query = kline_query.where(KLineData.date <= end_datetime)
 
     # 排序: 日K按日期升序,分钟K按时间降序(展示最新的分钟数据)
-    if resolution == "1d":
-        kline_query = kline_query.order_by(KLineData.date.asc())
-    else:
-        kline_query = kline_query.order_by(KLineData.date.desc())
-
-    result = await db.execute(kline_query)
-    klines = result.scalars().all()
+    rows = await get_kline_store().read_rows(
+        stock_id, resolution, start_datetime, end_datetime,
+        descending=resolution != "1d", session=db
+    )
 
-    return [
+    # 元组字段顺序见KLINE_COLUMNS
+    return JSONResponse(content=[
         {
-            "date": kline.date,
-            "open": kline.open,
-            "high": kline.high,
-            "low": kline.low,
-            "close": kline.close,
-            "volume": kline.volume,
-            "turnover": kline.turnover,
-            "resolution": kline.resolution
-        } for kline in klines
-    ]
-
+            "date": date.isoformat(),
+            "open": open_,
+            "high": high,
+            "low": low,
+            "close": close,
+            "volume": volume,
+            "turnover": turnover,
+            "resolution": resolution
+        } for date, open_, close, high, low, volume, turnover in rows
+    ])
+
+
+async def _refresh_stock(code: str, resolution: Optional[str]) -> dict:
+    """爬取并保存单支股票数据,由refresh_flights保证同一时间只执行一次"""
+    async with AsyncSessionLocal() as db:
+        query = select(Stock).where(Stock.code == code)
+        result = await db.execute(query)
+        stock = result.scalar_one_or_none()
+
+        # 创建爬虫实例
+        spider = StockCrawler()
 
-@router.get("/{code}/refresh")
-async def refresh_stock_data(code: str, db: AsyncSession = Depends(get_db)):
-    """刷新单支股票数据"""
-    query = select(Stock).where(Stock.code == code)
-    result = await db.execute(query)
-    stock = result.scalar_one_or_none()
-
-    # 创建爬虫实例
-    spider = StockCrawler()
-
-    try:
         if not stock:
-            # 如果股票不在数据库中,获取股票基本信息
-            stocks = await spider.get_stock_list()
-            stock_info = None
-            for s in stocks:
-                if s['code'] == code:
-                    stock_info = s
-                    break
+            # 如果股票不在数据库中,按代码推断交易所并通过一次行情请求确认
+            try:
+                stock_info = await spider.lookup_stock(code)
+            except CrawlerFetchError:
+                raise HTTPException(status_code=502, detail="数据源暂时不可用,请稍后重试")
 
             if not stock_info:
+                now = time.monotonic()
+                for stale in [c for c, checked_at in unknown_codes.items()
+                              if now - checked_at >= refresh_flights.cooldown]:
+                    del unknown_codes[stale]
+                unknown_codes[code] = now
                 raise HTTPException(status_code=404, detail="找不到该股票信息")
         else:
             # 如果股票已存在,使用数据库中的信息
@@ -175,13 +215,38 @@ async def refresh_stock_data(code: str, db: AsyncSession = Depends(get_db)):
             }
 
         # 处理股票数据(获取K线和财务数据)
-        await spider.process_stock(stock_info)
+        await spider.process_stock(stock_info, resolution)
+        if spider.failed_stocks:
+            raise HTTPException(status_code=502, detail="数据源暂时不可用,请稍后重试")
 
         # 更新股票更新时间
-        stock.updated_at = datetime.now()
-        await db.commit()
+        refreshed_at = datetime.now()
+        if stock:
+            stock.updated_at = refreshed_at
+            await db.commit()
+
+        return {"message": "股票数据更新成功", "refreshed_at": refreshed_at}
 
-        return {"message": "股票数据更新成功"}
+
+@router.get("/{code}/refresh")
+async def refresh_stock_data(code: str, resolution: Optional[str] = None):
+    """刷新单支股票数据
+    
+    同一股票和时间粒度的并发请求共享同一次刷新,刷新完成后的冷却时间内直接返回该结果。
+    返回中的coalesced表示本次请求是否由已在进行(或刚完成)的刷新提供。
+    """
+    if resolution not in (None, "1d", "1m"):
+        raise HTTPException(status_code=400, detail=f"不支持的时间粒度: {resolution}")
+    checked_at = unknown_codes.get(code)
+    if checked_at is not None:
+        if time.monotonic() - checked_at < refresh_flights.cooldown:
+            raise HTTPException(status_code=404, detail="找不到该股票信息")
+        del unknown_codes[code]
+    try:
+        result, source = await refresh_flights.do((code, resolution), lambda: _refresh_stock(code, resolution))
+        return {**result, "coalesced": source != FRESH, "source": source}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"刷新股票数据失败: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"刷新股票数据失败: {str(e)}")
@@ -197,15 +262,8 @@ async def get_stock_financial(code: str, db: AsyncSession = Depends(get_db)):
     if not stock:
         raise HTTPException(status_code=404, detail="股票不存在")
 
-    financial_query = (
-        select(FinancialData)
-        .where(FinancialData.stock_id == stock.id)
-        .order_by(FinancialData.date.desc())
-        .limit(1)
-    )
-
-    result = await db.execute(financial_query)
-    financial = result.scalar_one_or_none()
+    # 最新快照表按主键查找,不需要排序
+    financial = await db.get(LatestFinancialData, stock.id)
 
     if not financial:
         raise HTTPException(status_code=404, detail="没有找到财务数据")
@@ -220,3 +278,38 @@ async def get_stock_financial(code: str, db: AsyncSession = Depends(get_db)):
         "roe": financial.roe,
         "date": financial.date
     }
+
+
+@router.get("/{code}/financial/history")
+async def get_stock_financial_history(
+    code: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取股票每日财务快照(市盈率、市净率、市值等),按日期升序,用于绘制估值走势
+
+    Args:
+        code: 股票代码
+        start_date: 起始日期(YYYY-MM-DD)
+        end_date: 结束日期(YYYY-MM-DD)
+    """
+    query = select(Stock).where(Stock.code == code)
+    result = await db.execute(query)
+    stock = result.scalar_one_or_none()
+
+    if not stock:
+        raise HTTPException(status_code=404, detail="股票不存在")
+
+    columns = [getattr(FinancialData, column) for column in FINANCIAL_VALUE_COLUMNS]
+    history_query = select(FinancialData.date, *columns).where(FinancialData.stock_id == stock.id)
+    try:
+        if start_date:
+            history_query = history_query.where(FinancialData.date >= datetime.strptime(start_date, "%Y-%m-%d"))
+        if end_date:
+            history_query = history_query.where(FinancialData.date <= datetime.strptime(end_date, "%Y-%m-%d"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日期格式应为YYYY-MM-DD")
+
+    result = await db.execute(history_query.order_by(FinancialData.date.asc()))
+    return [dict(zip(("date", *FINANCIAL_VALUE_COLUMNS), row)) for row in result.all()]
@@ -0,0 +1,211 @@
+"""
+进程内指标模块
+
+提供带标签的计数器、瞬时值和直方图,用于统计爬虫的请求耗时、下载字节数、解析和写入行数、
+重试和失败次数等;通过/api/crawler/metrics导出,并汇总到爬虫任务状态中。
+"""
+import bisect
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+# 请求耗时直方图的默认分桶上界(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    """带标签的单调递增计数器"""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        """增加计数,标签必须与定义时一致"""
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self) -> float:
+        """所有标签组合的合计"""
+        return sum(self._values.values())
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {"labels": dict(zip(self.labels, key)), "value": value}
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge:
+    """带标签的瞬时值,如队列长度"""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str):
+        """设置当前值"""
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        self._values[key] = value
+
+    def value(self, **labels: str) -> float:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        return self._values.get(key, 0)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {"labels": dict(zip(self.labels, key)), "value": value}
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram:
+    """带标签的分桶直方图"""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # 标签 -> [各桶计数(最后一个为溢出桶), 总数, 总和]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: str):
+        """记录一个观测值"""
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += 1
+        entry[2] += value
+
+    def merged_counts(self) -> List[int]:
+        """合并所有标签组合的分桶计数"""
+        counts = [0] * (len(self.buckets) + 1)
+        for bucket_counts, _, _ in self._values.values():
+            counts = [a + b for a, b in zip(counts, bucket_counts)]
+        return counts
+
+    def quantile(self, q: float, counts: Optional[List[int]] = None) -> Optional[float]:
+        """根据分桶估算分位数,返回所在桶的上界;落入溢出桶时返回最大上界"""
+        return bucket_quantile(self.buckets, counts if counts is not None else self.merged_counts(), q)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        result = []
+        for key, (counts, count, total) in sorted(self._values.items()):
+            result.append({
+                "labels": dict(zip(self.labels, key)),
+                "count": count,
+                "sum": round(total, 6),
+                "buckets": {str(bound): n for bound, n in zip((*self.buckets, "+Inf"), counts)},
+                "p50": bucket_quantile(self.buckets, counts, 0.5),
+                "p99": bucket_quantile(self.buckets, counts, 0.99),
+            })
+        return result
+
+
+def bucket_quantile(buckets: Sequence[float], counts: List[int], q: float) -> Optional[float]:
+    """由分桶计数估算分位数"""
+    total = sum(counts)
+    if not total:
+        return None
+    target = q * total
+    cumulative = 0
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        if cumulative >= target:
+            return bound
+    return buckets[-1]
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._metrics.setdefault(name, Gauge(name, description, labels))
+
+    def histogram(self, name: str, description: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, description, labels, buckets))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回所有指标的当前值"""
+        return {
+            name: {
+                "type": type(metric).__name__.lower(),
+                "description": metric.description,
+                "values": metric.snapshot(),
+            }
+            for name, metric in self._metrics.items()
+        }
+
+
+registry = MetricsRegistry()
+
+# 爬虫指标
+REQUEST_LATENCY = registry.histogram(
+    "crawler_request_seconds", "单次HTTP请求耗时(秒),含失败的尝试", ("host", "endpoint"))
+BYTES_DOWNLOADED = registry.counter(
+    "crawler_bytes_downloaded", "成功响应的字节数", ("host", "endpoint"))
+REQUESTS = registry.counter(
+    "crawler_requests", "HTTP请求次数(每次尝试计一次)", ("host", "endpoint", "status"))
+RETRIES = registry.counter(
+    "crawler_retries", "重试次数", ("host", "endpoint"))
+FAILURES = registry.counter(
+    "crawler_failures", "重试耗尽或不可重试的失败请求数", ("host", "endpoint", "reason"))
+ROWS_PARSED = registry.counter(
+    "crawler_rows_parsed", "解析出的K线行数", ("resolution",))
+ROWS_WRITTEN = registry.counter(
+    "crawler_rows_written", "写入数据库的K线行数", ())
+
+# 写入缓冲指标
+INGEST_QUEUE_DEPTH = registry.gauge(
+    "ingest_queue_depth", "写入缓冲中等待提交的条目数", ())
+INGEST_BUFFERED_BYTES = registry.gauge(
+    "ingest_buffered_bytes", "写入缓冲中等待提交的数据估算字节数", ())
+INGEST_WRITE_LAG = registry.histogram(
+    "ingest_write_lag_seconds", "条目从进入写入缓冲到提交完成的耗时(秒)", ())
+INGEST_COMMIT_SECONDS = registry.histogram(
+    "ingest_commit_seconds", "写入缓冲每批提交的耗时(秒)", ())
+INGEST_BATCH_SIZE = registry.histogram(
+    "ingest_batch_size", "写入缓冲每批提交的条目数", (), buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+
+def crawl_totals() -> Dict[str, Any]:
+    """返回爬虫指标的合计值,用于计算任务期间的增量"""
+    return {
+        "requests": REQUESTS.total(),
+        "retries": RETRIES.total(),
+        "failures": FAILURES.total(),
+        "bytes_downloaded": BYTES_DOWNLOADED.total(),
+        "rows_parsed": ROWS_PARSED.total(),
+        "rows_written": ROWS_WRITTEN.total(),
+        "latency_buckets": REQUEST_LATENCY.merged_counts(),
+    }
+
+
+def summarize_since(before: Dict[str, Any]) -> Dict[str, Any]:
+    """汇总自before(crawl_totals的返回值)以来的指标增量
+
+    指标是进程级的,同时运行的其他任务也会计入。
+    """
+    after = crawl_totals()
+    summary = {
+        key: after[key] - before.get(key, 0)
+        for key in after if key != "latency_buckets"
+    }
+    previous = before.get("latency_buckets") or [0] * len(after["latency_buckets"])
+    buckets = [a - b for a, b in zip(after["latency_buckets"], previous)]
+    summary["latency_p50"] = REQUEST_LATENCY.quantile(0.5, buckets)
+    summary["latency_p99"] = REQUEST_LATENCY.quantile(0.99, buckets)
+    return summary
@@ -37,7 +37,8 @@ class ProgressManager:
             if not self.sse_connections[task_id]:
                 del self.sse_connections[task_id]
     
-    async def send_sse_progress(self, task_id: str, current: int, total: int, status: str = "running"):
+    async def send_sse_progress(self, task_id: str, current: int, total: int, status: str = "running",
+                                stages: Optional[dict] = None):
         """向所有SSE客户端发送进度更新"""
         if task_id in self.sse_connections and self.sse_connections[task_id]:
             message = {
@@ -46,6 +47,8 @@ class ProgressManager:
                 "percentage": int(current * 100 / total) if total > 0 else 0,
                 "status": status
             }
+            if stages is not None:
+                message["stages"] = stages
             data_str = json.dumps(message)
             # 发送到所有连接的客户端
             for queue in self.sse_connections[task_id]:
@@ -76,7 +79,8 @@ class ProgressManager:
         self.ws_connections.pop(task_id, None)
         logger.info(f"WebSocket连接已断开: {task_id}")
 
-    async def send_ws_progress(self, task_id: str, current: int, total: int, status: str = "running"):
+    async def send_ws_progress(self, task_id: str, current: int, total: int, status: str = "running",
+                               stages: Optional[dict] = None):
         """通过WebSocket发送进度更新"""
         if task_id in self.ws_connections:
             websocket = self.ws_connections[task_id]
@@ -87,6 +91,8 @@ class ProgressManager:
                     "percentage": int(current * 100 / total) if total > 0 else 0,
                     "status": status
                 }
+                if stages is not None:
+                    message["stages"] = stages
                 await websocket.send_json(message)
                 logger.info(f"发送WebSocket进度: {current}/{total}, 状态: {status}")
 
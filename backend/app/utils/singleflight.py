@@ -0,0 +1,70 @@
+"""
+请求合并工具
+
+相同键的并发调用只执行一次,其余调用等待同一个结果;执行完成后的冷却时间内
+直接返回刚得到的结果。
+"""
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+# 结果来源
+FRESH = "fresh"        # 本次调用触发了执行
+INFLIGHT = "inflight"  # 加入了正在进行的执行
+COOLDOWN = "cooldown"  # 使用冷却时间内刚完成的结果
+
+
+class SingleFlight:
+    """按键合并并发调用"""
+
+    def __init__(self, cooldown: float = 0):
+        """初始化
+
+        Args:
+            cooldown: 成功完成后结果的复用时间(秒),0表示不复用
+        """
+        self.cooldown = cooldown
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._recent: Dict[Hashable, Tuple[float, Any]] = {}
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None and self.cooldown > 0:
+            now = time.monotonic()
+            # 顺便清理已过期的结果
+            for stale in [k for k, (finished_at, _) in self._recent.items() if now - finished_at >= self.cooldown]:
+                del self._recent[stale]
+            self._recent[key] = (now, task.result())
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """执行或加入一次调用
+
+        执行在独立任务中进行,发起者断开不会中断其他等待者;失败不进入冷却缓存,
+        所有等待者收到同一个异常。
+
+        Args:
+            key: 合并键
+            func: 无参数的协程函数
+
+        Returns:
+            (结果, 来源),来源为FRESH、INFLIGHT或COOLDOWN
+        """
+        recent = self._recent.get(key)
+        if recent:
+            finished_at, result = recent
+            if time.monotonic() - finished_at < self.cooldown:
+                return result, COOLDOWN
+            del self._recent[key]
+
+        task = self._inflight.get(key)
+        source = INFLIGHT
+        if task is None:
+            task = asyncio.ensure_future(func())
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self._inflight[key] = task
+            source = FRESH
+        return await asyncio.shield(task), source
+
+    def inflight(self) -> int:
+        """正在进行的调用数量"""
+        return len(self._inflight)
@@ -0,0 +1,3 @@
+"""
+离线性能基准脚本,在backend目录下以 python -m benchmarks.<脚本名> 运行
+"""
@@ -0,0 +1,166 @@
+"""
+爬虫端到端吞吐量基准
+
+在本地模拟服务器上运行StockCrawler.run,按不同股票规模和爬取模式统计
+股票/秒、K线行/秒、请求耗时p50/p99以及数据库写入耗时:
+    python -m benchmarks.bench_crawler --sizes 100 500 --latency 0.02 --error-rate 0.01
+
+基准使用临时SQLite数据库(可通过环境变量DATABASE_URL指定),每轮运行前清空。
+"""
+import os
+import math
+import time
+import asyncio
+import argparse
+import tempfile
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Dict, Any, List
+
+# 必须在导入app模块之前设置,数据库引擎在导入时创建
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_crawler_'), 'stocks.db')}"
+)
+
+import aiohttp
+from sqlalchemy import select, func
+
+from app.core.database import engine, AsyncSessionLocal
+from app.crawler.base import BaseCrawler
+from app.crawler.ingest import IngestBuffer
+from app.crawler.stock_crawler import StockCrawler
+from app.models import Base, KLineData
+from benchmarks.mock_server import MockMarketServer
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """计算百分位数(最近秩法)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[min(len(ordered), max(rank, 1)) - 1]
+
+
+def make_trace_config(latencies: List[float]) -> aiohttp.TraceConfig:
+    """创建记录每个HTTP请求耗时的追踪配置"""
+    async def on_request_start(session, ctx: SimpleNamespace, params):
+        ctx.start = time.perf_counter()
+
+    async def on_request_end(session, ctx: SimpleNamespace, params):
+        latencies.append(time.perf_counter() - ctx.start)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+@contextmanager
+def measure_writes(timings: List[float]):
+    """统计写入缓冲每个事务的耗时,退出时恢复原方法"""
+    original = IngestBuffer._write
+
+    async def timed(self, entries):
+        start = time.perf_counter()
+        try:
+            return await original(self, entries)
+        finally:
+            timings.append(time.perf_counter() - start)
+
+    IngestBuffer._write = timed
+    try:
+        yield
+    finally:
+        IngestBuffer._write = original
+
+
+async def reset_db():
+    """清空并重建基准数据库"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def count_klines() -> int:
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(select(func.count(KLineData.id)))).scalar()
+
+
+async def run_once(server: MockMarketServer, mode: str, args) -> Dict[str, Any]:
+    """在空数据库上执行一次全量爬取并返回统计结果"""
+    await reset_db()
+    latencies: List[float] = []
+    write_times: List[float] = []
+    await BaseCrawler.startup(trace_configs=[make_trace_config(latencies)])
+    server.request_count = server.error_count = 0
+
+    crawler = StockCrawler(
+        concurrency=args.concurrency,
+        per_host_limit=args.per_host_limit,
+        per_host_rate=0,
+        incremental=False,
+        endpoints=server.endpoints,
+        use_cache=False
+    )
+    with measure_writes(write_times):
+        start = time.perf_counter()
+        await crawler.run(stock_count=0, resolution=args.resolution, mode=mode)
+        elapsed = time.perf_counter() - start
+
+    stocks = crawler.total_stocks - len(crawler.failed_stocks)
+    rows = await count_klines()
+    return {
+        "mode": mode,
+        "stocks": stocks,
+        "failed": len(crawler.failed_stocks),
+        "rows": rows,
+        "seconds": elapsed,
+        "requests": server.request_count,
+        "errors": server.error_count,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "write_seconds": sum(write_times),
+    }
+
+
+async def main(args):
+    print(f"数据库: {os.environ['DATABASE_URL']}")
+    for size in args.sizes:
+        async with MockMarketServer(
+            sh_count=size // 2,
+            sz_count=size - size // 2,
+            latency=args.latency,
+            error_rate=args.error_rate,
+            daily_rows=args.daily_rows,
+            minute_rows=args.minute_rows
+        ) as server:
+            print(f"\n股票数={size} 延迟={args.latency}s 错误率={args.error_rate} "
+                  f"日K={args.daily_rows}根 分钟K={args.minute_rows}根 并发={args.concurrency}")
+            for mode in args.modes:
+                result = await run_once(server, mode, args)
+                print(
+                    f"{result['mode']:<10} 耗时={result['seconds']:7.2f}s  "
+                    f"{result['stocks'] / result['seconds']:7.1f} 支/秒  "
+                    f"{result['rows'] / result['seconds']:9,.0f} 行/秒  "
+                    f"请求={result['requests']:>5}(错误{result['errors']})  "
+                    f"p50={result['p50'] * 1000:6.1f}ms p99={result['p99'] * 1000:6.1f}ms  "
+                    f"写库={result['write_seconds']:6.2f}s  失败={result['failed']}"
+                )
+    await BaseCrawler.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="爬虫端到端吞吐量基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500], help="股票规模")
+    parser.add_argument("--modes", nargs="+", choices=["concurrent", "pipeline", "sharded"],
+                        default=["concurrent", "pipeline"], help="爬取模式")
+    parser.add_argument("--resolution", choices=["1m", "1d"], default=None, help="时间粒度,默认两种都爬取")
+    parser.add_argument("--latency", type=float, default=0.02, help="每个请求的模拟延迟(秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回503的请求比例")
+    parser.add_argument("--daily-rows", type=int, default=250, help="每个日K线响应的K线数量")
+    parser.add_argument("--minute-rows", type=int, default=720, help="每个分钟K线响应的K线数量")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发处理股票的协程数")
+    parser.add_argument("--per-host-limit", type=int, default=16, help="单主机最大并发请求数")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,96 @@
+"""
+K线解析微基准
+
+对比逐行strptime/float解析与parse_klines批量解析的耗时,并校验两者结果一致:
+    python -m benchmarks.bench_kline_parser --rows 100000
+"""
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from typing import List, Dict, Any
+
+from app.crawler.kline_parser import parse_klines
+
+
+def make_lines(rows: int, resolution: str, bad_ratio: float) -> List[str]:
+    """生成模拟的东方财富K线字符串,按比例混入格式错误的行"""
+    random.seed(42)
+    start = datetime(2015, 1, 5, 9, 31)
+    step = timedelta(minutes=1) if resolution == "1m" else timedelta(days=1)
+    fmt = '%Y-%m-%d %H:%M' if resolution == "1m" else '%Y-%m-%d'
+    lines = []
+    price = 10.0
+    for i in range(rows):
+        price = max(1.0, price + random.uniform(-0.1, 0.1))
+        line = (
+            f"{(start + step * i).strftime(fmt)},{price:.2f},{price + 0.01:.2f},"
+            f"{price + 0.05:.2f},{price - 0.05:.2f},{random.randint(100, 100000)},"
+            f"{random.uniform(1e5, 1e8):.1f},{random.uniform(0, 5):.2f}"
+        )
+        if random.random() < bad_ratio:
+            line = random.choice([
+                line.replace(f"{price:.2f}", "-", 1),  # 停牌占位符
+                line.split(',', 1)[1],                  # 缺少日期
+                line[:8],                               # 截断
+            ])
+        lines.append(line)
+    return lines
+
+
+def legacy_parse(lines: List[str], resolution: str) -> List[Dict[str, Any]]:
+    """原有的逐行解析实现"""
+    klines = []
+    for kline in lines:
+        try:
+            date_str, open_price, close, high, low, volume, turnover, *_ = kline.split(',')
+            if resolution == "1m":
+                date_obj = datetime.strptime(date_str, '%Y-%m-%d %H:%M')
+            else:
+                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+            klines.append({
+                'date': date_obj,
+                'resolution': resolution,
+                'open': float(open_price),
+                'close': float(close),
+                'high': float(high),
+                'low': float(low),
+                'volume': float(volume),
+                'turnover': float(turnover)
+            })
+        except (ValueError, IndexError):
+            continue
+    return klines
+
+
+def timeit(func, repeat: int) -> float:
+    """返回多次执行中的最短耗时"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    lines = make_lines(args.rows, args.resolution, args.bad_ratio)
+    expected = legacy_parse(lines, args.resolution)
+    columns = parse_klines(lines, args.resolution)
+    assert columns.to_rows(args.resolution) == expected, "批量解析结果与逐行解析不一致"
+    print(f"行数={args.rows} 时间粒度={args.resolution} 有效={len(columns)} 无效={len(columns.invalid_rows)}")
+
+    legacy = timeit(lambda: legacy_parse(lines, args.resolution), args.repeat)
+    vector = timeit(lambda: parse_klines(lines, args.resolution), args.repeat)
+    vector_rows = timeit(lambda: parse_klines(lines, args.resolution).to_rows(args.resolution), args.repeat)
+    for name, seconds in (("逐行解析", legacy), ("批量解析(列数组)", vector), ("批量解析+转字典", vector_rows)):
+        print(f"{name:<16} {seconds * 1000:9.1f} ms  {args.rows / seconds:12,.0f} 行/秒  {legacy / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="K线解析微基准")
+    parser.add_argument("--rows", type=int, default=100000, help="K线行数")
+    parser.add_argument("--resolution", choices=["1m", "1d"], default="1m", help="时间粒度")
+    parser.add_argument("--bad-ratio", type=float, default=0.001, help="格式错误行的比例")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数")
+    main(parser.parse_args())
@@ -0,0 +1,137 @@
+"""
+K线存储基准
+
+将同样的分钟K线分别写入数据库kline_data表和列式.npy存储,对比写入耗时、占用空间,
+以及原有ORM读取、SqlKLineStore列查询和ColumnarKLineStore内存映射读取的耗时:
+    python -m benchmarks.bench_kline_store --stocks 20 --rows 100000
+
+基准使用临时SQLite数据库(可通过环境变量DATABASE_URL指定)和临时目录。
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from datetime import timedelta
+from typing import Dict, Any, List, Callable, Awaitable
+
+# 必须在导入app模块之前设置,数据库引擎在导入时创建
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_store_'), 'stocks.db')}"
+)
+
+from sqlalchemy import select, text
+
+from app.core.database import engine, init_db, AsyncSessionLocal
+from app.core.kline_store import SqlKLineStore, ColumnarKLineStore
+from app.crawler.data_processor import DataProcessor
+from app.models import Stock, KLineData
+from benchmarks.bench_crawler import percentile
+from benchmarks.bench_kline_writer import make_rows, upsert_write
+
+
+async def orm_read(stock_id: int, resolution: str, start, end, limit) -> List[Dict[str, Any]]:
+    """原有读取方式: 查询整行ORM对象后转换为字典"""
+    query = select(KLineData).where(KLineData.stock_id == stock_id, KLineData.resolution == resolution)
+    if start is not None:
+        query = query.where(KLineData.date >= start, KLineData.date <= end)
+    query = query.order_by(KLineData.date.desc())
+    if limit:
+        query = query.limit(limit)
+    async with AsyncSessionLocal() as session:
+        klines = (await session.execute(query)).scalars().all()
+    return [
+        {"date": k.date, "open": k.open, "high": k.high, "low": k.low,
+         "close": k.close, "volume": k.volume, "turnover": k.turnover}
+        for k in klines
+    ]
+
+
+def directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    )
+
+
+async def timed(func: Callable[[], Awaitable], repeat: int) -> List[float]:
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def main(args):
+    db_path = os.environ['DATABASE_URL'].split("///", 1)[-1]
+    print(f"数据库: {os.environ['DATABASE_URL']}")
+    print(f"股票={args.stocks} 每支分钟K={args.rows} 总行数={args.stocks * args.rows:,}")
+    await init_db()
+    await DataProcessor.save_stock_list([
+        {'code': f"{600000 + i:06d}", 'name': f"基准{i}", 'market': 'SH'} for i in range(args.stocks)
+    ])
+    async with AsyncSessionLocal() as session:
+        stock_ids = list((await session.execute(select(Stock.id).order_by(Stock.id))).scalars().all())
+    data = {stock_id: make_rows(args.rows, "1m", stock_id) for stock_id in stock_ids}
+
+    columnar = ColumnarKLineStore(tempfile.mkdtemp(prefix='bench_store_npy_'))
+    start = time.perf_counter()
+    for stock_id in stock_ids:
+        await upsert_write(stock_id, data[stock_id])
+    sql_write = time.perf_counter() - start
+    start = time.perf_counter()
+    for stock_id in stock_ids:
+        await columnar.write(None, stock_id, data[stock_id])
+    columnar_write = time.perf_counter() - start
+
+    async with engine.connect() as conn:
+        await conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    sql_bytes = os.path.getsize(db_path)
+    columnar_bytes = directory_size(columnar.directory)
+    print(f"写入: SQL {sql_write:6.2f}s  列式 {columnar_write:6.2f}s")
+    print(f"空间: SQL {sql_bytes / 2 ** 20:8.1f} MiB  列式 {columnar_bytes / 2 ** 20:8.1f} MiB")
+
+    sql = SqlKLineStore()
+    first_bar = data[stock_ids[0]][0]['date']
+
+    def latest():
+        return None, None, args.limit
+
+    def day_range():
+        start_date = first_bar + timedelta(minutes=random.randrange(max(args.rows - args.days * 1440, 1)))
+        return start_date, start_date + timedelta(days=args.days), None
+
+    cases = {f"最近{args.limit}根": latest, f"任意{args.days}天": day_range}
+    readers = {
+        "ORM整行": lambda sid, s, e, l: orm_read(sid, "1m", s, e, l),
+        "SQL列查询": lambda sid, s, e, l: sql.read(sid, "1m", s, e, descending=True, limit=l),
+        "列式mmap": lambda sid, s, e, l: columnar.read(sid, "1m", s, e, descending=True, limit=l),
+    }
+    for case, make_args in cases.items():
+        print(f"读取{case}:")
+        for name, read in readers.items():
+            random.seed(args.seed)
+            rows = []
+
+            async def one():
+                start_date, end_date, limit = make_args()
+                rows.append(len(await read(random.choice(stock_ids), start_date, end_date, limit)))
+
+            latencies = await timed(one, args.repeat)
+            print(f"  {name:<10} p50 {percentile(latencies, 50) * 1000:8.2f}ms  "
+                  f"p99 {percentile(latencies, 99) * 1000:8.2f}ms  平均行数 {sum(rows) / len(rows):9.0f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="K线存储基准")
+    parser.add_argument("--stocks", type=int, default=20, help="股票数量")
+    parser.add_argument("--rows", type=int, default=100000, help="每支股票的分钟K数量")
+    parser.add_argument("--limit", type=int, default=1200, help="读取最近K线的数量")
+    parser.add_argument("--days", type=int, default=5, help="按日期范围读取的天数")
+    parser.add_argument("--repeat", type=int, default=50, help="每种读取的次数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,114 @@
+"""
+K线写库基准
+
+对比原有的ORM写入(按范围delete后add_all逐行构建KLineData对象)与按自然键
+INSERT ... ON CONFLICT DO UPDATE批量upsert的吞吐量,分别测试首次写入和覆盖写入:
+    python -m benchmarks.bench_kline_writer --stocks 20 --rows 5000
+
+基准使用临时SQLite数据库(可通过环境变量DATABASE_URL指定)。
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from typing import Dict, Any, List
+
+# 必须在导入app模块之前设置,数据库引擎在导入时创建
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_writer_'), 'stocks.db')}"
+)
+
+from sqlalchemy import select, delete, func
+
+from app.core.database import engine, init_db, AsyncSessionLocal
+from app.crawler.data_processor import DataProcessor
+from app.models import Base, Stock, KLineData
+
+
+def make_rows(count: int, resolution: str, seed: int = 0) -> List[Dict[str, Any]]:
+    """生成连续的模拟K线"""
+    start = datetime(2020, 1, 1, 9, 31)
+    step = timedelta(minutes=1) if resolution == "1m" else timedelta(days=1)
+    price = 10.0 + seed
+    return [
+        {
+            'date': start + step * i,
+            'resolution': resolution,
+            'open': price,
+            'close': price + 0.01,
+            'high': price + 0.05,
+            'low': price - 0.05,
+            'volume': 1000.0 + i,
+            'turnover': 1e6 + i,
+        }
+        for i in range(count)
+    ]
+
+
+async def orm_write(stock_id: int, klines: List[Dict[str, Any]]):
+    """原有写法: 删除本次时间范围内的K线后逐行构建ORM对象插入"""
+    async with AsyncSessionLocal() as session:
+        start = min(kline['date'] for kline in klines)
+        end = max(kline['date'] for kline in klines)
+        await session.execute(delete(KLineData).where(
+            KLineData.stock_id == stock_id,
+            KLineData.resolution == klines[0]['resolution'],
+            KLineData.date >= start,
+            KLineData.date <= end
+        ))
+        session.add_all([KLineData(stock_id=stock_id, **kline) for kline in klines])
+        await session.commit()
+
+
+async def upsert_write(stock_id: int, klines: List[Dict[str, Any]]):
+    """批量upsert写法,与写入缓冲写入数据库K线时使用的语句相同"""
+    async with AsyncSessionLocal() as session:
+        await DataProcessor.bulk_upsert_klines(session, stock_id, klines)
+        await session.commit()
+
+
+async def reset_db(stock_count: int) -> List[int]:
+    """清空数据库并创建股票,返回股票ID"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await init_db()
+    await DataProcessor.save_stock_list([
+        {'code': f"{600000 + i:06d}", 'name': f"基准{i}", 'market': 'SH'} for i in range(stock_count)
+    ])
+    async with AsyncSessionLocal() as session:
+        return list((await session.execute(select(Stock.id).order_by(Stock.id))).scalars().all())
+
+
+async def timed_pass(write, stock_ids: List[int], data: List[List[Dict[str, Any]]]) -> float:
+    start = time.perf_counter()
+    for stock_id, klines in zip(stock_ids, data):
+        await write(stock_id, klines)
+    return time.perf_counter() - start
+
+
+async def main(args):
+    print(f"数据库: {os.environ['DATABASE_URL']}")
+    total = args.stocks * args.rows
+    print(f"股票={args.stocks} 每支K线={args.rows} 时间粒度={args.resolution} 总行数={total:,}")
+    data = [make_rows(args.rows, args.resolution, seed) for seed in range(args.stocks)]
+    for name, write in (("ORM delete+add_all", orm_write), ("Core upsert", upsert_write)):
+        stock_ids = await reset_db(args.stocks)
+        insert_seconds = await timed_pass(write, stock_ids, data)
+        update_seconds = await timed_pass(write, stock_ids, data)
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(select(func.count(KLineData.id)))).scalar()
+        assert rows == total, f"{name} 写入行数不符: {rows}/{total}"
+        print(f"{name:<20} 首次写入 {insert_seconds:6.2f}s {total / insert_seconds:10,.0f} 行/秒  "
+              f"覆盖写入 {update_seconds:6.2f}s {total / update_seconds:10,.0f} 行/秒")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="K线写库基准")
+    parser.add_argument("--stocks", type=int, default=20, help="股票数量")
+    parser.add_argument("--rows", type=int, default=5000, help="每支股票的K线数量")
+    parser.add_argument("--resolution", choices=["1m", "1d"], default="1m", help="时间粒度")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,155 @@
+"""
+读取接口基准
+
+对比K线接口和股票列表接口三种读取方式的耗时和峰值内存(tracemalloc):
+    ORM实体   查询整行ORM对象,复制为字典后由FastAPI的jsonable_encoder序列化(原实现)
+    列查询    查询ORM映射的列,转换为字典后同样经过jsonable_encoder
+    行元组    当前接口: 查询表的列,行元组直接生成JSONResponse
+    python -m benchmarks.bench_read_path --sizes 10000 100000 --stocks 5000
+
+基准使用临时SQLite数据库(可通过环境变量DATABASE_URL指定)。
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from typing import Dict, Any, List, Callable, Awaitable
+
+# 必须在导入app模块之前设置,数据库引擎在导入时创建
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_read_'), 'stocks.db')}"
+)
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import select
+
+from app.core.database import engine, init_db, AsyncSessionLocal
+from app.crawler.data_processor import DataProcessor
+from app.crawler.kline_parser import VALUE_FIELDS
+from app.models import Stock, KLineData
+from app.routers.stocks import get_stocks, get_stock_kline
+from benchmarks.bench_crawler import percentile
+from benchmarks.bench_kline_writer import make_rows, upsert_write
+
+
+async def orm_kline(code: str) -> JSONResponse:
+    """原实现: 加载Stock和KLineData实体"""
+    async with AsyncSessionLocal() as db:
+        stock = (await db.execute(select(Stock).where(Stock.code == code))).scalar_one_or_none()
+        query = (
+            select(KLineData)
+            .where(KLineData.stock_id == stock.id, KLineData.resolution == "1m")
+            .order_by(KLineData.date.desc())
+        )
+        klines = (await db.execute(query)).scalars().all()
+        content = [
+            {
+                "date": kline.date, "open": kline.open, "high": kline.high, "low": kline.low,
+                "close": kline.close, "volume": kline.volume, "turnover": kline.turnover,
+                "resolution": kline.resolution
+            } for kline in klines
+        ]
+        return JSONResponse(content=jsonable_encoder(content))
+
+
+async def column_kline(code: str) -> JSONResponse:
+    """查询ORM映射的列,经过两次字典转换和jsonable_encoder"""
+    async with AsyncSessionLocal() as db:
+        stock = (await db.execute(select(Stock).where(Stock.code == code))).scalar_one_or_none()
+        columns = [getattr(KLineData, field) for field in VALUE_FIELDS]
+        query = (
+            select(KLineData.date, *columns)
+            .where(KLineData.stock_id == stock.id, KLineData.resolution == "1m")
+            .order_by(KLineData.date.desc())
+        )
+        klines = [dict(zip(('date', *VALUE_FIELDS), row)) for row in (await db.execute(query)).all()]
+        content = [{**kline, "resolution": "1m"} for kline in klines]
+        return JSONResponse(content=jsonable_encoder(content))
+
+
+async def tuple_kline(code: str) -> JSONResponse:
+    async with AsyncSessionLocal() as db:
+        return await get_stock_kline(code, resolution="1m", db=db)
+
+
+async def orm_stocks() -> JSONResponse:
+    async with AsyncSessionLocal() as db:
+        stocks = (await db.execute(select(Stock))).scalars().all()
+        content = [
+            {"code": stock.code, "name": stock.name, "market": stock.market, "updated_at": stock.updated_at}
+            for stock in stocks
+        ]
+        return JSONResponse(content=jsonable_encoder(content))
+
+
+async def column_stocks() -> JSONResponse:
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(Stock.code, Stock.name, Stock.market, Stock.updated_at))).all()
+        content = [dict(zip(("code", "name", "market", "updated_at"), row)) for row in rows]
+        return JSONResponse(content=jsonable_encoder(content))
+
+
+async def tuple_stocks() -> JSONResponse:
+    async with AsyncSessionLocal() as db:
+        return await get_stocks(db=db)
+
+
+async def measure(func: Callable[[], Awaitable[JSONResponse]], repeat: int) -> Dict[str, Any]:
+    """多次运行取耗时p50,再单独运行一次统计tracemalloc峰值(tracemalloc会拖慢运行)"""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await func()
+        latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        await func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"p50": percentile(latencies, 50), "peak": peak, "bytes": len(response.body)}
+
+
+def report(name: str, result: Dict[str, Any], baseline: Dict[str, Any]):
+    print(f"  {name:<8} p50 {result['p50'] * 1000:9.1f}ms ({baseline['p50'] / result['p50']:4.1f}x)  "
+          f"峰值内存 {result['peak'] / 2 ** 20:8.1f} MiB ({baseline['peak'] / result['peak']:4.1f}x)  "
+          f"响应 {result['bytes'] / 2 ** 20:6.1f} MiB")
+
+
+async def main(args):
+    print(f"数据库: {os.environ['DATABASE_URL']}")
+    await init_db()
+    await DataProcessor.save_stock_list([
+        {'code': f"{600000 + i:06d}", 'name': f"基准{i}", 'market': 'SH'}
+        for i in range(max(args.stocks, len(args.sizes)))
+    ])
+    codes = [f"{600000 + i:06d}" for i in range(len(args.sizes))]
+    stock_ids = await DataProcessor.get_stock_ids(codes)
+    for seed, (code, size) in enumerate(zip(codes, args.sizes)):
+        await upsert_write(stock_ids[code], make_rows(size, "1m", seed))
+
+    for code, size in zip(codes, args.sizes):
+        print(f"K线接口 分钟K={size:,}根:")
+        results = {}
+        for name, func in (("ORM实体", orm_kline), ("列查询", column_kline), ("行元组", tuple_kline)):
+            results[name] = await measure(lambda: func(code), args.repeat)
+            report(name, results[name], results["ORM实体"])
+
+    print(f"股票列表接口 股票={max(args.stocks, len(args.sizes)):,}支:")
+    results = {}
+    for name, func in (("ORM实体", orm_stocks), ("列查询", column_stocks), ("行元组", tuple_stocks)):
+        results[name] = await measure(func, args.repeat)
+        report(name, results[name], results["ORM实体"])
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="读取接口基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="K线接口返回的分钟K数量")
+    parser.add_argument("--stocks", type=int, default=5000, help="股票列表接口返回的股票数量")
+    parser.add_argument("--repeat", type=int, default=5, help="每种读取方式的运行次数")
+    asyncio.run(main(parser.parse_args()))
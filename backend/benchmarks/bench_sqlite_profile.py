@@ -0,0 +1,133 @@
+"""
+SQLite连接参数基准
+
+模拟爬虫批量写库,同时并发读取K线(与/api/stocks/{code}/kline相同的查询),对比
+默认参数(回滚日志)和database.sqlite性能参数(WAL等)下读请求的延迟和写入吞吐量:
+    python -m benchmarks.bench_sqlite_profile --stocks 200 --rows 2000 --readers 8
+
+每种参数使用单独的临时SQLite数据库文件。
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, Any, List
+
+# 必须在导入app模块之前设置,数据库引擎在导入时创建
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_sqlite_'), 'stocks.db')}"
+)
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import build_engine, sqlite_pragmas
+from app.core.migrations import run_migrations
+from app.crawler.data_processor import DataProcessor
+from app.models import Base, Stock, KLineData
+from benchmarks.bench_crawler import percentile
+from benchmarks.bench_kline_writer import make_rows
+
+PROFILES = {
+    "default": {"enabled": False},
+    "tuned": {"enabled": True},
+}
+
+
+async def prepare(engine, stocks: int, rows: int) -> List[int]:
+    """建表并为每支股票预先写入K线"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
+    Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with Session() as session:
+        session.add_all([Stock(code=f"{600000 + i:06d}", name=f"基准{i}", market="SH") for i in range(stocks)])
+        await session.flush()
+        stock_ids = list((await session.execute(select(Stock.id).order_by(Stock.id))).scalars().all())
+        for stock_id in stock_ids:
+            await DataProcessor.bulk_upsert_klines(session, stock_id, make_rows(rows, "1d", stock_id))
+        await session.commit()
+    return stock_ids
+
+
+async def crawl(engine, stock_ids: List[int], rows: int, batch: int) -> float:
+    """模拟一次全量爬取: 每batch支股票提交一次,返回耗时"""
+    Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    start = time.perf_counter()
+    for i in range(0, len(stock_ids), batch):
+        async with Session() as session:
+            for stock_id in stock_ids[i:i + batch]:
+                await DataProcessor.bulk_upsert_klines(session, stock_id, make_rows(rows, "1d", stock_id + 1))
+            await session.commit()
+    return time.perf_counter() - start
+
+
+async def reader(engine, stock_ids: List[int], limit: int, done: asyncio.Event, latencies: List[float]):
+    """不断读取随机股票最近limit根日K,记录每次查询的耗时"""
+    while not done.is_set():
+        stock_id = random.choice(stock_ids)
+        start = time.perf_counter()
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                select(KLineData.date, KLineData.open, KLineData.close, KLineData.high,
+                       KLineData.low, KLineData.volume)
+                .where(KLineData.stock_id == stock_id, KLineData.resolution == "1d")
+                .order_by(KLineData.date.desc())
+                .limit(limit)
+            )
+            result.all()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0)
+
+
+async def run_profile(name: str, args) -> Dict[str, Any]:
+    path = os.path.join(tempfile.mkdtemp(prefix=f"bench_sqlite_{name}_"), "stocks.db")
+    pragmas = sqlite_pragmas(PROFILES[name])
+    engine = build_engine(f"sqlite+aiosqlite:///{path}", pragmas)
+    stock_ids = await prepare(engine, args.stocks, args.rows)
+
+    done = asyncio.Event()
+    latencies: List[float] = []
+    readers = [
+        asyncio.ensure_future(reader(engine, stock_ids, args.limit, done, latencies))
+        for _ in range(args.readers)
+    ]
+    write_seconds = await crawl(engine, stock_ids, args.rows, args.batch)
+    done.set()
+    await asyncio.gather(*readers)
+    await engine.dispose()
+    return {
+        "name": name,
+        "pragmas": pragmas,
+        "write_seconds": write_seconds,
+        "rows_per_sec": len(stock_ids) * args.rows / write_seconds,
+        "reads": len(latencies),
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies, default=0.0),
+    }
+
+
+async def main(args):
+    print(f"股票={args.stocks} 每支K线={args.rows} 每次提交股票数={args.batch} "
+          f"读协程={args.readers} 每次读取={args.limit}根")
+    for name in PROFILES:
+        result = await run_profile(name, args)
+        print(f"{name}: {result['pragmas']}")
+        print(f"  写入 {result['write_seconds']:6.2f}s {result['rows_per_sec']:10,.0f} 行/秒  "
+              f"读取 {result['reads']:6d} 次  p50 {result['p50'] * 1000:7.2f}ms  "
+              f"p99 {result['p99'] * 1000:7.2f}ms  max {result['max'] * 1000:7.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite连接参数基准")
+    parser.add_argument("--stocks", type=int, default=200, help="股票数量")
+    parser.add_argument("--rows", type=int, default=2000, help="每支股票的日K数量")
+    parser.add_argument("--batch", type=int, default=1, help="每次提交包含的股票数")
+    parser.add_argument("--readers", type=int, default=8, help="并发读协程数")
+    parser.add_argument("--limit", type=int, default=250, help="每次读取的K线数量")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,69 @@
+"""
+股票列表分页并发获取基准
+
+在本地模拟服务器上对比串行与并发分页获取的吞吐量,并校验结果完整性:
+    python -m benchmarks.bench_stock_list --sh 2000 --sz 2800 --latency 0.05
+"""
+import time
+import asyncio
+import argparse
+
+from app.crawler.base import BaseCrawler, to_secid
+from app.crawler.stock_list import StockListCrawler
+from benchmarks.mock_server import MockMarketServer
+
+
+async def run_once(server: MockMarketServer, per_host_limit: int, page_size: int) -> dict:
+    """执行一次全量列表获取并返回统计结果"""
+    crawler = StockListCrawler(
+        page_size=page_size,
+        endpoints=server.endpoints,
+        per_host_limit=per_host_limit,
+        per_host_rate=0
+    )
+    server.request_count = 0
+    start = time.perf_counter()
+    stocks = await crawler.fetch_all()
+    elapsed = time.perf_counter() - start
+
+    # 校验: 数量完整、无重复、市场标识和secid前缀正确
+    expected = {market: {row["code"] for row in rows} for market, rows in server.universe.items()}
+    codes = [stock["code"] for stock in stocks]
+    assert len(codes) == len(set(codes)), "存在重复股票"
+    for market, market_codes in expected.items():
+        got = {stock["code"] for stock in stocks if stock["market"] == market}
+        assert got == market_codes, f"{market} 股票不完整: {len(got)}/{len(market_codes)}"
+    for stock in stocks:
+        prefix = to_secid(stock["code"], stock["market"]).split(".")[0]
+        assert prefix == ("1" if stock["market"] == "SH" else "0"), f"secid错误: {stock}"
+
+    return {
+        "per_host_limit": per_host_limit,
+        "pages": server.request_count,
+        "stocks": len(stocks),
+        "seconds": elapsed,
+    }
+
+
+async def main(args):
+    async with MockMarketServer(sh_count=args.sh, sz_count=args.sz, latency=args.latency) as server:
+        print(f"模拟服务器: {server.base_url}, 上交所 {args.sh} 支, 深交所 {args.sz} 支, 延迟 {args.latency}s")
+        for limit in (1, *args.limits):
+            result = await run_once(server, limit, args.page_size)
+            print(
+                f"单主机并发={result['per_host_limit']:>3}  页数={result['pages']:>4}  "
+                f"股票={result['stocks']:>5}  耗时={result['seconds']:.2f}s  "
+                f"{result['pages'] / result['seconds']:.1f} 页/秒  "
+                f"{result['stocks'] / result['seconds']:.0f} 支/秒"
+            )
+    await BaseCrawler.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="股票列表分页并发获取基准")
+    parser.add_argument("--sh", type=int, default=2000, help="上交所股票数量")
+    parser.add_argument("--sz", type=int, default=2800, help="深交所股票数量")
+    parser.add_argument("--latency", type=float, default=0.05, help="每个请求的模拟延迟(秒)")
+    parser.add_argument("--page-size", type=int, default=100, help="上交所分页大小")
+    parser.add_argument("--limits", type=int, nargs="*", default=[4, 16], help="要对比的单主机并发数")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,107 @@
+"""
+K线查询计划检查
+
+对K线热点查询执行EXPLAIN QUERY PLAN,确认它们都通过(stock_id, resolution, date)
+复合索引查找,没有全表扫描或为排序建立临时B树:
+    python -m benchmarks.check_query_plans
+    DATABASE_URL=sqlite+aiosqlite:///./stocks.db python -m benchmarks.check_query_plans
+
+默认使用临时SQLite数据库。检查前会执行init_db(含结构迁移),因此指定已有数据库时
+也会完成其升级。发现扫描时以非零状态码退出。
+"""
+import os
+import re
+import sys
+import asyncio
+import tempfile
+from datetime import datetime
+from typing import Dict, List
+
+# 必须在导入app模块之前设置,数据库引擎在导入时创建
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='check_plans_'), 'stocks.db')}"
+)
+
+from sqlalchemy import select, func
+
+from app.core.database import engine, init_db
+from app.models import Stock, KLineData
+
+# 计划中出现这些内容说明查询没有用上索引
+_SCAN = re.compile(r"^SCAN (TABLE )?kline_data\b")
+_SORT = "USE TEMP B-TREE FOR ORDER BY"
+
+
+def hot_queries() -> Dict[str, object]:
+    """与接口中相同形状的K线查询
+
+    stocks.get_stock_kline按股票、时间粒度和可选的日期范围查询,日K升序、分钟K降序;
+    analysis取最近30根日K;爬虫增量更新查询最后一根已存K线的时间。
+    """
+    start, end = datetime(2024, 1, 1), datetime(2024, 12, 31, 15, 0)
+
+    def kline(resolution: str):
+        return select(KLineData).where(KLineData.stock_id == 1, KLineData.resolution == resolution)
+
+    return {
+        "get_stock_kline 日K 日期范围": kline("1d")
+            .where(KLineData.date >= start, KLineData.date <= end)
+            .order_by(KLineData.date.asc()),
+        "get_stock_kline 日K 全部": kline("1d").order_by(KLineData.date.asc()),
+        "get_stock_kline 分钟K 日期范围": kline("1m")
+            .where(KLineData.date >= start, KLineData.date <= end)
+            .order_by(KLineData.date.desc()),
+        "analysis 最近30根日K": kline("1d").order_by(KLineData.date.desc()).limit(30),
+        "get_last_kline_dates": select(KLineData.resolution, func.max(KLineData.date))
+            .join(Stock, Stock.id == KLineData.stock_id)
+            .where(Stock.code == "600000")
+            .group_by(KLineData.resolution),
+        "get_last_kline_dates_many": select(Stock.code, func.max(KLineData.date))
+            .join(KLineData, Stock.id == KLineData.stock_id)
+            .where(Stock.code.in_(["600000", "000001"]), KLineData.resolution == "1m")
+            .group_by(Stock.code),
+    }
+
+
+async def explain(conn, stmt) -> List[str]:
+    """返回查询计划每一步的描述"""
+    compiled = stmt.compile(dialect=engine.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(
+        value.isoformat(" ") if isinstance(value, datetime) else value
+        for value in (compiled.params[name] for name in compiled.positiontup)
+    )
+    result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)
+    return [row[-1] for row in result.all()]
+
+
+def problems(plan: List[str]) -> List[str]:
+    return [step for step in plan if _SCAN.match(step) or _SORT in step]
+
+
+async def main() -> int:
+    if engine.dialect.name != "sqlite":
+        print(f"只支持SQLite,当前数据库: {engine.dialect.name}")
+        return 2
+    print(f"数据库: {os.environ['DATABASE_URL']}")
+    await init_db()
+    failed = []
+    async with engine.connect() as conn:
+        for name, stmt in hot_queries().items():
+            plan = await explain(conn, stmt)
+            bad = problems(plan)
+            print(f"[{'FAIL' if bad else ' OK '}] {name}")
+            for step in plan:
+                print(f"         {step}")
+            if bad:
+                failed.append(name)
+    await engine.dispose()
+    if failed:
+        print(f"{len(failed)} 个查询没有用上索引: {failed}")
+        return 1
+    print("所有K线查询都通过索引查找")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
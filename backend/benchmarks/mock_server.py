@@ -0,0 +1,257 @@
+"""
+本地行情模拟服务器,用于离线测试和性能基准
+
+模拟上交所/深交所股票列表接口以及东方财富K线、行情和批量行情接口,
+支持配置请求延迟、错误率和K线响应大小。
+"""
+import random
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+
+def make_kline_lines(rows: int, resolution: str, end: datetime) -> List[str]:
+    """生成截止到end(含)的rows根模拟K线字符串,跳过周末,分钟线每天240根"""
+    rng = random.Random(rows)
+    day = end.replace(hour=0, minute=0, second=0, microsecond=0)
+    stamps: List[datetime] = []
+    while len(stamps) < rows:
+        if day.weekday() < 5:
+            if resolution == "1m":
+                minutes = [day.replace(hour=9, minute=30) + timedelta(minutes=i + 1) for i in range(120)]
+                minutes += [day.replace(hour=13) + timedelta(minutes=i + 1) for i in range(120)]
+                stamps.extend(reversed(minutes))
+            else:
+                stamps.append(day)
+        day -= timedelta(days=1)
+    fmt = '%Y-%m-%d %H:%M' if resolution == "1m" else '%Y-%m-%d'
+    lines = []
+    price = 10.0
+    for stamp in reversed(stamps[:rows]):
+        price = max(1.0, price + rng.uniform(-0.1, 0.1))
+        lines.append(
+            f"{stamp.strftime(fmt)},{price:.2f},{price + 0.01:.2f},{price + 0.05:.2f},{price - 0.05:.2f},"
+            f"{rng.randint(100, 100000)},{rng.uniform(1e5, 1e8):.1f},{rng.uniform(0, 5):.2f}"
+        )
+    return lines
+
+
+def make_universe(sh_count: int, sz_count: int) -> Dict[str, List[Dict[str, str]]]:
+    """生成模拟的沪深股票列表"""
+    return {
+        "SH": [{"code": f"{600000 + i:06d}", "name": f"沪模拟{i}"} for i in range(sh_count)],
+        "SZ": [{"code": f"{i + 1:06d}", "name": f"深模拟{i}"} for i in range(sz_count)],
+    }
+
+
+class MockMarketServer:
+    """模拟行情服务器
+
+    用法:
+        async with MockMarketServer(sh_count=2000, latency=0.05, error_rate=0.01) as server:
+            crawler = StockCrawler(endpoints=server.endpoints)
+    """
+
+    SZSE_PAGE_SIZE = 20  # 深交所接口每页固定20条
+
+    def __init__(self, sh_count: int = 2000, sz_count: int = 2800,
+                 latency: float = 0.0, host: str = "127.0.0.1", port: int = 0,
+                 error_rate: float = 0.0, daily_rows: int = 250, minute_rows: int = 720,
+                 seed: int = 42):
+        """初始化模拟服务器
+
+        Args:
+            sh_count: 上交所股票数量
+            sz_count: 深交所股票数量
+            latency: 每个请求的模拟延迟(秒)
+            host: 监听地址
+            port: 监听端口,0表示随机端口
+            error_rate: 随机返回503的请求比例
+            daily_rows: 每个日K线响应包含的K线数量
+            minute_rows: 每个分钟K线响应包含的K线数量
+            seed: 错误注入使用的随机种子
+        """
+        self.universe = make_universe(sh_count, sz_count)
+        self.names = {row["code"]: row["name"] for rows in self.universe.values() for row in rows}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.daily_rows = daily_rows
+        self.minute_rows = minute_rows
+        self.host = host
+        self.port = port
+        self.request_count = 0
+        self.error_count = 0
+        self._rng = random.Random(seed)
+        # (klt, end) -> K线字符串,所有股票共用同一组K线,避免服务端生成数据占用基准时间
+        self._kline_cache: Dict[Tuple[str, str], List[str]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/sse/getStockListData.do", self.handle_sse_list)
+        self.app.router.add_get("/szse/ShowReport/data", self.handle_szse_list)
+        self.app.router.add_get("/api/qt/stock/kline/get", self.handle_kline)
+        self.app.router.add_get("/api/qt/stock/get", self.handle_quote)
+        self.app.router.add_get("/api/qt/ulist.np/get", self.handle_quote_batch)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def endpoints(self) -> Dict[str, str]:
+        """供BaseCrawler使用的数据源地址"""
+        return {
+            "sse_stock_list": f"{self.base_url}/sse/getStockListData.do",
+            "szse_stock_list": f"{self.base_url}/szse/ShowReport/data",
+            "kline": f"{self.base_url}/api/qt/stock/kline/get",
+            "quote": f"{self.base_url}/api/qt/stock/get",
+            "quote_batch": f"{self.base_url}/api/qt/ulist.np/get",
+        }
+
+    async def _before_request(self) -> Optional[web.Response]:
+        """模拟延迟并按错误率注入失败,需要返回错误时返回对应响应"""
+        self.request_count += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.error_count += 1
+            return web.Response(status=503, text="Service Unavailable")
+        return None
+
+    @staticmethod
+    def _split_secid(secid: str) -> Tuple[str, str]:
+        prefix, _, code = secid.partition(".")
+        return prefix, code
+
+    def _quote_fields(self, code: str) -> Dict[str, object]:
+        """生成单支股票的估值字段"""
+        seed = int(code) if code.isdigit() else 0
+        return {
+            "f162": 500 + seed % 5000,
+            "f167": 50 + seed % 800,
+            "f183": 1e9 + seed * 1e4,
+            "f184": 5e8 + seed * 5e3,
+        }
+
+    async def handle_kline(self, request: web.Request) -> web.Response:
+        """模拟东方财富 kline/get 接口,klt=1为分钟线,其余为日线,支持lmt只返回最近若干根"""
+        error = await self._before_request()
+        if error:
+            return error
+        prefix, code = self._split_secid(request.query.get("secid", ""))
+        if code not in self.names:
+            return web.json_response({"rc": 0, "data": None})
+        klt = request.query.get("klt", "101")
+        end = request.query.get("end") or datetime.now().strftime("%Y%m%d")
+        key = (klt, end)
+        if key not in self._kline_cache:
+            resolution = "1m" if klt == "1" else "1d"
+            rows = self.minute_rows if resolution == "1m" else self.daily_rows
+            end_date = min(datetime.strptime(end, "%Y%m%d"), datetime.now())
+            self._kline_cache[key] = make_kline_lines(rows, resolution, end_date)
+        klines = self._kline_cache[key]
+        limit = int(request.query.get("lmt") or 0)
+        return web.json_response({
+            "rc": 0,
+            "data": {
+                "code": code,
+                "market": int(prefix or 0),
+                "name": self.names[code],
+                "klines": klines[-limit:] if limit else klines,
+            }
+        })
+
+    async def handle_quote(self, request: web.Request) -> web.Response:
+        """模拟东方财富 stock/get 单股行情接口"""
+        error = await self._before_request()
+        if error:
+            return error
+        _, code = self._split_secid(request.query.get("secid", ""))
+        if code not in self.names:
+            return web.json_response({"rc": 0, "data": None})
+        return web.json_response({
+            "rc": 0,
+            "data": {"f57": code, "f58": self.names[code], **self._quote_fields(code)}
+        })
+
+    async def handle_quote_batch(self, request: web.Request) -> web.Response:
+        """模拟东方财富 ulist.np/get 多股行情接口"""
+        error = await self._before_request()
+        if error:
+            return error
+        diff = []
+        for secid in request.query.get("secids", "").split(","):
+            prefix, code = self._split_secid(secid)
+            if code in self.names:
+                diff.append({"f12": code, "f13": int(prefix), "f14": self.names[code], **self._quote_fields(code)})
+        return web.json_response({"rc": 0, "data": {"total": len(diff), "diff": diff}})
+
+    async def handle_sse_list(self, request: web.Request) -> web.Response:
+        """模拟上交所 getStockListData.do 分页接口"""
+        error = await self._before_request()
+        if error:
+            return error
+        page = int(request.query.get("pageHelp.beginPage", 1))
+        page_size = int(request.query.get("pageHelp.pageSize", 25))
+        stocks = self.universe["SH"]
+        rows = stocks[(page - 1) * page_size:page * page_size]
+        return web.json_response({
+            "pageHelp": {
+                "pageNo": page,
+                "pageSize": page_size,
+                "pageCount": (len(stocks) + page_size - 1) // page_size,
+                "total": len(stocks),
+                "data": [
+                    {"SECURITY_CODE_A": row["code"], "SECURITY_ABBR_A": row["name"]}
+                    for row in rows
+                ],
+            }
+        })
+
+    async def handle_szse_list(self, request: web.Request) -> web.Response:
+        """模拟深交所 ShowReport/data 分页接口"""
+        error = await self._before_request()
+        if error:
+            return error
+        page = int(request.query.get("PAGENO", 1))
+        stocks = self.universe["SZ"]
+        page_size = self.SZSE_PAGE_SIZE
+        rows = stocks[(page - 1) * page_size:page * page_size]
+        return web.json_response([
+            {
+                "metadata": {
+                    "pageno": page,
+                    "pagesize": page_size,
+                    "pagecount": (len(stocks) + page_size - 1) // page_size,
+                    "recordcount": len(stocks),
+                },
+                "data": [
+                    {"agdm": row["code"], "agjc": f"<a href='#'><u>{row['name']}</u></a>"}
+                    for row in rows
+                ],
+            }
+        ])
+
+    async def start(self):
+        """启动服务器"""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        """停止服务器"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "MockMarketServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
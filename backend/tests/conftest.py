@@ -0,0 +1,21 @@
+"""
+测试公共配置
+
+数据库引擎在导入app模块时创建,这里在任何测试导入app之前把DATABASE_URL指向临时SQLite数据库。
+"""
+import os
+import tempfile
+
+import pytest
+
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='stock_tests_'), 'stocks.db')}"
+)
+
+
+@pytest.fixture
+def breakers(monkeypatch):
+    """使用空的主机熔断器表,测试中创建和修改的熔断器不影响其他测试"""
+    from app.crawler import resilience
+    monkeypatch.setattr(resilience, "_breakers", {})
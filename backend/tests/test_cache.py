@@ -0,0 +1,13 @@
+"""
+HTTP响应缓存测试
+"""
+from app.crawler.cache import ResponseCache
+
+
+def test_only_unadjusted_history_gets_long_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    history = {'klt': '101', 'beg': '20200101', 'end': '20200131'}
+    assert cache.ttl_for("kline", {**history, 'fqt': '0'}) == cache.ttl["kline_history"]
+    # 前复权价格会在分红送转后改写整段历史
+    assert cache.ttl_for("kline", {**history, 'fqt': '1'}) == cache.ttl["kline_daily"]
+    assert cache.ttl_for("kline", {**history, 'fqt': '1', 'klt': '1'}) == cache.ttl["kline_intraday"]
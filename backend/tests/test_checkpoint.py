@@ -0,0 +1,30 @@
+"""
+爬取任务检查点测试
+"""
+import asyncio
+
+from app.core.database import init_db
+from app.crawler.checkpoint import CrawlLedger
+
+
+def test_interrupted_run_keeps_progress():
+    async def run():
+        await init_db()
+        ledger = CrawlLedger("checkpoint-interrupted")
+        await ledger.start({'stock_count': 3})
+        await ledger.register_stocks([{'code': code} for code in ("680000", "680001", "680002")])
+        await ledger.mark(["680000", "680001"], "completed")
+        await ledger.mark(["680002"], "failed", "请求失败")
+
+        # 进程在任务结束前退出,重启时标记为中断
+        assert await CrawlLedger.mark_interrupted_runs() >= 1
+        run_info = await CrawlLedger.get_run(ledger.run_id)
+        assert run_info["status"] == "interrupted"
+        assert (run_info["total"], run_info["completed"], run_info["failed"]) == (3, 2, 1)
+
+        await ledger.start({})
+        await ledger.finish("completed")
+        run_info = await CrawlLedger.get_run(ledger.run_id)
+        assert (run_info["status"], run_info["completed"], run_info["failed"]) == ("completed", 2, 1)
+
+    asyncio.run(run())
@@ -0,0 +1,163 @@
+"""
+写入缓冲测试
+"""
+import os
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from app.core import kline_store
+from app.core.database import init_db, AsyncSessionLocal
+from app.core.kline_store import ColumnarKLineStore
+from app.crawler.checkpoint import CrawlLedger
+from app.crawler.ingest import IngestBuffer, ENTRY_BYTES
+from app.models import Stock, KLineData, CrawlRunItem
+
+
+def stock_data(code, bars=3, bad=False):
+    start = datetime(2024, 1, 2)
+    klines = [
+        {'date': start + timedelta(days=i), 'resolution': "1d", 'open': 1.0, 'close': 1.0,
+         'high': 1.0, 'low': 1.0, 'volume': 1.0, 'turnover': 1.0}
+        for i in range(bars)
+    ]
+    if bad:
+        # 数据库驱动无法绑定的值,使整批事务失败
+        klines[-1]['volume'] = object()
+    return {'code': code, 'name': code, 'market': 'SH', 'klines': klines, 'financial': None}
+
+
+async def kline_count(code):
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(
+            select(func.count(KLineData.id)).join(Stock, Stock.id == KLineData.stock_id).where(Stock.code == code)
+        )).scalar()
+
+
+def test_failed_batch_falls_back_to_per_entry_commits():
+    async def run():
+        await init_db()
+        buffer = IngestBuffer(max_batch=10, max_delay=0.05)
+        items = [stock_data("620000"), stock_data("620001", bad=True), stock_data("620002")]
+
+        failed = await buffer.save_many(items)
+        await buffer.stop()
+
+        assert failed == ["620001"]
+        # 三个条目在同一批中,整批失败后逐条重试: 其余股票完整写入,失败的股票一行也不写入
+        assert buffer.commits == 1
+        assert buffer.failed == 1
+        assert await kline_count("620000") == 3
+        assert await kline_count("620002") == 3
+        async with AsyncSessionLocal() as session:
+            assert (await session.execute(select(Stock.id).where(Stock.code == "620001"))).first() is None
+
+    asyncio.run(run())
+
+
+def test_failed_batch_leaves_no_columnar_files(tmp_path, monkeypatch):
+    async def run():
+        await init_db()
+        store = ColumnarKLineStore(str(tmp_path))
+        monkeypatch.setattr(kline_store, "_store", store)
+        buffer = IngestBuffer(max_batch=10, max_delay=0.05)
+        # 两支新股票在同一批中,第二支的财务数据无法写入,整批回滚后逐条重试
+        bad = stock_data("660001")
+        bad['financial'] = {'pe_ratio': object()}
+        failed = await buffer.save_many([stock_data("660000"), bad])
+        # 回滚释放的ID会分配给下一支新股票,它不能继承失败股票的K线文件
+        await buffer.save(stock_data("660002", bars=1))
+        await buffer.stop()
+
+        assert failed == ["660001"]
+        async with AsyncSessionLocal() as session:
+            ids = dict((await session.execute(
+                select(Stock.code, Stock.id).where(Stock.code.in_(["660000", "660001", "660002"]))
+            )).all())
+        assert set(ids) == {"660000", "660002"}
+        assert sorted(os.listdir(tmp_path / "1d")) == sorted(str(stock_id) for stock_id in ids.values())
+        assert len(await store.read(ids["660000"], "1d")) == 3
+        assert len(await store.read(ids["660002"], "1d")) == 1
+
+    asyncio.run(run())
+
+
+def test_ledger_marks_commit_with_stock_data():
+    async def run():
+        await init_db()
+        ledger = CrawlLedger("ingest-ledger")
+        await ledger.start({})
+        await ledger.register_stocks([{'code': "670000"}, {'code': "670001"}])
+        buffer = IngestBuffer(max_batch=10, max_delay=0.05)
+
+        failed = await buffer.save_many([stock_data("670000"), stock_data("670001", bad=True)], ledger)
+        await buffer.mark(ledger, failed, "failed", "保存数据失败")
+        await buffer.stop()
+
+        async with AsyncSessionLocal() as session:
+            statuses = dict((await session.execute(
+                select(CrawlRunItem.code, CrawlRunItem.status).where(CrawlRunItem.run_id == ledger.run_id)
+            )).all())
+        # 失败股票的completed记录随数据一起回滚
+        assert statuses == {"670000": "completed", "670001": "failed"}
+        assert buffer.commits == 2
+
+    asyncio.run(run())
+
+
+def test_entries_are_batched():
+    async def run():
+        await init_db()
+        buffer = IngestBuffer(max_batch=4, max_delay=0.05)
+        futures = [await buffer.submit_stock(stock_data(f"63000{i}", bars=1)) for i in range(8)]
+        await asyncio.gather(*futures)
+        await buffer.stop()
+        assert buffer.commits == 2
+        assert buffer.status()["buffered_bytes"] == 0
+
+    asyncio.run(run())
+
+
+def test_producers_wait_when_buffer_is_full():
+    async def run():
+        await init_db()
+        # 上限只能容纳一个条目: 第二个条目要等第一个提交后才能入队
+        buffer = IngestBuffer(max_batch=10, max_delay=0, max_buffered_mb=ENTRY_BYTES * 1.5 / 2 ** 20)
+        peak = 0
+
+        async def watch():
+            nonlocal peak
+            while True:
+                peak = max(peak, buffer.buffered_bytes)
+                await asyncio.sleep(0)
+
+        watcher = asyncio.ensure_future(watch())
+        failed = await buffer.save_many([stock_data(f"64000{i}", bars=0) for i in range(3)])
+        watcher.cancel()
+        await buffer.stop()
+
+        assert failed == []
+        assert peak == ENTRY_BYTES
+        assert buffer.commits == 3
+
+    asyncio.run(run())
+
+
+def test_stop_drains_queue_and_rejects_new_entries():
+    async def run():
+        await init_db()
+        buffer = IngestBuffer(max_batch=10, max_delay=10)
+        future = await buffer.submit_stock(stock_data("650000"))
+        # max_delay很长,stop不等凑批,立即写完剩余条目
+        await asyncio.wait_for(buffer.stop(), 5)
+        assert future.result() is True
+        assert await kline_count("650000") == 3
+        try:
+            await buffer.submit_stock(stock_data("650001"))
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("停止后仍接受新条目")
+
+    asyncio.run(run())
@@ -0,0 +1,76 @@
+"""
+盘中轮询测试
+"""
+import asyncio
+from datetime import datetime
+
+from app.crawler.intraday import IntradayPoller, bars_needed, has_gap, previous_trading_day
+
+# 2024-06-03是周一
+MONDAY = datetime(2024, 6, 3, 10, 0)
+
+
+def test_bars_needed_same_day():
+    assert bars_needed(datetime(2024, 6, 3, 9, 55), MONDAY) == 6
+    assert bars_needed(None, MONDAY) == 30
+
+
+def test_bars_needed_previous_session():
+    # 上周五收盘前10分钟的K线: 补齐周五剩余的10根、今天的30根,再加最后一根已存K线
+    assert bars_needed(datetime(2024, 5, 31, 14, 50), MONDAY) == 41
+
+
+def test_previous_trading_day_skips_weekend():
+    assert previous_trading_day(MONDAY.date()) == datetime(2024, 5, 31).date()
+    assert previous_trading_day(datetime(2024, 6, 4).date()) == MONDAY.date()
+
+
+def test_gap_detection():
+    assert not has_gap(None, MONDAY)
+    assert not has_gap(datetime(2024, 6, 3, 9, 31), MONDAY)
+    assert not has_gap(datetime(2024, 5, 31, 15, 0), MONDAY)
+    assert has_gap(datetime(2024, 5, 30, 15, 0), MONDAY)
+    assert has_gap(datetime(2024, 5, 24, 15, 0), MONDAY)
+
+
+class FakeCrawler:
+    """记录fetch_kline_lines调用参数,返回固定的K线"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.calls = []
+
+    async def fetch_kline_lines(self, code, market, resolution="1d", since=None, limit=None, until=None):
+        self.calls.append({"since": since, "limit": limit})
+        return self.lines
+
+
+def test_poll_uses_range_fetch_across_multi_day_gap():
+    lines = [
+        "2024-05-29 15:00,10.0,10.0,10.0,10.0,1,1",
+        "2024-05-30 09:31,10.0,10.1,10.2,9.9,1,1",
+        "2024-05-31 15:00,10.1,10.2,10.3,10.0,1,1",
+        "2024-06-03 09:31,10.2,10.3,10.4,10.1,1,1",
+    ]
+    poller = IntradayPoller(codes=["600000"])
+    poller.crawler = FakeCrawler(lines)
+    last_bar = datetime(2024, 5, 29, 15, 0)
+    poller.last_bars = {"600000": last_bar}
+
+    rows = asyncio.run(poller._poll_stock("600000", MONDAY))
+
+    assert poller.crawler.calls == [{"since": last_bar, "limit": None}]
+    # 中间的5月30日、31日没有被跳过
+    assert [row['date'].date().isoformat() for row in rows] == [
+        "2024-05-29", "2024-05-30", "2024-05-31", "2024-06-03"
+    ]
+
+
+def test_poll_uses_limit_within_previous_session():
+    poller = IntradayPoller(codes=["600000"])
+    poller.crawler = FakeCrawler([])
+    poller.last_bars = {"600000": datetime(2024, 6, 3, 9, 55)}
+
+    asyncio.run(poller._poll_stock("600000", MONDAY))
+
+    assert poller.crawler.calls == [{"since": None, "limit": 6}]
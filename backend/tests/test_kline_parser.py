@@ -0,0 +1,45 @@
+"""
+K线解析测试
+"""
+from datetime import datetime
+
+from app.crawler.kline_parser import parse_klines, parse_kline_rows
+
+
+def test_parses_daily_rows():
+    rows = parse_kline_rows(["2024-06-03,10.0,10.5,10.8,9.9,12345,1.2e5"], "1d")
+    assert rows == [{
+        'date': datetime(2024, 6, 3), 'open': 10.0, 'close': 10.5, 'high': 10.8, 'low': 9.9,
+        'volume': 12345.0, 'turnover': 120000.0, 'resolution': "1d"
+    }]
+
+
+def test_drops_suspended_rows():
+    columns = parse_klines([
+        "2024-06-03,10.0,10.5,10.8,9.9,100,1000",
+        "2024-06-04,-,-,-,-,0,0",
+        "2024-06-05,10.5,10.6,10.9,10.1,200,2000",
+    ], "1d")
+    assert columns.invalid_rows.tolist() == [1]
+    assert columns.close.tolist() == [10.5, 10.6]
+
+
+def test_scientific_notation_next_to_invalid_rows():
+    # 含非法行时走码点校验路径,科学计数法仍应与float()一致
+    columns = parse_klines([
+        "2024-06-03,10.0,10.5,10.8,9.9,1e3,2.5E+8",
+        "2024-06-04,-,-,-,-,0,0",
+        "2024-06-05,1.05e1,10.6,10.9,10.1,200,abc",
+    ], "1d")
+    assert columns.invalid_rows.tolist() == [1, 2]
+    assert columns.volume.tolist() == [1000.0]
+    assert columns.turnover.tolist() == [2.5e8]
+
+
+def test_minute_rows_and_since():
+    lines = [
+        "2024-06-03 09:31,10.0,10.1,10.2,9.9,100,1000",
+        "2024-06-03 09:32,10.1,10.2,10.3,10.0,100,1000",
+    ]
+    rows = parse_kline_rows(lines, "1m", since=datetime(2024, 6, 3, 9, 32))
+    assert [row['date'] for row in rows] == [datetime(2024, 6, 3, 9, 32)]
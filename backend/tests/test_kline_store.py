@@ -0,0 +1,71 @@
+"""
+列式K线存储测试
+"""
+import os
+import asyncio
+from datetime import datetime, timedelta
+
+from app.core.kline_store import ColumnarKLineStore
+
+
+def bar(date, close, resolution="1d", volume=100.0):
+    return {'date': date, 'open': close - 0.1, 'close': close, 'high': close + 0.2, 'low': close - 0.2,
+            'volume': volume, 'turnover': volume * close, 'resolution': resolution}
+
+
+def test_write_and_read_across_partitions(tmp_path):
+    async def run():
+        store = ColumnarKLineStore(str(tmp_path))
+        # 跨年的日K写入两个分区
+        klines = [bar(datetime(2023, 12, 28) + timedelta(days=i), 10.0 + i) for i in range(6)]
+        assert await store.write(None, 1, klines) == 6
+        assert sorted(os.listdir(tmp_path / "1d" / "1")) == ["2023.npy", "2024.npy"]
+
+        rows = await store.read(1, "1d")
+        assert [row['date'] for row in rows] == [kline['date'] for kline in klines]
+        assert rows[0] == {key: value for key, value in klines[0].items() if key != 'resolution'}
+
+        rows = await store.read(1, "1d", start=datetime(2023, 12, 30), end=datetime(2024, 1, 1))
+        assert [row['close'] for row in rows] == [12.0, 13.0, 14.0]
+
+        rows = await store.read(1, "1d", descending=True, limit=4)
+        assert [row['close'] for row in rows] == [15.0, 14.0, 13.0, 12.0]
+
+        rows = await store.read_rows(1, "1d", limit=2)
+        assert rows[1] == (datetime(2023, 12, 29), 10.9, 11.0, 11.2, 10.8, 100.0, 1100.0)
+
+        assert await store.read(2, "1d") == []
+
+    asyncio.run(run())
+
+
+def test_overwrite_replaces_bars_with_same_time(tmp_path):
+    async def run():
+        store = ColumnarKLineStore(str(tmp_path))
+        start = datetime(2024, 6, 3, 9, 31)
+        await store.write(None, 1, [bar(start + timedelta(minutes=i), 10.0, "1m") for i in range(3)])
+        # 形成中的最后一根K线被更新,并追加新K线;同一批中重复的时间以后出现的为准
+        await store.write(None, 1, [
+            bar(start + timedelta(minutes=2), 11.0, "1m", volume=50),
+            bar(start + timedelta(minutes=2), 12.0, "1m", volume=80),
+            bar(start + timedelta(minutes=3), 13.0, "1m"),
+        ])
+
+        rows = await store.read(1, "1m")
+        assert [row['close'] for row in rows] == [10.0, 10.0, 12.0, 13.0]
+        assert rows[2]['volume'] == 80.0
+        assert (await store.last_dates(1)) == {"1m": start + timedelta(minutes=3)}
+
+    asyncio.run(run())
+
+
+def test_missing_values_round_trip_as_none(tmp_path):
+    async def run():
+        store = ColumnarKLineStore(str(tmp_path))
+        kline = bar(datetime(2024, 1, 2), 10.0)
+        kline['turnover'] = None
+        await store.write(None, 1, [kline])
+        rows = await store.read(1, "1d")
+        assert rows[0]['turnover'] is None
+
+    asyncio.run(run())
@@ -0,0 +1,136 @@
+"""
+熔断器测试
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+
+from app.crawler.base import BaseCrawler
+from app.crawler.resilience import CircuitBreaker, get_breaker
+
+
+async def wait_blocked(coro, timeout: float = 0.1) -> bool:
+    """coro在timeout内没有完成时返回True"""
+    task = asyncio.ensure_future(coro)
+    await asyncio.sleep(timeout)
+    blocked = not task.done()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return blocked
+
+
+def test_opens_after_threshold_and_recovers_through_probe():
+    async def run():
+        breaker = CircuitBreaker("host", failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert await wait_blocked(breaker.before_request(), 0.01)
+
+        await asyncio.sleep(0.06)
+        await breaker.before_request()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        # 探测请求进行中,其他请求等待
+        assert await wait_blocked(breaker.before_request())
+
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        await asyncio.wait_for(breaker.before_request(), 0.1)
+
+    asyncio.run(run())
+
+
+def test_failed_probe_reopens():
+    async def run():
+        breaker = CircuitBreaker("host", failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        await asyncio.sleep(0.06)
+        await breaker.before_request()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.trips == 2
+
+    asyncio.run(run())
+
+
+def test_abort_probe_only_releases_own_probe():
+    async def run():
+        breaker = CircuitBreaker("host", failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        probe = asyncio.ensure_future(breaker.before_request())
+        await probe
+        # 其他任务取消不影响当前探测,后续请求仍等待探测结果
+        breaker.abort_probe()
+        assert await wait_blocked(breaker.before_request())
+
+    asyncio.run(run())
+
+
+@asynccontextmanager
+async def slow_server():
+    """本地服务器: /slow响应前等待1秒,/missing返回404"""
+    async def handle(request):
+        await asyncio.sleep(1)
+        return web.json_response({})
+
+    async def missing(request):
+        return web.json_response({}, status=404)
+
+    app = web.Application()
+    app.router.add_get("/slow", handle)
+    app.router.add_get("/missing", missing)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        await runner.cleanup()
+
+
+def test_cancelled_probe_releases_breaker(breakers):
+    async def run():
+        async with slow_server() as base_url:
+            # 单主机只有一个请求名额: 被取消的探测没有归还名额或探测名额时,下一个请求会一直等待
+            crawler = BaseCrawler(use_cache=False, per_host_limit=1, per_host_rate=0)
+            breaker = get_breaker(base_url.split("//", 1)[1])
+            breaker.failure_threshold = 1
+            breaker.reset_timeout = 0
+            breaker.record_failure()
+
+            probe = asyncio.ensure_future(crawler.make_request(f"{base_url}/slow"))
+            await asyncio.sleep(0.1)
+            assert breaker.snapshot()["state"] == CircuitBreaker.HALF_OPEN
+            probe.cancel()
+            await asyncio.gather(probe, return_exceptions=True)
+
+            assert await asyncio.wait_for(crawler.make_request(f"{base_url}/slow"), 3) == {}
+            assert breaker.snapshot()["state"] == CircuitBreaker.CLOSED
+        await BaseCrawler.shutdown()
+
+    asyncio.run(run())
+
+
+def test_client_error_does_not_close_half_open_breaker(breakers):
+    async def run():
+        async with slow_server() as base_url:
+            crawler = BaseCrawler(use_cache=False, per_host_rate=0)
+            breaker = get_breaker(base_url.split("//", 1)[1])
+            breaker.failure_threshold = 2
+            breaker.reset_timeout = 0
+            breaker.record_failure()
+            breaker.record_failure()
+
+            # 404作为探测请求的结果,不能证明主机已恢复
+            assert await crawler.make_request(f"{base_url}/missing") is None
+            assert breaker.snapshot()["state"] == CircuitBreaker.HALF_OPEN
+            assert breaker.snapshot()["failures"] == 2
+            # 探测名额已释放,下一个请求可以继续探测
+            await asyncio.wait_for(breaker.before_request(), 1)
+        await BaseCrawler.shutdown()
+
+    asyncio.run(run())
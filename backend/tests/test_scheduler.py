@@ -0,0 +1,112 @@
+"""
+爬取调度器测试
+"""
+import asyncio
+
+from aiohttp import web
+
+from app.core.database import init_db
+from app.crawler.base import BaseCrawler
+from app.crawler.data_processor import DataProcessor
+from app.crawler.scheduler import CrawlScheduler, RequestBudget
+
+
+class BlockingCrawler:
+    """process_stock一直等待到release被设置,模拟正在刷新的股票"""
+
+    def __init__(self):
+        self.failed_stocks = []
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.codes = []
+
+    async def process_stock(self, stock, resolution=None):
+        self.codes.append(stock['code'])
+        self.started.set()
+        await self.release.wait()
+
+
+def queued_codes(scheduler):
+    return {item["code"] for item in scheduler.status(top=10 ** 6)["next"]}
+
+
+def test_rebuild_skips_stocks_being_refreshed():
+    async def run():
+        await init_db()
+        await DataProcessor.save_stock_list([
+            {'code': code, 'name': code, 'market': 'SH'} for code in ("610000", "610001")
+        ])
+        scheduler = CrawlScheduler(workers=1)
+        # 刚登记的股票没有updated_at,都视为陈旧
+        await scheduler.rebuild()
+        assert {"610000", "610001"} <= queued_codes(scheduler)
+
+        crawler = scheduler.crawler = BlockingCrawler()
+        scheduler.start()
+        try:
+            await asyncio.wait_for(crawler.started.wait(), 5)
+            refreshing = crawler.codes[0]
+            await scheduler.rebuild()
+            assert scheduler.status()["in_flight"] == 1
+            assert refreshing not in queued_codes(scheduler)
+            assert {"610000", "610001"} - {refreshing} <= queued_codes(scheduler)
+        finally:
+            crawler.release.set()
+            await scheduler.stop()
+
+    asyncio.run(run())
+
+
+def test_budget_waiters_queue_by_deficit():
+    async def run():
+        budget = RequestBudget(600)  # 每秒10个请求
+        await budget.acquire(600)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        # 两个等待者各自按欠额等待: 第一个约0.1秒,第二个约0.2秒
+        first = asyncio.ensure_future(budget.acquire(1))
+        second = asyncio.ensure_future(budget.acquire(1))
+        await first
+        assert loop.time() - start < 0.18
+        await second
+        assert loop.time() - start >= 0.18
+        assert budget.spent == 602
+
+        # 等待期间被取消的请求归还名额
+        waiter = asyncio.ensure_future(budget.acquire(5))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert budget.spent == 602
+
+    asyncio.run(run())
+
+
+def test_retries_are_charged_to_budget(breakers):
+    async def run():
+        calls = []
+
+        async def flaky(request):
+            calls.append(request)
+            return web.json_response({}, status=503 if len(calls) == 1 else 200)
+
+        app = web.Application()
+        app.router.add_get("/flaky", flaky)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            crawler = BaseCrawler(use_cache=False, per_host_rate=0)
+            crawler.backoff_base = 0.01
+            crawler.request_budget = RequestBudget(600)
+            assert await crawler.make_request(f"http://127.0.0.1:{port}/flaky") == {}
+            assert len(calls) == 2
+            # 首次请求由调度器按股票预先扣除,这里只扣除了一次重试
+            assert crawler.request_budget.spent == 1
+        finally:
+            await runner.cleanup()
+            await BaseCrawler.shutdown()
+
+    asyncio.run(run())
@@ -0,0 +1,53 @@
+"""
+多进程分片爬取测试
+"""
+import os
+import asyncio
+
+import pytest
+
+from app.crawler import sharded
+from app.crawler.sharded import ShardedCrawl
+from app.crawler.stock_crawler import StockCrawler
+
+
+def fake_shard(shard, stocks, resolution, options, messages):
+    """模拟工作进程: 分片0乱序完成部分股票后崩溃,分片1正常结束"""
+    codes = [stock['code'] for stock in stocks]
+    if shard == 0:
+        # 并发处理时后面的股票可能先完成
+        messages.put(("progress", shard, [codes[2], codes[0]], [codes[3]]))
+        # 等待已上报的消息写入管道后再异常退出
+        messages.close()
+        messages.join_thread()
+        os._exit(1)
+    messages.put(("progress", shard, codes[:-1], []))
+    messages.put(("progress", shard, [], codes[-1:]))
+    messages.put(("done", shard, None, None))
+
+
+def make_stocks(count):
+    return [{'code': f"{600000 + i:06d}", 'name': str(i), 'market': 'SH'} for i in range(count)]
+
+
+def test_crashed_shard_only_fails_unreported_codes(monkeypatch):
+    monkeypatch.setattr(sharded, "_run_shard", fake_shard)
+    stocks = make_stocks(10)
+    crawler = StockCrawler(use_cache=False)
+    crawler.total_stocks = len(stocks)
+
+    asyncio.run(ShardedCrawl(crawler, processes=2, worker_mode="concurrent").run(stocks))
+
+    # 分片0为600000、600002、600004、600006、600008,其中600004、600000已上报完成,
+    # 600006上报失败,600002、600008未上报;分片1的600009上报失败
+    assert sorted(crawler.failed_stocks) == ["600002", "600006", "600008", "600009"]
+    assert crawler.processed_stocks == 2 + 4
+
+
+def test_rejects_unknown_worker_mode():
+    crawler = StockCrawler(use_cache=False)
+    with pytest.raises(ValueError):
+        ShardedCrawl(crawler, worker_mode="sharded")
+    with pytest.raises(ValueError):
+        ShardedCrawl(crawler, worker_mode="pipline")
+    assert ShardedCrawl(crawler, worker_mode="pipeline").worker_mode == "pipeline"